@@ -1,5 +1,8 @@
 import abc
-from typing import Any
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from store.rollup import RollupStore
 
 
 class Analyzer:
@@ -17,3 +20,73 @@ class Analyzer:
         """Dump the full analysis result after all data are completely analyzed.
         """
         pass
+
+    def getFieldPaths(self) -> tuple[str, ...]:
+        """Get the dot separated paths of the fields this analyzer reads from records.
+
+        When non empty, each record is reduced by the fetcher to a tuple of the values
+        at these paths, None when missing, before being handed to analyze.
+
+        Returns:
+            tuple[str, ...]: Field paths, empty to receive the records as fetched.
+        """
+        return ()
+
+    async def analyzeBatch(self, batch: list[Any]) -> None:
+        """Analyze a batch of records fetched.
+
+        Subclasses should override this with a tight loop when per-record await
+        overhead matters.
+
+        Args:
+            batch (list[Any]): Records retrieved in one queue hand-off.
+        """
+        for data in batch:
+            await self.analyze(data)
+
+    def getConfig(self) -> dict[str, Any]:
+        """Get the settings shaping the analysis state, e.g. to tell journaled states
+        of differently configured analyzers apart.
+
+        Returns:
+            dict[str, Any]: Json serializable settings, empty by default.
+        """
+        return {}
+
+    def newPartial(self) -> "Analyzer":
+        """Create an analyzer with the same configuration and empty state.
+
+        Partial analyzers analyze a shard of the data; their states are combined
+        back with mergeState.
+
+        Returns:
+            Analyzer: The empty analyzer.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support partial states")
+
+    def getState(self) -> dict[str, Any]:
+        """Get the analysis state accumulated so far.
+
+        Returns:
+            dict[str, Any]: Json serializable state.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support partial states")
+
+    def mergeState(self, state: dict[str, Any]) -> None:
+        """Merge a state from getState of another analyzer of the same type into this one.
+
+        Args:
+            state (dict[str, Any]): State to merge.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support partial states")
+
+    def writeRollups(self, store: "RollupStore", add: bool = False) -> None:
+        """Write the analysis result as per time bucket rollups, replacing the buckets
+        analyzed.
+
+        Args:
+            store (RollupStore): Store to write to.
+            add (bool, optional): Add to the stored buckets instead, for an analysis
+                of the next part of them. Defaults to False.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support rollups")
@@ -1,36 +1,116 @@
-import csv
-import json
 import logging
-from typing import Union
+from array import array
+from operator import itemgetter
+from typing import TYPE_CHECKING, Iterator, Optional, Sequence, Union
 
 from analyzer.analyzer import Analyzer
+from analyzer.signature import SignatureExtractor
+from utils.sinks import getSink, writeAll
+from utils.spill import SpillingCounter
 from fetcher.body_error import BodyError
 from fetcher.daily_totals import DailyTotal
 
+if TYPE_CHECKING:
+    from store.rollup import RollupStore
+
 
 class BodyErrorAnalyzer(Analyzer):
+    INITIAL_DATE_CAPACITY = 64  # date columns of the count matrix, doubled as needed
+    ROLLUP_GRANULARITY = "day"  # the only one, errors are counted per date
+    RANK_DIGITS = 10  # zero padding of ranks in spilled keys, so they sort as numbers
+
     def __init__(
         self,
         logger: logging.Logger,
         csvErrorsOutputFile: str,
         csvErrDateCntsOutputFile: str,
         csvErrDatePercentageOutputFile: str,
+        signatureExtractor: Optional[SignatureExtractor] = None,
+        spillBytes: int = 0,
+        spillDir: Optional[str] = None,
+        rollupGranularity: str = ROLLUP_GRANULARITY,
     ) -> None:
+        """Count errors per day and relative to the daily submit totals.
+
+        Args:
+            signatureExtractor (Optional[SignatureExtractor], optional): Reduces error
+                messages to the error they are counted as. Defaults to one without
+                masks, keeping the message up to its first ":".
+            spillBytes (int, optional): Memory budget of the error x date counts, past
+                which they are counted per (error, date) key and spill to sorted runs
+                on disk, merged on dumpResult. Defaults to 0, counting in a matrix in
+                memory.
+            spillDir (Optional[str], optional): Directory of the spilled runs.
+                Defaults to the system temporary directory.
+            rollupGranularity (str, optional): Granularity of the rollups, see
+                writeRollups.  Only "day" is accepted, as errors are counted per date
+                without their times. Defaults to "day".
+        """
+        if rollupGranularity != self.ROLLUP_GRANULARITY:
+            raise Exception(
+                f"rollupGranularity {rollupGranularity} is not supported, "
+                "errors are counted per date only"
+            )
         self.logger = logger
         self.csvErrorsOutputFile = csvErrorsOutputFile
         self.csvErrDateCntsOutputFile = csvErrDateCntsOutputFile
         self.csvErrDatePercentageOutputFile = csvErrDatePercentageOutputFile
-        self.errors = {}
-        # holds error type daily counts. {"error1": {"2023-09-08": 10, "2023-09-09": 13}, }
-        self.ErrDateCnts = {}
-        #  holds all the unique error dates
-        self.errorDates = set()
-        # holds daily totals for all errors. {"2023-09-08": 100, "2023-09-09": 200}
-        self.DateTotals = {}
+        self.signatureExtractor = signatureExtractor or SignatureExtractor()
+        # error signatures and dates are interned to ids, in order of appearance
+        self.errorIds = {}
+        self.errorNames = []
+        self.dateIds = {}
+        self.dateNames = []
+        # total count per error id
+        self.errorCnts = array("q")
+        # total count per date id
+        self.dateCnts = array("q")
+        # error x date count matrix, row major with dateCapacity columns per row
+        self.dateCapacity = self.INITIAL_DATE_CAPACITY
+        self.counts = array("q")
+        # error x date counts keyed by "errorId,dateId" instead, if spilling
+        self.spillBytes = spillBytes
+        self.spillDir = spillDir
+        self.rollupGranularity = rollupGranularity
+        self.spilledCounts = None
+        if spillBytes:
+            self.spilledCounts = SpillingCounter(spillBytes, spillDir)
         # holds daily submit totals
         self.DateSumbitTotals = {}
 
+    @property
+    def errors(self) -> dict[str, int]:
+        """Error counts. {"error1": 10, "error2": 13}"""
+        return dict(zip(self.errorNames, self.errorCnts))
+
+    @property
+    def ErrDateCnts(self) -> dict[str, dict[str, int]]:
+        """Error type daily counts. {"error1": {"2023-09-08": 10, "2023-09-09": 13}, }"""
+        errDateCnts = {}
+        for errorId, row in self._iterRows(range(len(self.errorNames))):
+            errDateCnts[self.errorNames[errorId]] = {
+                self.dateNames[dateId]: cnt for dateId, cnt in enumerate(row) if cnt
+            }
+        return errDateCnts
+
+    @property
+    def errorDates(self) -> set[str]:
+        """All the unique error dates."""
+        return set(self.dateNames)
+
+    @property
+    def DateTotals(self) -> dict[str, int]:
+        """Daily totals for all errors. {"2023-09-08": 100, "2023-09-09": 200}"""
+        return dict(zip(self.dateNames, self.dateCnts))
+
     async def analyze(self, data: Union[BodyError, DailyTotal]):
+        self.analyzeRecord(data)
+
+    async def analyzeBatch(self, batch: list[Union[BodyError, DailyTotal]]) -> None:
+        for data in batch:
+            self.analyzeRecord(data)
+
+    def analyzeRecord(self, data: Union[BodyError, DailyTotal]) -> None:
         if not data:
             return
         if isinstance(data, BodyError):
@@ -47,24 +127,165 @@ class BodyErrorAnalyzer(Analyzer):
         else:
             raise Exception("invalid data type")
 
-    def putError(self, dateStr: str, error: str) -> None:
+    def putError(self, dateStr: str, error: str, cnt: int = 1) -> None:
         # There are 2 types of error: Error or error.  We group them here
-        if error.lower() == "error":
+        if len(error) == 5 and error.lower() == "error":
             error = "error"
-        cnt = self.errors.get(error, 0)
-        self.errors[error] = cnt + 1
+        errorId = self.errorIds.get(error)
+        if errorId is None:
+            errorId = self._internError(error)
+        dateId = self.dateIds.get(dateStr)
+        if dateId is None:
+            dateId = self._internDate(dateStr)
+        if self.spilledCounts is None:
+            self.counts[errorId * self.dateCapacity + dateId] += cnt
+        else:
+            self.spilledCounts.add(f"{errorId},{dateId}", cnt)
+        self.errorCnts[errorId] += cnt
+        self.dateCnts[dateId] += cnt
+
+    def _internError(self, error: str) -> int:
+        errorId = len(self.errorNames)
+        self.errorIds[error] = errorId
+        self.errorNames.append(error)
+        self.errorCnts.append(0)
+        if self.spilledCounts is None:
+            self.counts.frombytes(bytes(8 * self.dateCapacity))
+        return errorId
+
+    def _internDate(self, dateStr: str) -> int:
+        dateId = len(self.dateNames)
+        if dateId == self.dateCapacity and self.spilledCounts is None:
+            # double the matrix columns, copying each row over
+            oldCapacity = self.dateCapacity
+            self.dateCapacity *= 2
+            counts = array("q", bytes(8 * self.dateCapacity * len(self.errorNames)))
+            for errorId in range(len(self.errorNames)):
+                start = errorId * self.dateCapacity
+                counts[start : start + oldCapacity] = self._getRow(errorId, oldCapacity)
+            self.counts = counts
+        self.dateIds[dateStr] = dateId
+        self.dateNames.append(dateStr)
+        self.dateCnts.append(0)
+        return dateId
 
-        # update error daily count
-        self.errorDates.add(dateStr)
-        dateErrCnts = self.ErrDateCnts.get(error, {})
-        dateErrCnt = dateErrCnts.get(dateStr, 0)
-        dateErrCnts[dateStr] = dateErrCnt + 1
-        self.ErrDateCnts[error] = dateErrCnts
+    def _getRow(self, errorId: int, dateCapacity: int = 0) -> array:
+        """Get the date counts of an error, indexed by date id.
+        """
+        start = errorId * (dateCapacity or self.dateCapacity)
+        return self.counts[start : start + (dateCapacity or len(self.dateNames))]
+
+    def _rankCounts(self, errorIds: Sequence[int]) -> SpillingCounter:
+        """Regroup the spilled counts into a single partition counter keyed by the
+        rank of their error in errorIds, under the same budget and flushed, whose
+        merged runs then stream in rank order.
+        """
+        ranks = {errorId: rank for rank, errorId in enumerate(errorIds)}
+        rankedCounts = SpillingCounter(self.spillBytes, self.spillDir, partitions=1)
+        for key, cnt in self.spilledCounts.items():
+            errorId, dateId = key.split(",")
+            rank = ranks.get(int(errorId))
+            if rank is not None:
+                rankedCounts.add(f"{rank:0{self.RANK_DIGITS}},{dateId}", cnt)
+        rankedCounts.flush()
+        return rankedCounts
+
+    def _iterRows(
+        self, errorIds: Sequence[int], rankedCounts: Optional[SpillingCounter] = None
+    ) -> Iterator[tuple[int, Sequence[int]]]:
+        """Yield each of errorIds in order with its date counts, indexed by date id.
+
+        Args:
+            errorIds (Sequence[int]): Errors in the order to yield them.
+            rankedCounts (Optional[SpillingCounter], optional): Spilled counts ranked
+                by errorIds, see _rankCounts, to read again rather than regroup.
+                Defaults to None, regrouping them.
+        """
+        if self.spilledCounts is None:
+            for errorId in errorIds:
+                yield errorId, self._getRow(errorId)
+            return
+        if rankedCounts is None:
+            rankedCounts = self._rankCounts(errorIds)
+        rank = 0
+        row = [0] * len(self.dateNames)
+        for key, cnt in rankedCounts.items():
+            keyRank, dateId = map(int, key.split(","))
+            while rank < keyRank:
+                yield errorIds[rank], row
+                rank += 1
+                row = [0] * len(self.dateNames)
+            row[dateId] = cnt
+        for rank in range(rank, len(errorIds)):
+            yield errorIds[rank], row
+            row = [0] * len(self.dateNames)
 
-        # update error daily total
-        dateTotal = self.DateTotals.get(dateStr, 0)
-        dateTotal = dateTotal + 1
-        self.DateTotals[dateStr] = dateTotal
+    def getConfig(self) -> dict:
+        return {
+            "masks": list(self.signatureExtractor.masks),
+            "patterns": [list(p) for p in self.signatureExtractor.patterns],
+        }
+
+    def newPartial(self) -> "BodyErrorAnalyzer":
+        return BodyErrorAnalyzer(
+            self.logger,
+            self.csvErrorsOutputFile,
+            self.csvErrDateCntsOutputFile,
+            self.csvErrDatePercentageOutputFile,
+            self.signatureExtractor,
+            self.spillBytes,
+            self.spillDir,
+            self.rollupGranularity,
+        )
+
+    def getState(self) -> dict:
+        return {
+            "errors": self.errors,
+            "errDateCnts": self.ErrDateCnts,
+            "errorDates": sorted(self.errorDates),
+            "dateTotals": self.DateTotals,
+            "dateSubmitTotals": self.DateSumbitTotals,
+        }
+
+    def mergeState(self, state: dict) -> None:
+        # error totals and date totals follow from the daily counts
+        for error, dateCnts in state["errDateCnts"].items():
+            for dateStr, cnt in dateCnts.items():
+                self.putError(dateStr, error, cnt)
+        for dateStr in state["errorDates"]:
+            if dateStr not in self.dateIds:
+                self._internDate(dateStr)
+        # submit totals are set, not counted, per date
+        self.DateSumbitTotals.update(state["dateSubmitTotals"])
+
+    def writeRollups(self, store: "RollupStore", add: bool = False) -> None:
+        """Write counts per error to dimension "error" and the submit totals to
+        dimension "submitted", the latter replaced even when adding, in buckets of
+        rollupGranularity, i.e. days.
+        """
+        name = type(self).__name__
+        store.putCounts(
+            name,
+            "error",
+            self.rollupGranularity,
+            (
+                (self.dateNames[dateId], self.errorNames[errorId], cnt)
+                for errorId, row in self._iterRows(range(len(self.errorNames)))
+                for dateId, cnt in enumerate(row)
+                if cnt and self.dateNames[dateId]
+            ),
+            add,
+        )
+        store.putCounts(
+            name,
+            "submitted",
+            self.rollupGranularity,
+            (
+                (dateStr, "", total)
+                for dateStr, total in self.DateSumbitTotals.items()
+                if dateStr
+            ),
+        )
 
     def getDate(self, dateStr: str) -> str:
         """Get date part from a date string in format of 2023-09-22T17:53:44.362Z
@@ -82,73 +303,118 @@ class BodyErrorAnalyzer(Analyzer):
         return strs[0]
 
     def normalize(self, error: str) -> str:
-        if not error:
-            return ""
-        error = error.strip('"')
-        strs = error.split(":")
-        return strs[0]
-
-    def _getPercent(self, dateCnts: tuple[str, int], dateTotals: {str: int}) -> float:
-        dateStr = dateCnts[0]
-        cnt = dateCnts[1]
-        dateTotal = dateTotals.get(dateStr, 0)
-        if cnt == 0 or dateTotal == 0:
-            return 0
-        return round(cnt / dateTotal, 2)
+        return self.signatureExtractor.extract(error)
 
     def dumpResult(self) -> None:
-        # errors is {"error1": cnt, "error2": cnt}
-        # sortedErrors is [["error1", cnt], ["error2", cnt]]
-        sortedErrors = sorted(self.errors.items(), key=lambda x: x[1], reverse=True)
-        fieldNames = ["error", "count"]
-        bodyErrorRows = [{"error": x[0], "count": x[1]} for x in sortedErrors]
-        # output error category and count
-        with open(self.csvErrorsOutputFile, "w") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldNames)
-            writer.writeheader()
-            writer.writerows(bodyErrorRows)
-
-        # process daily errors
-        # errorDates is set of dates
-        sortedErrorDates = list(sorted(self.errorDates))
-        errTypeFieldName = "error type/datetime"
-        fieldNames = [errTypeFieldName]
-        fieldNames.extend(sortedErrorDates)
-        dailyErrorRows = []
-        dailyErrorPercentageRows = []
-        for sortedErr in sortedErrors:
-            err = sortedErr[0]
-            dateCnts = self.ErrDateCnts.get(err, {})
-            # sort by date. output is [[date, cnt], [date, cnt]]
-            sortedDateCnts = sorted(dateCnts.items(), key=lambda x: x[0])
-            dailyErrsDict = {x[0]: x[1] for x in sortedDateCnts}
-            dailyErrsDict[errTypeFieldName] = err
-            dailyErrorRows.append(dailyErrsDict)
-
-            # daily error percentage to total submitted jobs
-            dailyErrsPercentDict = {
-                x[0]: self._getPercent(x, self.DateSumbitTotals) for x in sortedDateCnts
-            }
-            dailyErrsPercentDict[errTypeFieldName] = err
-            dailyErrorPercentageRows.append(dailyErrsPercentDict)
-
-        # dailyErrorRows is
-        # [ {"error type/datetime": error, "2023-09-08": 32, "2023-09-09": 101},]
-        self.logger.info(json.dumps(dailyErrorRows))
-        with open(self.csvErrDateCntsOutputFile, "w") as csvDailyfile:
-            writer = csv.DictWriter(csvDailyfile, fieldnames=fieldNames)
-            writer.writeheader()
-            writer.writerows(dailyErrorRows)
-
-        self.logger.info("date totals:")
+        # error ids by descending count, ties in order of appearance
+        sortedErrorIds = sorted(
+            range(len(self.errorNames)), key=self.errorCnts.__getitem__, reverse=True
+        )
+        # columns of the daily tables are the dates in order
+        sortedDateIds = sorted(
+            range(len(self.dateNames)), key=self.dateNames.__getitem__
+        )
+        sortedErrorDates = [self.dateNames[dateId] for dateId in sortedDateIds]
+        # spilled counts are regrouped once, then streamed by both daily tables
+        rankedCounts = None
+        if self.spilledCounts is not None:
+            rankedCounts = self._rankCounts(sortedErrorIds)
+        dailyFieldNames = ["error type/datetime"] + sortedErrorDates
+        rowCnts = writeAll(
+            [
+                (
+                    getSink(self.csvErrorsOutputFile),
+                    ["error", "count"],
+                    self._iterErrorRows(sortedErrorIds),
+                ),
+                (
+                    getSink(self.csvErrDateCntsOutputFile),
+                    dailyFieldNames,
+                    self._iterDailyRows(sortedErrorIds, sortedDateIds, rankedCounts),
+                ),
+                (
+                    getSink(self.csvErrDatePercentageOutputFile),
+                    dailyFieldNames,
+                    self._iterDailyPercentageRows(
+                        sortedErrorIds, sortedDateIds, rankedCounts
+                    ),
+                ),
+            ]
+        )
         self.logger.info(
-            json.dumps(sorted(self.DateTotals.items(), key=lambda x: x[0]))
+            f"{sum(self.errorCnts)} errors of {len(self.errorNames)} types over "
+            f"{len(self.dateNames)} dates"
         )
+        if sortedDateIds:
+            self.logger.info(
+                f"dates {sortedErrorDates[0]} to {sortedErrorDates[-1]}, most errors "
+                f"on {self.dateNames[max(sortedDateIds, key=self.dateCnts.__getitem__)]}"
+            )
+        if sortedErrorIds:
+            topErrorId = sortedErrorIds[0]
+            self.logger.info(
+                f"most frequent error: {self.errorNames[topErrorId]} "
+                f"({self.errorCnts[topErrorId]})"
+            )
+        for path, rowCnt in zip(
+            [
+                self.csvErrorsOutputFile,
+                self.csvErrDateCntsOutputFile,
+                self.csvErrDatePercentageOutputFile,
+            ],
+            rowCnts,
+        ):
+            self.logger.info(f"wrote {rowCnt} rows to {path}")
+
+    def _iterErrorRows(self, sortedErrorIds: list[int]) -> Iterator[tuple[str, int]]:
+        # [error, count] rows
+        for errorId in sortedErrorIds:
+            yield self.errorNames[errorId], self.errorCnts[errorId]
 
-        # dailyErrorPercentageRows is
-        # [ {"error type/datetime": error, "2023-09-08": 12.01, "2023-09-09": 10.02},]
-        self.logger.info(json.dumps(dailyErrorPercentageRows))
-        with open(self.csvErrDatePercentageOutputFile, "w") as csvDailyPercentagefile:
-            writer = csv.DictWriter(csvDailyPercentagefile, fieldnames=fieldNames)
-            writer.writeheader()
-            writer.writerows(dailyErrorPercentageRows)
+    def _iterSortedCnts(
+        self,
+        sortedErrorIds: list[int],
+        sortedDateIds: list[int],
+        rankedCounts: Optional[SpillingCounter],
+    ) -> Iterator[tuple[str, Sequence[int]]]:
+        """Yield each error with its counts in date order.
+        """
+        # with fewer than two dates the row is already in date order
+        getSortedCnts = itemgetter(*sortedDateIds) if len(sortedDateIds) > 1 else None
+        for errorId, row in self._iterRows(sortedErrorIds, rankedCounts):
+            yield (
+                self.errorNames[errorId],
+                getSortedCnts(row) if getSortedCnts else list(row),
+            )
+
+    def _iterDailyRows(
+        self,
+        sortedErrorIds: list[int],
+        sortedDateIds: list[int],
+        rankedCounts: Optional[SpillingCounter],
+    ) -> Iterator[list]:
+        # [error, count on date 1, count on date 2, ...] rows, dates without the
+        # error are left blank
+        for err, sortedCnts in self._iterSortedCnts(
+            sortedErrorIds, sortedDateIds, rankedCounts
+        ):
+            yield [err] + [cnt or "" for cnt in sortedCnts]
+
+    def _iterDailyPercentageRows(
+        self,
+        sortedErrorIds: list[int],
+        sortedDateIds: list[int],
+        rankedCounts: Optional[SpillingCounter],
+    ) -> Iterator[list]:
+        # daily error percentage to total submitted jobs
+        submitTotals = [
+            self.DateSumbitTotals.get(self.dateNames[dateId], 0)
+            for dateId in sortedDateIds
+        ]
+        for err, sortedCnts in self._iterSortedCnts(
+            sortedErrorIds, sortedDateIds, rankedCounts
+        ):
+            yield [err] + [
+                "" if not cnt else round(cnt / total, 2) if total else 0
+                for cnt, total in zip(sortedCnts, submitTotals)
+            ]
@@ -1,51 +1,386 @@
+import heapq
 import json
 import logging
-from typing import Any
+import math
+from datetime import datetime, timezone
+from operator import itemgetter
+from typing import TYPE_CHECKING, Optional
 
 from analyzer.analyzer import Analyzer
+from analyzer.sketches import HyperLogLog, SpaceSaving, hashValue
+from fetcher.projection import FieldProjector
+from fetcher.sampling import StratifiedSampler
+from store.buckets import getBucket
+from utils.spill import SpillingCounter
+
+if TYPE_CHECKING:
+    from store.rollup import RollupStore
 
 
 class SessionAnalyzer(Analyzer):
+    SID_PATH = "event.json.req.queryParams.sid"
+    DEVICE_ID_PATH = "event.json.req.queryParams.deviceId"
+    # whether an event has query params, events with any are counted, "" sid if none
+    QUERY_PARAMS_PATH = "event.json.req.queryParams" + FieldProjector.PRESENCE_SUFFIX
+    TIMESTAMP_PATH = "timestamp"  # epoch milliseconds of loggly events
+    LABELS = ["All sid", "deviceId=PSID", "deviceId=channel"]
+    ROLLUP_PRECISION = 12  # of the per bucket sid sketches, ~1.6% error
+
     def __init__(
         self,
         logger: logging.Logger,
+        approximate: bool = False,
+        errorRate: float = 0.01,
+        topK: int = 0,
+        rollupGranularity: Optional[str] = None,
+        sampler: Optional[StratifiedSampler] = None,
+        spillBytes: int = 0,
+        spillDir: Optional[str] = None,
     ) -> None:
+        """Count distinct session ids, overall and per deviceId class.
+
+        Args:
+            approximate (bool, optional): Estimate distinct counts with HyperLogLog
+                sketches in bounded memory instead of exact per sid counts.
+                Defaults to False.
+            errorRate (float, optional): Relative standard error of approximate
+                counts. Defaults to 0.01.
+            topK (int, optional): Also report the topK most frequent sids, estimated
+                with Space-Saving when approximate. Defaults to 0.
+            rollupGranularity (Optional[str], optional): Also keep event counts and
+                sid sketches per LABELS entry and time bucket of this granularity,
+                see writeRollups. Defaults to None.
+            sampler (Optional[StratifiedSampler], optional): Sampler of the time slots
+                fetched.  The sessions and events of all slots are then estimated
+                from per slot counts, taking sessions as not spanning slots.
+                Defaults to None.
+            spillBytes (int, optional): Memory budget of each exact per sid count,
+                past which it spills to sorted runs on disk, merged on dumpResult.
+                Defaults to 0, counting in memory only.
+            spillDir (Optional[str], optional): Directory of the spilled runs.
+                Defaults to the system temporary directory.
+        """
         self.logger = logger
-        self.sids = {}
-        self.psidSids = {}
-        self.channelSids = {}
+        self.approximate = approximate
+        self.errorRate = errorRate
+        self.topK = topK
+        self.spillBytes = spillBytes
+        self.spillDir = spillDir
+        self.sids = SpillingCounter(spillBytes, spillDir)
+        self.psidSids = SpillingCounter(spillBytes, spillDir)
+        self.channelSids = SpillingCounter(spillBytes, spillDir)
+        if approximate:
+            precision = HyperLogLog.getPrecision(errorRate)
+            # one sketch and empty sid count per LABELS entry
+            self.sidSketches = [HyperLogLog(precision) for _ in self.LABELS]
+            self.emptySidCnts = [0] * len(self.LABELS)
+            self.topSids = SpaceSaving(topK) if topK else None
+        self.rollupGranularity = rollupGranularity
+        if rollupGranularity:
+            getBucket(datetime.min, rollupGranularity)  # validate the granularity
+            # per bucket, the event count and sid sketch of each LABELS entry
+            self.rollupCnts = {}
+            self.rollupSketches = {}
+            self.minuteBuckets = {}
+        self.sampler = sampler
+        # per sampled slot, the event count and sids of each LABELS entry
+        self.slotCnts = {}
+        self.slotSids = {}
+
+    def getFieldPaths(self) -> tuple[str, ...]:
+        paths = (self.SID_PATH, self.DEVICE_ID_PATH, self.QUERY_PARAMS_PATH)
+        if self.rollupGranularity or self.sampler:
+            return paths + (self.TIMESTAMP_PATH,)
+        return paths
 
-    async def analyze(self, data: list[Any]):
-        for item in data:
-            if not item:
+    async def analyze(self, data: tuple):
+        await self.analyzeBatch([data])
+
+    async def analyzeBatch(self, batch: list[tuple]) -> None:
+        if self.rollupGranularity or self.sampler:
+            if self.rollupGranularity:
+                self._analyzeRollups(batch)
+            if self.sampler:
+                self._analyzeSample(batch)
+            batch = [record[:3] for record in batch]
+        if self.approximate:
+            self._analyzeApproximate(batch)
+            return
+        sids = self.sids.counts
+        psidSids = self.psidSids.counts
+        channelSids = self.channelSids.counts
+        for sid, deviceId, hasQueryParams in batch:
+            if not hasQueryParams:
+                # not a request with query params
                 continue
-            queryParams = (
-                item.get("event", {})
-                .get("json", {})
-                .get("req", {})
-                .get("queryParams", {})
-            )
-            if not queryParams:
+            sidKey = "" if sid is None else str(sid)
+            sids[sidKey] = sids.get(sidKey, 0) + 1
+            if deviceId == "{PSID}":
+                psidSids[sidKey] = psidSids.get(sidKey, 0) + 1
+            elif deviceId == "channel":
+                channelSids[sidKey] = channelSids.get(sidKey, 0) + 1
+        for counter in (self.sids, self.psidSids, self.channelSids):
+            counter.checkBudget()
+
+    def _analyzeApproximate(self, batch: list[tuple]) -> None:
+        allSketch, psidSketch, channelSketch = self.sidSketches
+        emptySidCnts = self.emptySidCnts
+        for sid, deviceId, hasQueryParams in batch:
+            if not hasQueryParams:
                 continue
-            sid = queryParams.get("sid", "")
-            deviceId = queryParams.get("deviceId", "")
-            sidKey = str(sid)
-            self.sids[sidKey] = self.sids.get(sidKey, 0) + 1
+            sidKey = "" if sid is None else str(sid)
+            if self.topSids:
+                self.topSids.add(sidKey)
             if deviceId == "{PSID}":
-                self.psidSids[sidKey] = self.psidSids.get(sidKey, 0) + 1
+                sketch, index = psidSketch, 1
             elif deviceId == "channel":
-                self.channelSids[sidKey] = self.channelSids.get(sidKey, 0) + 1
+                sketch, index = channelSketch, 2
+            else:
+                sketch, index = None, 0
+            hashed = hashValue(sidKey)
+            allSketch.addHash(hashed)
+            if sketch:
+                sketch.addHash(hashed)
+            if not sidKey:
+                emptySidCnts[0] += 1
+                if index:
+                    emptySidCnts[index] += 1
+
+    def _analyzeRollups(self, batch: list[tuple]) -> None:
+        rollupCnts = self.rollupCnts
+        rollupSketches = self.rollupSketches
+        minuteBuckets = self.minuteBuckets
+        for sid, deviceId, hasQueryParams, timestamp in batch:
+            if timestamp is None or not hasQueryParams:
+                continue
+            # buckets are at least a minute, so only map each minute to its bucket
+            minute = int(timestamp) // 60000
+            bucket = minuteBuckets.get(minute)
+            if bucket is None:
+                bucket = getBucket(
+                    datetime.fromtimestamp(minute * 60, timezone.utc),
+                    self.rollupGranularity,
+                )
+                minuteBuckets[minute] = bucket
+            cnts = rollupCnts.get(bucket)
+            if cnts is None:
+                cnts = rollupCnts[bucket] = [0] * len(self.LABELS)
+                rollupSketches[bucket] = [
+                    HyperLogLog(self.ROLLUP_PRECISION) for _ in self.LABELS
+                ]
+            sketches = rollupSketches[bucket]
+            indices = self._getLabelIndices(deviceId)
+            sidKey = "" if sid is None else str(sid)
+            hashed = hashValue(sidKey) if sidKey else None
+            for index in indices:
+                cnts[index] += 1
+                if hashed is not None:
+                    sketches[index].addHash(hashed)
+
+    def _analyzeSample(self, batch: list[tuple]) -> None:
+        slotCnts = self.slotCnts
+        slotSids = self.slotSids
+        getSlot = self.sampler.getSlot
+        for sid, deviceId, hasQueryParams, timestamp in batch:
+            if timestamp is None or not hasQueryParams:
+                continue
+            slot = getSlot(timestamp)
+            cnts = slotCnts.get(slot)
+            if cnts is None:
+                cnts = slotCnts[slot] = [0] * len(self.LABELS)
+                slotSids[slot] = [set() for _ in self.LABELS]
+            sids = slotSids[slot]
+            sidKey = "" if sid is None else str(sid)
+            for index in self._getLabelIndices(deviceId):
+                cnts[index] += 1
+                if sidKey:
+                    sids[index].add(sidKey)
+
+    def _getLabelIndices(self, deviceId: Optional[str]) -> tuple[int, ...]:
+        """Get the LABELS entries an event counts for.
+        """
+        if deviceId == "{PSID}":
+            return (0, 1)
+        if deviceId == "channel":
+            return (0, 2)
+        return (0,)
+
+    def getConfig(self) -> dict:
+        return {
+            "approximate": self.approximate,
+            "errorRate": self.errorRate,
+            "topK": self.topK,
+            "rollupGranularity": self.rollupGranularity,
+            "sampled": self.sampler is not None,
+        }
+
+    def newPartial(self) -> "SessionAnalyzer":
+        return SessionAnalyzer(
+            self.logger,
+            self.approximate,
+            self.errorRate,
+            self.topK,
+            self.rollupGranularity,
+            self.sampler,
+            self.spillBytes,
+            self.spillDir,
+        )
+
+    def getState(self) -> dict:
+        if self.approximate:
+            state = {
+                "sidSketches": [sketch.getState() for sketch in self.sidSketches],
+                "emptySidCnts": self.emptySidCnts,
+                "topSids": self.topSids.getState() if self.topSids else None,
+            }
+        else:
+            state = {
+                "sids": dict(self.sids.items()),
+                "psidSids": dict(self.psidSids.items()),
+                "channelSids": dict(self.channelSids.items()),
+            }
+        if self.rollupGranularity:
+            state["rollups"] = {
+                bucket: {
+                    "cnts": cnts,
+                    "sketches": [s.getState() for s in self.rollupSketches[bucket]],
+                }
+                for bucket, cnts in self.rollupCnts.items()
+            }
+        if self.sampler:
+            state["sample"] = {
+                slot: {"cnts": cnts, "sids": [sorted(s) for s in self.slotSids[slot]]}
+                for slot, cnts in self.slotCnts.items()
+            }
+        return state
+
+    def mergeState(self, state: dict) -> None:
+        state = dict(state)
+        if self.sampler:
+            for slot, sample in state.pop("sample").items():
+                # json object keys are strings
+                slot = int(slot)
+                if slot not in self.slotCnts:
+                    self.slotCnts[slot] = [0] * len(self.LABELS)
+                    self.slotSids[slot] = [set() for _ in self.LABELS]
+                cnts = self.slotCnts[slot]
+                for i, cnt in enumerate(sample["cnts"]):
+                    cnts[i] += cnt
+                for sids, otherSids in zip(self.slotSids[slot], sample["sids"]):
+                    sids.update(otherSids)
+        if self.rollupGranularity:
+            for bucket, rollup in state.pop("rollups").items():
+                sketches = [HyperLogLog.fromState(s) for s in rollup["sketches"]]
+                if bucket not in self.rollupCnts:
+                    self.rollupCnts[bucket] = list(rollup["cnts"])
+                    self.rollupSketches[bucket] = sketches
+                    continue
+                cnts = self.rollupCnts[bucket]
+                for i, cnt in enumerate(rollup["cnts"]):
+                    cnts[i] += cnt
+                for sketch, other in zip(self.rollupSketches[bucket], sketches):
+                    sketch.merge(other)
+        if self.approximate:
+            for sketch, sketchState in zip(self.sidSketches, state["sidSketches"]):
+                sketch.merge(HyperLogLog.fromState(sketchState))
+            for i, cnt in enumerate(state["emptySidCnts"]):
+                self.emptySidCnts[i] += cnt
+            if self.topSids and state["topSids"]:
+                self.topSids.merge(SpaceSaving.fromState(state["topSids"]))
+            return
+        for name, counts in state.items():
+            sidCounts = getattr(self, name)
+            for sidKey, cnt in counts.items():
+                sidCounts.add(sidKey, cnt)
+
+    def writeRollups(self, store: "RollupStore", add: bool = False) -> None:
+        """Write the event counts per LABELS entry to dimension "events" and the sid
+        sketches to a dimension per LABELS entry, e.g. "All sid".
+        """
+        if not self.rollupGranularity:
+            raise Exception("rollups need a rollupGranularity")
+        name = type(self).__name__
+        store.putCounts(
+            name,
+            "events",
+            self.rollupGranularity,
+            (
+                (bucket, label, cnt)
+                for bucket, cnts in self.rollupCnts.items()
+                for label, cnt in zip(self.LABELS, cnts)
+            ),
+            add,
+        )
+        for i, label in enumerate(self.LABELS):
+            store.putSketches(
+                name,
+                label,
+                self.rollupGranularity,
+                ((bucket, s[i]) for bucket, s in self.rollupSketches.items()),
+                add,
+            )
 
     def dumpResult(self) -> None:
-        labels = ["All sid", "deviceId=PSID", "deviceId=channel"]
-        data = [self.sids, self.psidSids, self.channelSids]
+        if self.sampler:
+            estimates = self.getEstimates()
+            self.logger.info(f"estimates from sampled slots: {json.dumps(estimates)}")
         result = {}
+        if self.approximate:
+            for i, label in enumerate(self.LABELS):
+                count = round(self.sidSketches[i].count())
+                result[label] = [count, count + self.emptySidCnts[i]]
+            precision = self.sidSketches[0].precision
+            result["relative error"] = round(1.04 / math.sqrt(1 << precision), 4)
+            if self.topSids:
+                result["top sids"] = self.topSids.top(self.topK)
+            self.logger.info(json.dumps(result))
+            return
+
+        data = [self.sids, self.psidSids, self.channelSids]
         for i in range(len(data)):
-            label = labels[i]
-            dataDict = data[i]
-            descData = sorted(dataDict.items(), key=lambda x: x[1], reverse=True)
+            label = self.LABELS[i]
             self.logger.info(f"result for {label}: ")
-            count = len(descData)
-            countIncludingEmpty = count + dataDict.get("", 0)
-            result[label] = {count, countIncludingEmpty}
+            # one pass over the counts, which merges any spilled runs
+            count = 0
+            emptyCnt = 0
+            for sidKey, cnt in data[i].items():
+                count += 1
+                if not sidKey:
+                    emptyCnt = cnt
+            result[label] = [count, count + emptyCnt]
+        if self.topK:
+            result["top sids"] = heapq.nlargest(
+                self.topK, self.sids.items(), key=itemgetter(1)
+            )
         self.logger.info(json.dumps(result))
+
+    def getEstimates(self) -> dict:
+        """Estimate the sessions and events of all slots from the sampled slots.
+
+        Returns:
+            dict: {label: {"sessions": [estimate, 95% confidence interval half
+                width], "events": [...]}, "sampled slots": [sampled, all]}, the half
+                width None when there are too few sampled slots to estimate it.
+        """
+
+        def getRounded(estimate: tuple[float, float]) -> list:
+            total, halfWidth = estimate
+            return [round(total), round(halfWidth) if math.isfinite(halfWidth) else None]
+
+        estimates = {}
+        for i, label in enumerate(self.LABELS):
+            sessions = self.sampler.estimate(
+                {slot: len(sids[i]) for slot, sids in self.slotSids.items()}
+            )
+            events = self.sampler.estimate(
+                {slot: cnts[i] for slot, cnts in self.slotCnts.items()}
+            )
+            estimates[label] = {
+                "sessions": getRounded(sessions),
+                "events": getRounded(events),
+            }
+        estimates["sampled slots"] = [
+            len(self.sampler.sampledSlots),
+            self.sampler.slotCnt,
+        ]
+        return estimates
@@ -0,0 +1,73 @@
+import functools
+import re
+from typing import Sequence
+
+# masking rules by name, applied in this order: pattern and replacement
+MASK_RULES: dict[str, tuple[re.Pattern, str]] = {
+    "quoted": (re.compile(r"'[^']*'|\"[^\"]*\"|`[^`]*`"), "<str>"),
+    "uuid": (
+        re.compile(
+            r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"
+        ),
+        "<uuid>",
+    ),
+    "hex": (re.compile(r"\b0[xX][0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b"), "<hex>"),
+    "number": (re.compile(r"\b\d+(?:\.\d+)?\b"), "<num>"),
+}
+
+
+class SignatureExtractor:
+    CACHE_SIZE = 1 << 16  # raw messages whose signature is memoized
+
+    def __init__(
+        self,
+        masks: Sequence[str] = (),
+        patterns: Sequence[tuple[str, str]] = (),
+        cacheSize: int = CACHE_SIZE,
+    ) -> None:
+        """Reduce error messages to signatures, so messages differing only in ids or
+        values are counted as one error.
+
+        The signature is the message without enclosing quotes up to its first ":",
+        with the masks and then the user patterns applied.  Signatures of recently
+        seen messages are cached.
+
+        Args:
+            masks (Sequence[str], optional): Names of MASK_RULES to apply, e.g.
+                ("number", "uuid"). Defaults to none.
+            patterns (Sequence[tuple[str, str]], optional): Extra (regex, replacement)
+                substitutions. Defaults to none.
+            cacheSize (int, optional): Max cached messages. Defaults to 65536.
+        """
+        unknownMasks = set(masks) - MASK_RULES.keys()
+        if unknownMasks:
+            raise Exception(f"unknown masks {sorted(unknownMasks)}")
+        self.masks = tuple(name for name in MASK_RULES if name in masks)
+        self.patterns = tuple(patterns)
+        self.cacheSize = cacheSize
+        self.rules = [MASK_RULES[name] for name in self.masks]
+        self.rules.extend((re.compile(regex), repl) for regex, repl in self.patterns)
+        self.extract = functools.lru_cache(cacheSize)(self._extract)
+
+    def __getstate__(self) -> dict:
+        # the cache is rebuilt, not pickled
+        return {"masks": self.masks, "patterns": self.patterns, "cacheSize": self.cacheSize}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def _extract(self, message: str) -> str:
+        """Get the signature of an error message.
+
+        Args:
+            message (str): Raw message, possibly quoted.
+
+        Returns:
+            str: Signature, "" for an empty message.
+        """
+        if not message:
+            return ""
+        signature = message.strip('"').split(":", 1)[0]
+        for pattern, repl in self.rules:
+            signature = pattern.sub(repl, signature)
+        return signature
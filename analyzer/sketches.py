@@ -0,0 +1,151 @@
+import base64
+import hashlib
+import heapq
+import math
+from typing import Any
+
+
+def hashValue(value: str) -> int:
+    """Get a stable 64 bit hash of a string, the same in every process.
+    """
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog:
+    MIN_PRECISION = 4
+    MAX_PRECISION = 18
+
+    def __init__(self, precision: int = 14) -> None:
+        """Distinct count estimate with relative standard error 1.04 / sqrt(2**precision),
+        using 2**precision bytes.
+
+        Args:
+            precision (int, optional): Number of index bits. Defaults to 14, ~0.8% error.
+        """
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @classmethod
+    def getPrecision(cls, errorRate: float) -> int:
+        """Get the smallest precision whose standard error is within errorRate.
+        """
+        precision = math.ceil(math.log2((1.04 / errorRate) ** 2))
+        return min(max(precision, cls.MIN_PRECISION), cls.MAX_PRECISION)
+
+    def addHash(self, hashed: int) -> None:
+        """Add a value by its hashValue.
+        """
+        restBits = 64 - self.precision
+        index = hashed >> restBits
+        rest = hashed & ((1 << restBits) - 1)
+        rank = restBits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value: str) -> None:
+        self.addHash(hashValue(value))
+
+    def count(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return estimate
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise Exception("cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def getState(self) -> dict[str, Any]:
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(self.registers).decode("ascii"),
+        }
+
+    @classmethod
+    def fromState(cls, state: dict[str, Any]) -> "HyperLogLog":
+        sketch = cls(state["precision"])
+        sketch.registers = bytearray(base64.b64decode(state["registers"]))
+        return sketch
+
+
+class SpaceSaving:
+    def __init__(self, k: int) -> None:
+        """Top k most frequent items in O(k) memory (Space-Saving algorithm).
+
+        Each reported count overestimates the true count by at most its error, and
+        any item more frequent than total / k is guaranteed to be kept.
+
+        Args:
+            k (int): Number of counters.
+        """
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        # (count, item) entries, stale once the item's count changed
+        self.heap = []
+
+    def add(self, item: str, count: int = 1) -> None:
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.k:
+            counts[item] = count
+            self.errors[item] = 0
+        else:
+            minCount, minItem = self._popMin()
+            del counts[minItem]
+            del self.errors[minItem]
+            counts[item] = minCount + count
+            self.errors[item] = minCount
+        heapq.heappush(self.heap, (counts[item], item))
+        if len(self.heap) > 4 * self.k:
+            self.heap = [(c, i) for i, c in counts.items()]
+            heapq.heapify(self.heap)
+
+    def _popMin(self) -> tuple[int, str]:
+        while True:
+            count, item = heapq.heappop(self.heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        """Get the n items with the highest estimated counts, highest first.
+        """
+        return heapq.nlargest(n, self.counts.items(), key=lambda x: x[1])
+
+    def merge(self, other: "SpaceSaving") -> None:
+        # an item missing from a full summary may have up to its min count there
+        selfMin = min(self.counts.values()) if len(self.counts) >= self.k else 0
+        otherMin = min(other.counts.values()) if len(other.counts) >= other.k else 0
+        counts = {}
+        errors = {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, selfMin) + other.counts.get(item, otherMin)
+            errors[item] = self.errors.get(item, selfMin) + other.errors.get(item, otherMin)
+        top = heapq.nlargest(self.k, counts.items(), key=lambda x: x[1])
+        self.counts = dict(top)
+        self.errors = {item: errors[item] for item in self.counts}
+        self.heap = [(c, i) for i, c in self.counts.items()]
+        heapq.heapify(self.heap)
+
+    def getState(self) -> dict[str, Any]:
+        return {
+            "k": self.k,
+            "counts": self.counts,
+            "errors": self.errors,
+        }
+
+    @classmethod
+    def fromState(cls, state: dict[str, Any]) -> "SpaceSaving":
+        sketch = cls(state["k"])
+        sketch.counts = dict(state["counts"])
+        sketch.errors = dict(state["errors"])
+        sketch.heap = [(c, i) for i, c in sketch.counts.items()]
+        heapq.heapify(sketch.heap)
+        return sketch
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import math
+import random
+import sys
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+
+class LogglyStub:
+    def __init__(
+        self,
+        eventsPerSec: float = 1.0,
+        latencySecs: float = 0.02,
+        throttleRate: float = 0.0,
+        sids: int = 100000,
+        messageBytes: int = 500,
+        seed: int = 0,
+    ) -> None:
+        """Local stand in for loggly's events/iterate api.
+
+        Events are generated deterministically from time: the density follows a
+        daily cycle around eventsPerSec, quiet at night and busy during the day.
+
+        Args:
+            eventsPerSec (float, optional): Mean event rate. Defaults to 1.0.
+            latencySecs (float, optional): Delay of each response. Defaults to 0.02.
+            throttleRate (float, optional): Fraction of requests answered with 429
+                and a Retry-After header. Defaults to 0.
+            sids (int, optional): Number of distinct session ids. Defaults to 100000.
+            messageBytes (int, optional): Size of the message field of each event.
+                Defaults to 500.
+        """
+        self.eventsPerSec = eventsPerSec
+        self.latencySecs = latencySecs
+        self.throttleRate = throttleRate
+        self.sids = sids
+        self.message = "m" * messageBytes
+        self.rand = random.Random(seed)
+        self.requests = 0
+        self.throttled = 0
+        self.runner = None
+        self.port = 0
+
+    def getBaseUri(self) -> str:
+        return f"http://127.0.0.1:{self.port}/apiv2/"
+
+    async def start(self, port: int = 0) -> None:
+        app = web.Application()
+        app.router.add_get("/apiv2/events/iterate", self.iterate)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+    def getEventTimes(self, start: float, end: float) -> list[float]:
+        # events of each whole second depend only on that second, so any split
+        # of a time range returns the same events
+        times = []
+        for second in range(math.floor(start), math.ceil(end)):
+            hourOfDay = second % 86400 / 3600
+            cycle = math.sin((hourOfDay - 9) / 12 * math.pi)
+            rate = self.eventsPerSec * (1 + 0.9 * cycle)
+            jitter = (second * 2654435761) % 1000 / 1000
+            count = int(rate + jitter)
+            for i in range(count):
+                t = second + i / count
+                if start <= t < end:
+                    times.append(t)
+        return times
+
+    @staticmethod
+    def _parseTime(timeStr: str) -> float:
+        parsed = datetime.strptime(timeStr, "%Y-%m-%dT%H:%M:%S.%fZ")
+        return parsed.replace(tzinfo=timezone.utc).timestamp()
+
+    async def iterate(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latencySecs)
+        if self.rand.random() < self.throttleRate:
+            self.throttled += 1
+            return web.Response(status=429, headers={"Retry-After": "0.1"})
+        query = request.query
+        if "next" in query:
+            start, end = float(query["start"]), float(query["end"])
+            offset = int(query["next"])
+        else:
+            start, end = self._parseTime(query["from"]), self._parseTime(query["until"])
+            offset = 0
+        size = int(query.get("size", 1000))
+        times = self.getEventTimes(start, end)
+        events = []
+        for t in times[offset : offset + size]:
+            sid = int(t * 7919) % self.sids
+            events.append(
+                {
+                    "timestamp": int(t * 1000),
+                    "event": {
+                        "json": {
+                            "message": self.message,
+                            "req": {
+                                "url": "/xx/yyyy/",
+                                "queryParams": {
+                                    "sid": sid,
+                                    "deviceId": "channel" if sid % 3 else "{PSID}",
+                                },
+                            },
+                        }
+                    },
+                }
+            )
+        body = {"events": events}
+        if offset + size < len(times):
+            nextQuery = {"next": offset + size, "start": start, "end": end}
+            body["next"] = str(request.url.with_query(nextQuery))
+        resp = web.json_response(body)
+        # compressed as negotiated by the Accept-Encoding header, like loggly
+        resp.enable_compression()
+        return resp
+
+
+async def serve(stub: LogglyStub) -> None:
+    await stub.start()
+    # the parent process reads the port, then stops the stub by closing stdin
+    print(stub.port, flush=True)
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+    print(f"served {stub.requests} requests, {stub.throttled} throttled", file=sys.stderr)
+    await stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local loggly stand in.")
+    parser.add_argument("--events-per-sec", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--throttle", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(serve(LogglyStub(args.events_per_sec, args.latency, args.throttle)))
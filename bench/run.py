@@ -0,0 +1,258 @@
+"""Benchmark scenarios driving Controller with each fetcher and analyzer pair.
+
+Run from the repository root, e.g.:
+
+    python -m bench.run --rows 200000 --hours 6
+    python -m bench.run --scenario session-loggly --hours 24 --throttle 0.05
+
+Each scenario runs in its own process so peak RSS is not shared between them.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench.synthetic import writeBodyErrorCsv, writeDailyTotalsCsv
+
+SCENARIOS = [
+    "body-error-csv",
+    "body-error-sharded",
+    "session-loggly",
+    "session-loggly-approximate",
+    "session-loggly-sampled",
+]
+
+
+class LoopStallMonitor:
+    INTERVAL_SECS = 0.01
+    STALL_SECS = 0.005  # lag counted as a stall
+
+    def __init__(self) -> None:
+        """Measure how long the event loop is blocked, by timing short sleeps."""
+        self.maxStallSecs = 0.0
+        self.totalStallSecs = 0.0
+        self.task = None
+
+    async def _monitor(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.INTERVAL_SECS)
+            lag = loop.time() - before - self.INTERVAL_SECS
+            if lag > self.STALL_SECS:
+                self.totalStallSecs += lag
+                self.maxStallSecs = max(self.maxStallSecs, lag)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._monitor())
+
+    def stop(self) -> None:
+        self.task.cancel()
+
+
+def getPeakRssMb() -> float:
+    # ru_maxrss is in KiB on linux; include worker processes of sharded runs
+    selfRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    childRss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(selfRss, childRss) / 1024, 1)
+
+
+async def runBodyError(args: argparse.Namespace, sharded: bool) -> int:
+    from analyzer.body_error import BodyErrorAnalyzer
+    from controller.multi_source import MultiSourceController
+    from controller.sharded import ShardedController
+    from fetcher.body_error import BodyErrorFetcher
+    from fetcher.daily_totals import DailyTotalFetcher
+    from fetcher.fetcher import Fetcher
+
+    logger = logging.getLogger(__name__)
+    outDir = os.path.join(args.data_dir, "out")
+    os.makedirs(outDir, exist_ok=True)
+    analyzer = BodyErrorAnalyzer(
+        logger,
+        os.path.join(outDir, "errors.csv"),
+        os.path.join(outDir, "daily.csv"),
+        os.path.join(outDir, "percent.csv"),
+    )
+    resultQueue = Fetcher.newQueue()
+    totalsFetcher = DailyTotalFetcher(
+        logger, resultQueue, os.path.join(args.data_dir, "totals.csv")
+    )
+    csvFile = os.path.join(args.data_dir, "body_errors.csv")
+    if sharded:
+        fetcherFactory = functools.partial(BodyErrorFetcher, logger, filePath=csvFile)
+        controller = ShardedController(
+            logger, fetcherFactory, analyzer, datetime.min, datetime.max
+        )
+        await MultiSourceController(
+            logger, [totalsFetcher], analyzer, datetime.min, datetime.max
+        ).collect()
+        await controller.run()
+    else:
+        fetcher = BodyErrorFetcher(logger, resultQueue, csvFile)
+        await MultiSourceController(
+            logger, [totalsFetcher, fetcher], analyzer, datetime.min, datetime.max
+        ).run()
+    return args.rows
+
+
+async def runSession(
+    args: argparse.Namespace, approximate: bool, sampled: bool = False
+) -> int:
+    from analyzer.session import SessionAnalyzer
+    from bench.loggly_stub import LogglyStub
+    from controller.controller import Controller
+    from fetcher.fetcher import Fetcher
+    from fetcher.loggly import LogglyFetcher
+    from fetcher.sampling import StratifiedSampler
+
+    logger = logging.getLogger(__name__)
+    # the stub runs in its own process so it does not stall the measured loop
+    stubProc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "bench.loggly_stub",
+            "--events-per-sec",
+            str(args.events_per_sec),
+            "--latency",
+            str(args.latency),
+            "--throttle",
+            str(args.throttle),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        port = int(await asyncio.to_thread(stubProc.stdout.readline))
+        baseUri = f"http://127.0.0.1:{port}/apiv2/"
+        endTime = datetime(2023, 9, 8, tzinfo=timezone.utc)
+        startTime = endTime - timedelta(hours=args.hours)
+        sampler = None
+        if sampled:
+            sampler = StratifiedSampler(startTime, endTime, args.sample_fraction)
+        fetcher = LogglyFetcher(
+            logger, Fetcher.newQueue(), baseUri, "query", "token", "1", sampler=sampler
+        )
+        analyzer = SessionAnalyzer(logger, approximate=approximate, sampler=sampler)
+        await Controller(logger, fetcher, analyzer, startTime, endTime).run()
+    finally:
+        stubProc.stdin.close()
+        stubProc.wait()
+    stub = LogglyStub(args.events_per_sec)
+    ranges = sampler.getRanges(startTime, endTime) if sampler else [(startTime, endTime)]
+    return sum(
+        len(stub.getEventTimes(start.timestamp(), end.timestamp()))
+        for start, end in ranges
+    )
+
+
+async def runScenario(args: argparse.Namespace) -> dict:
+    monitor = LoopStallMonitor()
+    monitor.start()
+    timeStart = time.perf_counter()
+    if args.scenario == "body-error-csv":
+        records = await runBodyError(args, sharded=False)
+    elif args.scenario == "body-error-sharded":
+        records = await runBodyError(args, sharded=True)
+    elif args.scenario == "session-loggly":
+        records = await runSession(args, approximate=False)
+    elif args.scenario == "session-loggly-approximate":
+        records = await runSession(args, approximate=True)
+    elif args.scenario == "session-loggly-sampled":
+        records = await runSession(args, approximate=False, sampled=True)
+    else:
+        raise Exception(f"unknown scenario {args.scenario}")
+    wallSecs = time.perf_counter() - timeStart
+    monitor.stop()
+    return {
+        "scenario": args.scenario,
+        "records": records,
+        "wallSecs": round(wallSecs, 3),
+        "recordsPerSec": round(records / wallSecs),
+        "peakRssMb": getPeakRssMb(),
+        "maxLoopStallSecs": round(monitor.maxStallSecs, 3),
+        "totalLoopStallSecs": round(monitor.totalStallSecs, 3),
+    }
+
+
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    parser.add_argument("--rows", type=int, default=100000, help="body error csv rows")
+    parser.add_argument("--error-types", type=int, default=200)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--message-bytes", type=int, default=2000)
+    parser.add_argument("--hours", type=float, default=6, help="loggly time range")
+    parser.add_argument("--events-per-sec", type=float, default=2.0)
+    parser.add_argument("--latency", type=float, default=0.02, help="stub latency")
+    parser.add_argument("--throttle", type=float, default=0.0, help="stub 429 rate")
+    parser.add_argument("--sample-fraction", type=float, default=0.1)
+    parser.add_argument("--data-dir", help="reuse generated data in this directory")
+    parser.add_argument("--output", help="also append json results to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def getChildArgs(args: argparse.Namespace, dataDir: str) -> list[str]:
+    childArgs = ["--data-dir", dataDir]
+    for name in (
+        "rows",
+        "hours",
+        "events_per_sec",
+        "latency",
+        "throttle",
+        "sample_fraction",
+        "log_level",
+    ):
+        childArgs += ["--" + name.replace("_", "-"), str(getattr(args, name))]
+    return childArgs
+
+
+def main() -> None:
+    args = parseArgs()
+    logging.basicConfig(level=args.log_level)
+    if args.json:
+        # child process running a single scenario
+        args.scenario = args.scenario[0]
+        print(json.dumps(asyncio.run(runScenario(args))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        dataDir = args.data_dir or tmpDir
+        csvFile = os.path.join(dataDir, "body_errors.csv")
+        if not os.path.exists(csvFile):
+            writeBodyErrorCsv(
+                csvFile, args.rows, args.error_types, args.days, args.message_bytes
+            )
+            writeDailyTotalsCsv(os.path.join(dataDir, "totals.csv"), args.days)
+        results = []
+        for scenario in args.scenario or SCENARIOS:
+            proc = subprocess.run(
+                [sys.executable, "-m", "bench.run", "--json", "--scenario", scenario]
+                + getChildArgs(args, dataDir),
+                stdout=subprocess.PIPE,
+                check=True,
+                text=True,
+            )
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(json.dumps(result))
+    if args.output:
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import csv
+import random
+from datetime import date, timedelta
+
+BODY_ERROR_HEADER = [
+    "Date",
+    "Host",
+    "@Body.Attributes.metadata.error",
+    "@Body.message",
+]
+
+
+def getDays(startDay: date, days: int) -> list[str]:
+    return [(startDay + timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def writeBodyErrorCsv(
+    path: str,
+    rows: int,
+    errorTypes: int = 200,
+    days: int = 30,
+    messageBytes: int = 2000,
+    seed: int = 0,
+) -> None:
+    """Write a synthetic body error export.
+
+    Args:
+        path (str): Output csv path.
+        rows (int): Number of data rows.
+        errorTypes (int, optional): Number of distinct error signatures. Defaults to 200.
+        days (int, optional): Number of distinct dates. Defaults to 30.
+        messageBytes (int, optional): Approximate size of the @Body.message field,
+            which also holds quoted text and newlines. Defaults to 2000.
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rand = random.Random(seed)
+    dayStrs = getDays(date(2023, 9, 1), days)
+    padding = ("x" * 70 + "\n") * max(1, messageBytes // 71)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(BODY_ERROR_HEADER)
+        for i in range(rows):
+            day = dayStrs[i * days // rows]
+            # skewed error distribution, a few errors dominate
+            errorType = int(errorTypes * rand.random() ** 3)
+            seconds = rand.randrange(86400)
+            timeStr = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+            if rand.random() < 0.5:
+                attributeError = f"error {errorType}: request {rand.randrange(10**6)}"
+                message = ""
+            else:
+                attributeError = ""
+                message = f'error {errorType}: "{rand.randrange(10**6)}" failed\n{padding}'
+            writer.writerow(
+                [f"{day}T{timeStr}.000Z", f"host{i % 16}", attributeError, message]
+            )
+
+
+def writeDailyTotalsCsv(path: str, days: int = 30, seed: int = 0) -> None:
+    """Write a synthetic daily submit totals export.
+
+    Args:
+        path (str): Output csv path.
+        days (int, optional): Number of days. Defaults to 30.
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rand = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "value"])
+        for day in getDays(date(2023, 9, 1), days):
+            writer.writerow([f"{day}T00:00:00.000Z", rand.randrange(10000, 100000)])
@@ -0,0 +1,71 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+from analyzer.analyzer import Analyzer
+
+_analyzer: Optional[Analyzer] = None  # partial analyzer of a worker process
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _initWorker(analyzer: Analyzer) -> None:
+    global _analyzer, _loop
+    _analyzer = analyzer
+    _loop = asyncio.new_event_loop()
+
+
+def _analyzeBatch(batch: list[Any]) -> None:
+    _loop.run_until_complete(_analyzer.analyzeBatch(batch))
+
+
+def _getState() -> dict[str, Any]:
+    return _analyzer.getState()
+
+
+class AnalyzerPool:
+    MAX_PENDING_BATCHES = 2  # batches in flight per worker
+
+    def __init__(self, analyzer: Analyzer, workers: int) -> None:
+        """Analyze batches in worker processes, each keeping a partial analyzer.
+
+        Batches are dealt round robin to the workers.  Submitting waits while every
+        worker has MAX_PENDING_BATCHES batches in flight, so the fetch is held back
+        by the analysis as with an inline analyzer.
+
+        Args:
+            analyzer (Analyzer): Analyzer receiving the merged result on close.
+            workers (int): Number of worker processes.
+        """
+        self.analyzer = analyzer
+        partial = analyzer.newPartial()
+        self.executors = [
+            ProcessPoolExecutor(1, initializer=_initWorker, initargs=(partial,))
+            for _ in range(workers)
+        ]
+        self.pending = deque()
+        self.nextWorker = 0
+
+    async def submit(self, batch: list[Any]) -> None:
+        if len(self.pending) >= self.MAX_PENDING_BATCHES * len(self.executors):
+            await self.pending.popleft()
+        executor = self.executors[self.nextWorker]
+        self.nextWorker = (self.nextWorker + 1) % len(self.executors)
+        loop = asyncio.get_running_loop()
+        self.pending.append(loop.run_in_executor(executor, _analyzeBatch, batch))
+
+    async def merge(self) -> None:
+        """Wait for all batches and merge the worker states into the analyzer.
+        """
+        while self.pending:
+            await self.pending.popleft()
+        loop = asyncio.get_running_loop()
+        states = await asyncio.gather(
+            *[loop.run_in_executor(e, _getState) for e in self.executors]
+        )
+        for state in states:
+            self.analyzer.mergeState(state)
+
+    def shutdown(self) -> None:
+        for executor in self.executors:
+            executor.shutdown(cancel_futures=True)
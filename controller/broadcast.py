@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from datetime import datetime
+from operator import itemgetter
+from typing import Any, Callable, Optional
+
+from analyzer.analyzer import Analyzer
+from fetcher.fetcher import Fetcher
+from fetcher.projection import FieldProjector
+
+
+class BroadcastController:
+    BUFFER_SIZE = 16  # batches buffered per analyzer before the fetch is held back
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        fetcher: Fetcher,
+        analyzers: list[Analyzer],
+        startTime: datetime,
+        endTime: datetime,
+        bufferSize: int = BUFFER_SIZE,
+    ):
+        """Feed a single fetch to several analyzers, each dumping its own result.
+
+        Every analyzer reads from its own bounded buffer, so the slowest analyzer holds
+        back the fetch instead of the buffers growing without bound.
+
+        Args:
+            analyzers (list[Analyzer]): Analyzers to feed.
+            bufferSize (int, optional): Batches buffered per analyzer. Defaults to 16.
+        """
+        self.logger = logger
+        self.fetcher = fetcher
+        self.analyzers = analyzers
+        self.startTime = startTime
+        self.endTime = endTime
+        self.queues = [Fetcher.newQueue(bufferSize) for _ in analyzers]
+        self.converters = self._getConverters()
+
+    def _getConverters(self) -> list[Optional[Callable[[list[Any]], list[Any]]]]:
+        """Let the fetcher project records to the union of all analyzer field paths
+        and get the conversion of such batches for each analyzer.
+
+        Returns:
+            list[Optional[Callable]]: Batch conversion per analyzer, None to pass the
+                batch as is.
+        """
+        analyzerPaths = [tuple(a.getFieldPaths()) for a in self.analyzers]
+        if not all(analyzerPaths):
+            # some analyzer needs full records, project for the others only
+            self.fetcher.setFieldPaths(())
+            return [
+                FieldProjector(paths).projectAll if paths else None
+                for paths in analyzerPaths
+            ]
+        fieldPaths = list(dict.fromkeys(p for paths in analyzerPaths for p in paths))
+        self.fetcher.setFieldPaths(fieldPaths)
+        converters = []
+        for paths in analyzerPaths:
+            if list(paths) == fieldPaths:
+                converters.append(None)
+                continue
+            getFields = itemgetter(*[fieldPaths.index(p) for p in paths])
+            if len(paths) == 1:
+                converters.append(lambda batch, g=getFields: [(g(r),) for r in batch])
+            else:
+                converters.append(lambda batch, g=getFields: [g(r) for r in batch])
+        return converters
+
+    async def run(self) -> None:
+        await self.collect()
+        for analyzer in self.analyzers:
+            analyzer.dumpResult()
+
+    async def collect(self) -> None:
+        """Fetch once and analyze all data with every analyzer, without dumping the
+        results.
+        """
+        self.logger.info(
+            f"=== Run {len(self.analyzers)} analyses "
+            f"from {self.startTime} to {self.endTime} ==="
+        )
+        await asyncio.gather(
+            self.fetcher.fetch(self.startTime, self.endTime),
+            self._broadcast(),
+            *[
+                self._analyze(analyzer, queue)
+                for analyzer, queue in zip(self.analyzers, self.queues)
+            ],
+        )
+
+    async def _broadcast(self) -> None:
+        while True:
+            data = await self.fetcher.getData()
+            for queue, convert in zip(self.queues, self.converters):
+                await queue.put(convert(data) if convert and data else data)
+            if data is None:
+                break
+
+    async def _analyze(self, analyzer: Analyzer, queue: asyncio.Queue) -> None:
+        recordCnt = 0
+        while True:
+            data = await queue.get()
+            if data is None:
+                break
+            await analyzer.analyzeBatch(data)
+            recordCnt += len(data)
+        self.logger.info(
+            f"{type(analyzer).__name__} completed, {recordCnt} records"
+        )
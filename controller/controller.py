@@ -1,12 +1,19 @@
 import asyncio
 import logging
+import time
 from datetime import datetime
+from typing import Optional
 
 from analyzer.analyzer import Analyzer
+from controller.analyzer_pool import AnalyzerPool
 from fetcher.fetcher import Fetcher
+from utils.logging_config import ThrottledLogger
+from utils.metrics import METRICS, SIZE_BUCKETS
 
 
 class Controller:
+    METRICS_INTERVAL_SECS = 60  # default period of metrics snapshots during a run
+
     def __init__(
         self,
         logger: logging.Logger,
@@ -14,31 +21,107 @@ class Controller:
         analyzer: Analyzer,
         startTime: datetime,
         endTime: datetime,
+        metricsPath: Optional[str] = None,
+        metricsIntervalSecs: float = METRICS_INTERVAL_SECS,
+        analyzeWorkers: int = 0,
     ):
+        """Pair a fetcher with an analyzer over a time range.
+
+        Args:
+            metricsPath (Optional[str], optional): Write metrics snapshots to this
+                file during and at the end of run, in prometheus textfile format if it
+                ends with .prom, json otherwise. Defaults to None.
+            metricsIntervalSecs (float, optional): Seconds between snapshots during
+                run. Defaults to 60.
+            analyzeWorkers (int, optional): Analyze batches in this many worker
+                processes with partial analyzers (see Analyzer.newPartial), keeping
+                the event loop free for fetching.  Defaults to 0, analyzing on the
+                event loop.
+        """
         self.logger = logger
         self.fetcher = fetcher
         self.analyzer = analyzer
+        self.fetcher.setFieldPaths(analyzer.getFieldPaths())
         self.startTime = startTime
         self.endTime = endTime
+        self.metricsPath = metricsPath
+        self.metricsIntervalSecs = metricsIntervalSecs
+        self.analyzeWorkers = analyzeWorkers
+        self.batchLog = ThrottledLogger(logger)
+        self.batchSeconds = METRICS.histogram(
+            "analyze_batch_seconds", "Time to analyze one batch"
+        )
+        self.batchSizes = METRICS.histogram(
+            "analyze_batch_records", "Records per analyzed batch", SIZE_BUCKETS
+        )
+        self.analyzedRecords = METRICS.counter(
+            "analyze_records_total", "Records analyzed"
+        )
+        self.recordsPerSec = METRICS.gauge(
+            "analyze_records_per_second", "Records analyzed per second in the last run"
+        )
 
     async def run(self):
+        if not self.metricsPath:
+            await self.collect()
+            self.analyzer.dumpResult()
+            return
+        exporter = asyncio.create_task(
+            METRICS.writePeriodically(self.metricsPath, self.metricsIntervalSecs)
+        )
+        try:
+            await self.collect()
+            self.analyzer.dumpResult()
+        finally:
+            exporter.cancel()
+            await asyncio.to_thread(METRICS.write, self.metricsPath)
+
+    async def collect(self) -> None:
+        """Fetch and analyze all data without dumping the result.
+        """
         self.logger.info(
             f"=== Run analysis from {self.startTime} to {self.endTime} ==="
         )
         await asyncio.gather(
-            self.fetcher.fetch(self.startTime, self.endTime), self._analyze()
+            self.fetcher.fetch(self.startTime, self.endTime),
+            self._analyze(self.fetcher),
         )
 
-    async def _analyze(self) -> None:
-        self.logger.info(f"_analyze: {self.fetcher.isFinished()}")
-        while True:
-            data = await self.fetcher.getData()
-            if data is None:
-                self.logger.info("data is None")
-                break
-            else:
-                self.logger.info(f"analyzing data ${data}")
-                await self.analyzer.analyze(data)
-
-        self.logger.info("analyzData completed")
-        self.analyzer.dumpResult()
+    async def _analyze(self, fetcher: Fetcher, sourceCnt: int = 1) -> None:
+        """Analyze batches from the result queue of fetcher.
+
+        Args:
+            fetcher (Fetcher): Fetcher to get data from.
+            sourceCnt (int, optional): Number of fetchers sharing the queue, each of
+                which signals its completion separately. Defaults to 1.
+        """
+        pool = None
+        if self.analyzeWorkers:
+            pool = AnalyzerPool(self.analyzer, self.analyzeWorkers)
+        startTime = time.perf_counter()
+        recordCnt = 0
+        try:
+            while sourceCnt:
+                data = await fetcher.getData()
+                if data is None:
+                    sourceCnt -= 1
+                    continue
+                batchStart = time.perf_counter()
+                if pool:
+                    await pool.submit(data)
+                else:
+                    await self.analyzer.analyzeBatch(data)
+                batchEnd = time.perf_counter()
+                self.batchSeconds.observe(batchEnd - batchStart)
+                self.batchSizes.observe(len(data))
+                self.analyzedRecords.inc(len(data))
+                recordCnt += len(data)
+                self.recordsPerSec.set(recordCnt / (batchEnd - startTime))
+                self.batchLog.debug("analyzed %d records", recordCnt)
+            if pool:
+                await pool.merge()
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self.logger.info(f"analyzData completed, {recordCnt} records")
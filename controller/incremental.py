@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from analyzer.analyzer import Analyzer
+from controller.controller import Controller
+from fetcher.fetcher import Fetcher
+
+
+def getFingerprint(fetcher: Fetcher, analyzer: Analyzer) -> str:
+    """Get a digest of the source and analyzer settings a journaled state depends on.
+    """
+    config = {
+        "fetcher": type(fetcher).__name__,
+        "fetcherConfig": fetcher.getConfig(),
+        "analyzer": type(analyzer).__name__,
+        "analyzerConfig": analyzer.getConfig(),
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+class ProgressJournal:
+    def __init__(self, dirPath: str) -> None:
+        """Persist analyzer states of fully fetched and analyzed time chunks.
+
+        Each chunk is stored in its own json file, written atomically, so a crash
+        never leaves a half written chunk behind.
+
+        Args:
+            dirPath (str): Directory holding the journal, one per job.
+        """
+        self.dirPath = dirPath
+        os.makedirs(dirPath, exist_ok=True)
+
+    def _getPath(self, startTime: datetime, endTime: datetime) -> str:
+        name = f"{int(startTime.timestamp())}-{int(endTime.timestamp())}.json"
+        return os.path.join(self.dirPath, name)
+
+    def getState(
+        self,
+        analyzerName: str,
+        fingerprint: str,
+        startTime: datetime,
+        endTime: datetime,
+    ) -> Optional[dict[str, Any]]:
+        """Get the analyzer state recorded for a chunk.
+
+        Args:
+            fingerprint (str): Digest of the source and analyzer settings, see
+                getFingerprint.
+
+        Returns:
+            Optional[dict[str, Any]]: The state, None if the chunk was not completed
+                by an analyzer of the same name and fingerprint.
+        """
+        try:
+            with open(self._getPath(startTime, endTime)) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        if (
+            entry.get("analyzer") != analyzerName
+            or entry.get("fingerprint") != fingerprint
+        ):
+            return None
+        return entry["state"]
+
+    def putState(
+        self,
+        analyzerName: str,
+        fingerprint: str,
+        startTime: datetime,
+        endTime: datetime,
+        state: dict[str, Any],
+    ) -> None:
+        """Record a completed chunk and the analyzer state for it.
+        """
+        path = self._getPath(startTime, endTime)
+        tmpPath = path + ".tmp"
+        entry = {
+            "analyzer": analyzerName,
+            "fingerprint": fingerprint,
+            "from": startTime.isoformat(),
+            "until": endTime.isoformat(),
+            "state": state,
+        }
+        with open(tmpPath, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmpPath, path)
+
+
+class IncrementalController:
+    CHUNK_SECS = 24 * 60 * 60  # default journal granularity
+    # default wait after a chunk closed before journaling it, for late indexed events
+    SETTLE_SECS = 15 * 60
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        fetcher: Fetcher,
+        analyzer: Analyzer,
+        startTime: datetime,
+        endTime: datetime,
+        journal: ProgressJournal,
+        chunkSecs: int = CHUNK_SECS,
+        settleSecs: int = SETTLE_SECS,
+        analyzeWorkers: int = 0,
+    ):
+        """Run analysis chunk by chunk, reusing chunks completed by earlier runs.
+
+        The time range is cut on a grid of chunkSecs aligned to the unix epoch.  Each
+        chunk is analyzed by a partial analyzer (see Analyzer.newPartial) whose state
+        is journaled once the chunk is complete, then merged into analyzer.  Chunks
+        only partly inside the range or closed less than settleSecs ago are always
+        fetched and never journaled, so align startTime to the grid to reuse every
+        chunk.  Journaled chunks are only reused by a job with the same source and
+        analyzer settings.
+
+        Args:
+            journal (ProgressJournal): Journal of completed chunks.
+            chunkSecs (int, optional): Chunk length in seconds. Defaults to one day.
+            settleSecs (int, optional): Delay for late events. Defaults to 15 minutes.
+            analyzeWorkers (int, optional): Analyze each chunk in this many worker
+                processes, see Controller. Defaults to 0, analyzing inline.
+        """
+        self.logger = logger
+        self.fetcher = fetcher
+        self.analyzer = analyzer
+        self.startTime = startTime
+        self.endTime = endTime
+        self.journal = journal
+        self.chunkSecs = chunkSecs
+        self.settleSecs = settleSecs
+        self.analyzeWorkers = analyzeWorkers
+
+    async def run(self):
+        await self.collect()
+        self.analyzer.dumpResult()
+
+    async def collect(self) -> None:
+        """Analyze every chunk of the time range without dumping the result.
+        """
+        analyzerName = type(self.analyzer).__name__
+        fingerprint = getFingerprint(self.fetcher, self.analyzer)
+        settledTime = datetime.now(timezone.utc) - timedelta(seconds=self.settleSecs)
+        fetched = 0
+        for chunkStart, chunkEnd, isFullChunk in self._getChunks():
+            isJournaled = isFullChunk and chunkEnd <= settledTime
+            if isJournaled:
+                state = await asyncio.to_thread(
+                    self.journal.getState,
+                    analyzerName,
+                    fingerprint,
+                    chunkStart,
+                    chunkEnd,
+                )
+                if state is not None:
+                    self.logger.info(f"reusing journaled chunk {chunkStart}, {chunkEnd}")
+                    self.analyzer.mergeState(state)
+                    continue
+
+            partial = self.analyzer.newPartial()
+            controller = Controller(
+                self.logger,
+                self.fetcher,
+                partial,
+                chunkStart,
+                chunkEnd,
+                analyzeWorkers=self.analyzeWorkers,
+            )
+            await controller.collect()
+            fetched += 1
+            state = partial.getState()
+            if self.fetcher.failedRanges:
+                # rerun the chunk next time rather than journal incomplete data
+                self.logger.error(f"chunk {chunkStart}, {chunkEnd} is incomplete")
+            elif isJournaled:
+                await asyncio.to_thread(
+                    self.journal.putState,
+                    analyzerName,
+                    fingerprint,
+                    chunkStart,
+                    chunkEnd,
+                    state,
+                )
+            self.analyzer.mergeState(state)
+        self.logger.info(f"incremental analysis completed, fetched {fetched} chunks")
+
+    def _getChunks(self) -> list[tuple[datetime, datetime, bool]]:
+        """Cut the time range on the chunk grid.
+
+        Returns:
+            list[tuple[datetime, datetime, bool]]: Start, end and whether the chunk
+                covers a whole grid cell.
+        """
+        chunks = []
+        start = self.startTime
+        while start < self.endTime:
+            startSecs = start.timestamp()
+            gridStart = startSecs - startSecs % self.chunkSecs
+            gridEnd = datetime.fromtimestamp(
+                gridStart + self.chunkSecs, tz=timezone.utc
+            )
+            end = min(gridEnd, self.endTime)
+            chunks.append((start, end, startSecs == gridStart and end == gridEnd))
+            start = end
+        return chunks
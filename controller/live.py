@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from analyzer.analyzer import Analyzer
+from controller.controller import Controller
+from fetcher.fetcher import Fetcher
+
+
+class LiveController:
+    WINDOW_SECS = 60 * 60  # default window length
+    SETTLE_SECS = 5 * 60  # default wait for late events before fetching a pane
+    RETRY_SECS = 60  # wait before fetching a pane again after a failure
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        fetcher: Fetcher,
+        analyzer: Analyzer,
+        windowSecs: int = WINDOW_SECS,
+        slideSecs: Optional[int] = None,
+        settleSecs: int = SETTLE_SECS,
+        startTime: Optional[datetime] = None,
+        onWindow: Optional[Callable[[datetime, datetime, Analyzer], None]] = None,
+        onPane: Optional[Callable[[datetime, datetime, Analyzer], None]] = None,
+    ):
+        """Continuously analyze newly closed time windows.
+
+        Time is cut into panes of slideSecs aligned to the unix epoch.  Each pane is
+        fetched once it closed and settleSecs passed, and analyzed by a partial
+        analyzer (see Analyzer.newPartial).  Only the states of the panes of the
+        latest window are kept, so memory stays constant however long it runs.
+        After every pane, the window of the last windowSecs is merged from the pane
+        states and emitted.  Windows overlap when sliding, so per time bucket output
+        such as rollups belongs in onPane, which sees every event once.
+
+        Args:
+            analyzer (Analyzer): Template of the pane and window analyzers.
+            windowSecs (int, optional): Window length. Defaults to one hour.
+            slideSecs (Optional[int], optional): Window step, dividing windowSecs.
+                Defaults to windowSecs, i.e. tumbling windows.
+            settleSecs (int, optional): Delay for late events. Defaults to 5 minutes.
+            startTime (Optional[datetime], optional): Start of the first window,
+                aligned down to the pane grid. Defaults to the latest closed window.
+            onWindow (Optional[Callable[[datetime, datetime, Analyzer], None]],
+                optional): Called with the start, end and analyzer of each window.
+                Defaults to logging the window and calling dumpResult.
+            onPane (Optional[Callable[[datetime, datetime, Analyzer], None]],
+                optional): Called with the start, end and analyzer of each pane once
+                it is complete. Defaults to None.
+        """
+        slideSecs = slideSecs or windowSecs
+        if windowSecs % slideSecs:
+            raise Exception(f"slideSecs {slideSecs} does not divide {windowSecs}")
+        self.logger = logger
+        self.fetcher = fetcher
+        self.analyzer = analyzer
+        self.windowSecs = windowSecs
+        self.slideSecs = slideSecs
+        self.settleSecs = settleSecs
+        self.onWindow = onWindow or self._dumpWindow
+        self.onPane = onPane
+        if startTime is None:
+            startTime = self._getNow() - timedelta(seconds=settleSecs + windowSecs)
+        self.paneStart = self._alignTime(startTime)
+        # states of the latest panes, the oldest evicted as new ones come in
+        self.panes = deque(maxlen=windowSecs // slideSecs)
+
+    def _getNow(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def _alignTime(self, time: datetime) -> datetime:
+        secs = time.timestamp()
+        return datetime.fromtimestamp(secs - secs % self.slideSecs, tz=timezone.utc)
+
+    def _dumpWindow(self, startTime: datetime, endTime: datetime, analyzer: Analyzer) -> None:
+        self.logger.info(f"=== window {startTime} to {endTime} ===")
+        analyzer.dumpResult()
+
+    async def run(self, maxWindows: Optional[int] = None) -> None:
+        """Analyze panes as they close and emit their windows.
+
+        Args:
+            maxWindows (Optional[int], optional): Stop after this many windows.
+                Defaults to None, running until cancelled.
+        """
+        emitted = 0
+        while maxWindows is None or emitted < maxWindows:
+            paneEnd = self.paneStart + timedelta(seconds=self.slideSecs)
+            waitSecs = (
+                paneEnd + timedelta(seconds=self.settleSecs) - self._getNow()
+            ).total_seconds()
+            if waitSecs > 0:
+                await asyncio.sleep(waitSecs)
+                continue
+            if not await self._analyzePane(self.paneStart, paneEnd):
+                await asyncio.sleep(self.RETRY_SECS)
+                continue
+            self.paneStart = paneEnd
+            if len(self.panes) == self.panes.maxlen:
+                self._emitWindow(paneEnd)
+                emitted += 1
+
+    async def _analyzePane(self, startTime: datetime, endTime: datetime) -> bool:
+        """Fetch and analyze one pane, adding its state to panes.
+
+        Returns:
+            bool: False if the pane is incomplete and has to be fetched again.
+        """
+        partial = self.analyzer.newPartial()
+        await Controller(self.logger, self.fetcher, partial, startTime, endTime).collect()
+        if self.fetcher.failedRanges:
+            self.logger.error(f"pane {startTime}, {endTime} is incomplete, retrying")
+            return False
+        if self.onPane:
+            self.onPane(startTime, endTime, partial)
+        self.panes.append(partial.getState())
+        return True
+
+    def _emitWindow(self, endTime: datetime) -> None:
+        window = self.analyzer.newPartial()
+        for state in self.panes:
+            window.mergeState(state)
+        startTime = endTime - timedelta(seconds=self.windowSecs)
+        self.onWindow(startTime, endTime, window)
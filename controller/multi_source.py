@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from analyzer.analyzer import Analyzer
+from controller.controller import Controller
+from fetcher.fetcher import Fetcher
+
+
+class MultiSourceController(Controller):
+    def __init__(
+        self,
+        logger: logging.Logger,
+        fetchers: list[Fetcher],
+        analyzer: Analyzer,
+        startTime: datetime,
+        endTime: datetime,
+        **kwargs,
+    ):
+        """Fetch from several fetchers concurrently into one analyzer.
+
+        Fetchers may share a result queue or have their own.  The analysis ends once
+        every fetcher signalled completion, and dumpResult runs once.
+
+        Args:
+            fetchers (list[Fetcher]): Sources to fetch from.
+            kwargs: Other Controller arguments.
+        """
+        super().__init__(logger, fetchers[0], analyzer, startTime, endTime, **kwargs)
+        self.fetchers = fetchers
+        for fetcher in fetchers[1:]:
+            fetcher.setFieldPaths(analyzer.getFieldPaths())
+
+    async def collect(self) -> None:
+        self.logger.info(
+            f"=== Run analysis of {len(self.fetchers)} sources "
+            f"from {self.startTime} to {self.endTime} ==="
+        )
+        # one analysis loop per distinct queue, expecting a sentinel per source
+        queueFetchers = {}
+        for fetcher in self.fetchers:
+            queueFetchers.setdefault(id(fetcher.resultQueue), []).append(fetcher)
+        await asyncio.gather(
+            *[self._fetch(fetcher) for fetcher in self.fetchers],
+            *[
+                self._analyze(fetchers[0], len(fetchers))
+                for fetchers in queueFetchers.values()
+            ],
+        )
+
+    async def _fetch(self, fetcher: Fetcher) -> None:
+        await fetcher.fetch(self.startTime, self.endTime)
+        remaining = sum(not f.isFinished() for f in self.fetchers)
+        self.logger.info(
+            f"source {type(fetcher).__name__} finished, {remaining} remaining"
+        )
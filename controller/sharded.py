@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable
+
+from analyzer.analyzer import Analyzer
+from controller.controller import Controller
+from fetcher.fetcher import Fetcher
+
+
+def _runShard(
+    fetcherFactory: Callable[..., Fetcher],
+    analyzer: Analyzer,
+    fetcherArgs: dict[str, Any],
+    startTime: datetime,
+    endTime: datetime,
+) -> dict[str, Any]:
+    """Fetch and analyze one shard in a worker process.
+
+    Returns:
+        dict[str, Any]: State of the partial analyzer.
+    """
+    logger = logging.getLogger(__name__)
+
+    async def runShard() -> dict[str, Any]:
+        fetcher = fetcherFactory(Fetcher.newQueue(), **fetcherArgs)
+        controller = Controller(logger, fetcher, analyzer, startTime, endTime)
+        await controller.collect()
+        return analyzer.getState()
+
+    return asyncio.run(runShard())
+
+
+class ShardedController:
+    def __init__(
+        self,
+        logger: logging.Logger,
+        fetcherFactory: Callable[..., Fetcher],
+        analyzer: Analyzer,
+        startTime: datetime,
+        endTime: datetime,
+        workers: int = os.cpu_count() or 1,
+    ):
+        """Run fetcher and analyzer pairs over shards of the data in a process pool.
+
+        Each shard is analyzed by a partial analyzer (see Analyzer.newPartial) and
+        the partial states are merged into analyzer before dumpResult.
+
+        Args:
+            fetcherFactory (Callable[..., Fetcher]): Picklable callable building a
+                fetcher from a result queue and shard keyword arguments, e.g.
+                functools.partial(BodyErrorFetcher, logger, filePath=csvFile).
+            analyzer (Analyzer): Analyzer receiving the merged result.
+            workers (int, optional): Number of worker processes. Defaults to cpu count.
+        """
+        self.logger = logger
+        self.fetcherFactory = fetcherFactory
+        self.analyzer = analyzer
+        self.startTime = startTime
+        self.endTime = endTime
+        self.workers = workers
+
+    async def run(self):
+        await self.collect()
+        self.analyzer.dumpResult()
+
+    async def collect(self) -> None:
+        """Analyze all shards and merge their states without dumping the result.
+        """
+        fetcher = self.fetcherFactory(Fetcher.newQueue())
+        shards = await asyncio.to_thread(
+            fetcher.getShards, self.startTime, self.endTime, self.workers
+        )
+        self.logger.info(
+            f"=== Run sharded analysis of {len(shards)} shards "
+            f"from {self.startTime} to {self.endTime} ==="
+        )
+        partial = self.analyzer.newPartial()
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                loop.run_in_executor(
+                    pool, _runShard, self.fetcherFactory, partial, args, start, end
+                )
+                for args, start, end in shards
+            ]
+            for future in asyncio.as_completed(futures):
+                self.analyzer.mergeState(await future)
+        self.logger.info("sharded analysis completed")
@@ -1,3 +1,5 @@
+from typing import Sequence
+
 from fetcher.csv_fetcher import CsvFetcher
 
 
@@ -9,10 +11,11 @@ class BodyError:
 
 
 class BodyErrorFetcher(CsvFetcher[BodyError]):
-    def getLineData(self, line: dict[str, str]) -> BodyError:
-        date = line.get("Date", "")
-        attributeError = line.get("@Body.Attributes.metadata.error", "")
-        bodyMessage = line.get("@Body.message", "")
+    COLUMNS = ("Date", "@Body.Attributes.metadata.error", "@Body.message")
+    DATE_COLUMN = "Date"
+
+    def getLineData(self, fields: Sequence[str]) -> BodyError:
+        date, attributeError, bodyMessage = fields
         return BodyError(
             date,
             attributeError,
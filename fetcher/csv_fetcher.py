@@ -1,25 +1,214 @@
 import abc
 import asyncio
+import bz2
+import contextlib
 import csv
+import glob
+import gzip
+import io
+import itertools
 import logging
-from datetime import datetime
-from typing import Generic, TypeVar
+import lzma
+import mmap
+import os
+import sys
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Generic,
+    Iterator,
+    Optional,
+    Sequence,
+    TypeVar,
+)
 
+from fetcher.date_index import (
+    DATE_INDEX_SUFFIX,
+    getDate,
+    getDateIndex,
+    getDateRanges,
+    getUtcTime,
+    parseTime,
+)
 from fetcher.fetcher import Fetcher
 
 T = TypeVar("T")
 
+MISSING_COLUMN = sys.maxsize  # index used for columns absent from the header
+SCAN_BLOCK_SIZE = 1 << 20  # bytes read at a time when looking for record boundaries
+# stream decompressing openers by file extension
+COMPRESSED_OPENERS: dict[str, Callable[[str], BinaryIO]] = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+    ".lzma": lzma.open,
+}
+
+
+def isCompressed(filePath: str) -> bool:
+    return os.path.splitext(filePath)[1] in COMPRESSED_OPENERS
+
+
+def isCsvFile(filePath: str) -> bool:
+    root, ext = os.path.splitext(filePath)
+    if ext in COMPRESSED_OPENERS:
+        root, ext = os.path.splitext(root)
+    return ext == ".csv"
+
+
+def openCsvFile(filePath: str) -> BinaryIO:
+    """Open a csv file for binary reading, decompressing it on the fly when its
+    extension is one of COMPRESSED_OPENERS.
+    """
+    opener = COMPRESSED_OPENERS.get(os.path.splitext(filePath)[1], open)
+    return opener(filePath, "rb")
+
+
+def getInputFiles(filePath: str) -> list[str]:
+    """Resolve a csv input to the files it names.
+
+    Args:
+        filePath (str): A file, a directory of .csv files, optionally compressed, or a
+            glob pattern.
+
+    Returns:
+        list[str]: Sorted file paths.
+    """
+    if os.path.isdir(filePath):
+        filePaths = [
+            entry.path
+            for entry in os.scandir(filePath)
+            if entry.is_file() and isCsvFile(entry.name)
+        ]
+    elif glob.has_magic(filePath):
+        filePaths = [
+            path
+            for path in glob.glob(filePath)
+            if os.path.isfile(path) and not path.endswith(DATE_INDEX_SUFFIX)
+        ]
+    else:
+        return [filePath]
+    if not filePaths:
+        raise Exception(f"no csv files found at {filePath}")
+    return sorted(filePaths)
+
+
+def iterMappedLines(mm: mmap.mmap, start: int, end: int) -> Iterator[str]:
+    """Yield decoded lines of a memory mapped file in [start, end).
+
+    Lines are decoded a block at a time straight from the mapping, avoiding a read
+    call and a bytes copy per line.  Pages of decoded blocks are released so the
+    mapping does not grow the resident set to the file size.
+
+    Args:
+        mm (mmap.mmap): Mapped file.
+        start (int): Offset of the first line.
+        end (int): Offset to stop at.
+    """
+    canRelease = hasattr(mmap, "MADV_DONTNEED")
+    if canRelease:
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    pos = start
+    released = start - start % mmap.PAGESIZE
+    while pos < end:
+        blockEnd = mm.find(b"\n", min(pos + SCAN_BLOCK_SIZE, end) - 1, end)
+        blockEnd = end if blockEnd < 0 else blockEnd + 1
+        text = mm[pos:blockEnd].decode("utf-8")
+        pos = blockEnd
+        if canRelease:
+            releaseEnd = pos - pos % mmap.PAGESIZE
+            if releaseEnd > released:
+                mm.madvise(mmap.MADV_DONTNEED, released, releaseEnd - released)
+                released = releaseEnd
+        yield from io.StringIO(text, newline="\n")
+
+
+def splitCsvRanges(filePath: str, parts: int) -> list[tuple[int, int]]:
+    """Split a csv file into byte ranges that each start and end on a record boundary.
+
+    A newline only ends a record when it is outside a quoted field, i.e. when an
+    even number of quote characters precede it, so the file is scanned once
+    counting quotes.  The header record is excluded from the ranges.
+
+    Args:
+        filePath (str): Csv file path.
+        parts (int): Desired number of ranges.
+
+    Returns:
+        list[tuple[int, int]]: Non empty [start, end) byte ranges covering all data rows.
+    """
+    size = os.path.getsize(filePath)
+    # the first target is 0 so the first boundary found is the end of the header
+    targets = [size * i // parts for i in range(parts)]
+    boundaries = []
+    inQuotes = False
+    offset = 0
+    with open(filePath, "rb") as f:
+        while targets:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            pos = 0  # quotes in the block are counted up to here
+            while targets:
+                newline = block.find(b"\n", max(targets[0] - offset, pos))
+                if newline < 0:
+                    break
+                inQuotes ^= block.count(b'"', pos, newline) % 2 == 1
+                pos = newline + 1
+                if not inQuotes:
+                    boundary = offset + newline + 1
+                    boundaries.append(boundary)
+                    while targets and targets[0] < boundary:
+                        targets.pop(0)
+            inQuotes ^= block.count(b'"', pos) % 2 == 1
+            offset += len(block)
+    if not boundaries:
+        return []
+    boundaries = sorted(set(boundaries + [size]))
+    return [r for r in zip(boundaries, boundaries[1:]) if r[0] < r[1]]
+
 
 class CsvFetcher(Fetcher, Generic[T]):
+    # columns getLineData needs, in the order they are passed to it
+    COLUMNS: tuple[str, ...] = ()
+    # column of the record times, one of COLUMNS, when set bounded fetches return
+    # only the records in range, seeking to their days with a date index
+    DATE_COLUMN: Optional[str] = None
+
     def __init__(
         self,
         logger: logging.Logger,
         resultQueue: asyncio.Queue,
         filePath: str,
+        batchSize: int = Fetcher.BATCH_SIZE,
+        byteRange: Optional[tuple[int, int]] = None,
     ) -> None:
-        super().__init__(logger, resultQueue)
+        """Instantiate a csv fetcher.
+
+        Args:
+            filePath (str): Csv file with a header row, a directory of such files or a
+                glob pattern, see getInputFiles.  Files ending in .gz, .bz2, .xz or
+                .lzma are decompressed while reading.
+            batchSize (int, optional): Max records per batch. Defaults to 1000.
+            byteRange (Optional[tuple[int, int]], optional): Only read records in this
+                [start, end) byte range of a single uncompressed file, as produced by
+                splitCsvRanges. Defaults to None.
+
+        When DATE_COLUMN is set, a fetch of a time range other than datetime.min to
+        datetime.max returns only the records timed within the range, naive times
+        taken as utc, of files that have the column.  Uncompressed files are only read
+        in the utc days overlapping the range, whose byte ranges are looked up in a
+        sidecar <file>.dateidx.json index, built on the first such fetch and rebuilt
+        once the file size or mtime changes.
+        """
+        super().__init__(logger, resultQueue, batchSize=batchSize)
         self.logger = logger
         self.filePath = filePath
+        self.filePaths = getInputFiles(filePath)
+        self.byteRange = byteRange
         # increase csv field size limit so it works with large data fields
         csv.field_size_limit(100000000)
 
@@ -28,15 +217,177 @@ class CsvFetcher(Fetcher, Generic[T]):
         startTime: datetime,
         endTime: datetime,
     ) -> None:
-        with open(self.filePath) as f:
-            csv_reader = csv.DictReader(f)
-
-            for line in csv_reader:
-                lineData = self.getLineData(line)
-                self.logger.info(f"putting data {lineData}")
-                await self.resultQueue.put(lineData)
+        # file reads, decompression and csv parsing run in a worker thread, one batch
+        # at a time, reading the next batch while the current one is handed over
+        batches = self._iterBatches(startTime, endTime)
+        nextBatch = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+        try:
+            while True:
+                batch = await nextBatch
+                if batch is None:
+                    break
+                nextBatch = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+                await self.putBatch(batch)
+        finally:
+            if not nextBatch.done():
+                await asyncio.wait([nextBatch])
+            await asyncio.to_thread(batches.close)
         await self.done()
 
+    def getConfig(self) -> dict[str, Any]:
+        return {"filePaths": self.filePaths, "byteRange": self.byteRange}
+
+    def getShards(
+        self, startTime: datetime, endTime: datetime, count: int
+    ) -> list[tuple[dict[str, Any], datetime, datetime]]:
+        """Get a shard per file, or byte range shards of a single uncompressed file.
+        """
+        if len(self.filePaths) > 1 or isCompressed(self.filePaths[0]):
+            return [({"filePath": path}, startTime, endTime) for path in self.filePaths]
+        return [
+            ({"byteRange": byteRange}, startTime, endTime)
+            for byteRange in splitCsvRanges(self.filePaths[0], count)
+        ]
+
+    def _iterBatches(self, startTime: datetime, endTime: datetime) -> Iterator[list[T]]:
+        """Read all input files in batches of up to batchSize records.
+
+        Uncompressed files are memory mapped, compressed ones decompressed as a stream.
+        """
+        isAll = startTime == datetime.min and endTime == datetime.max
+        isBounded = self.DATE_COLUMN and not isAll
+        timeRange = (getUtcTime(startTime), getUtcTime(endTime)) if isBounded else None
+        for filePath in self.filePaths:
+            with contextlib.ExitStack() as stack:
+                f = stack.enter_context(openCsvFile(filePath))
+                indices = self._getColumnIndices(csv.reader(self._iterLines(f)))
+                # files without the date column are read whole, as by _getDateRanges
+                fileTimeRange = timeRange
+                if isBounded and indices[self._getDateField()] == MISSING_COLUMN:
+                    fileTimeRange = None
+                start, end = self.byteRange or (f.tell(), sys.maxsize)
+                if isCompressed(filePath):
+                    lines = self._iterLines(f, end)
+                else:
+                    end = min(end, os.fstat(f.fileno()).st_size)
+                    if start >= end:
+                        continue
+                    ranges = [(start, end)]
+                    if isBounded:
+                        ranges = self._getDateRanges(
+                            filePath, startTime, endTime, start, end
+                        )
+                        if not ranges:
+                            continue
+                    mm = stack.enter_context(
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    )
+                    lines = itertools.chain.from_iterable(
+                        iterMappedLines(mm, s, e) for s, e in ranges
+                    )
+                rows = csv.reader(lines)
+                while batch := self._readBatch(rows, indices, fileTimeRange):
+                    yield batch
+
+    def _getDateField(self) -> int:
+        return self.COLUMNS.index(self.DATE_COLUMN)
+
+    def _getDateRanges(
+        self, filePath: str, startTime: datetime, endTime: datetime, start: int, end: int
+    ) -> list[tuple[int, int]]:
+        """Get the byte ranges within [start, end) of the records of the days from
+        startTime to endTime, all of it when the file has no DATE_COLUMN.
+        """
+        runs, isBuilt = getDateIndex(filePath, self.DATE_COLUMN)
+        if runs is None:
+            return [(start, end)]
+        if isBuilt:
+            self.logger.info(f"indexed {len(runs)} date runs of {filePath}")
+        # the range end is exclusive, a range ending at midnight excludes that day
+        endDate = getDate(endTime - timedelta(microseconds=1))
+        ranges = getDateRanges(runs, getDate(startTime), endDate)
+        clipped = [(max(s, start), min(e, end)) for s, e in ranges]
+        return [(s, e) for s, e in clipped if s < e]
+
+    def _iterLines(self, f: BinaryIO, end: int = sys.maxsize) -> Iterator[str]:
+        """Yield decoded lines from the current position of f until byte offset end.
+
+        Args:
+            f (BinaryIO): File opened in binary mode.
+            end (int, optional): Stop once this offset is reached. Defaults to end of file.
+        """
+        pos = f.tell()
+        readline = f.readline
+        while pos < end:
+            line = readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode("utf-8")
+
+    def _getColumnIndices(self, rows: Iterator[list[str]]) -> list[int]:
+        """Map COLUMNS to their positions in the csv header.
+
+        Args:
+            rows (Iterator[list[str]]): Csv reader positioned at the header row.
+
+        Returns:
+            list[int]: Position of each column, MISSING_COLUMN if not in the header.
+        """
+        header = next(rows, [])
+        positions = {name: i for i, name in enumerate(header)}
+        return [positions.get(name, MISSING_COLUMN) for name in self.COLUMNS]
+
+    def _readBatch(
+        self,
+        rows: Iterator[list[str]],
+        indices: list[int],
+        timeRange: Optional[tuple[datetime, datetime]] = None,
+    ) -> list[T]:
+        """Read up to batchSize rows, keeping only the COLUMNS fields of each row.
+
+        Args:
+            rows (Iterator[list[str]]): Csv reader.
+            indices (list[int]): Column positions from _getColumnIndices.
+            timeRange (Optional[tuple[datetime, datetime]], optional): Aware
+                [start, end) range, rows whose DATE_COLUMN time is outside it or
+                invalid are skipped. Defaults to None, keeping every row.
+
+        Returns:
+            list[T]: Records built by getLineData, empty at end of file.
+        """
+        getFields = itemgetter(*indices) if len(indices) > 1 else None
+        if timeRange:
+            startTime, endTime = timeRange
+            dateField = self._getDateField()
+        batch = []
+        for row in rows:
+            if not any(row):
+                # blank line or only empty fields, skipped as DictReader does
+                continue
+            try:
+                fields = getFields(row)
+            except (IndexError, TypeError):
+                # short row, missing column or single column projection
+                rowLen = len(row)
+                fields = [row[i] if i < rowLen else "" for i in indices]
+            if timeRange:
+                time = parseTime(fields[dateField])
+                if time is None or not startTime <= time < endTime:
+                    continue
+            batch.append(self.getLineData(fields))
+            if len(batch) >= self.batchSize:
+                break
+        return batch
+
     @abc.abstractclassmethod
-    def getLineData(self, line: dict[str, str]) -> T:
+    def getLineData(self, fields: Sequence[str]) -> T:
+        """Build a record from one csv row.
+
+        Args:
+            fields (Sequence[str]): Values of COLUMNS in order, "" when absent.
+
+        Returns:
+            T: The record.
+        """
         pass
@@ -1,3 +1,5 @@
+from typing import Sequence
+
 from fetcher.csv_fetcher import CsvFetcher
 
 
@@ -8,9 +10,12 @@ class DailyTotal:
 
 
 class DailyTotalFetcher(CsvFetcher[DailyTotal]):
-    def getLineData(self, line: dict[str, str]) -> DailyTotal:
-        date = line.get("time", "")
-        total = int(line.get("value", "0"))
+    COLUMNS = ("time", "value")
+    DATE_COLUMN = "time"
+
+    def getLineData(self, fields: Sequence[str]) -> DailyTotal:
+        date, value = fields
+        total = int(value or "0")
         return DailyTotal(
             date,
             total
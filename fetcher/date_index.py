@@ -0,0 +1,143 @@
+import contextlib
+import csv
+import json
+import os
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+DATE_INDEX_SUFFIX = ".dateidx.json"  # sidecar file next to the indexed csv file
+DATE_LENGTH = len("2023-09-08")
+
+
+def getIndexPath(filePath: str) -> str:
+    return filePath + DATE_INDEX_SUFFIX
+
+
+def getDate(time: datetime) -> str:
+    """Get the utc date of a time, as the csv files have it, naive times as is.
+    """
+    if time.tzinfo:
+        time = time.astimezone(timezone.utc)
+    return time.date().isoformat()
+
+
+def getUtcTime(time: datetime) -> datetime:
+    """Get an aware time, naive times taken as utc as in getDate.
+    """
+    return time if time.tzinfo else time.replace(tzinfo=timezone.utc)
+
+
+def parseTime(value: str) -> Optional[datetime]:
+    """Parse the iso time or date of a csv record, optionally quoted as buildDateIndex
+    takes it, None when it is not one.
+    """
+    value = value.strip('"')
+    # fromisoformat only takes a "Z" offset from python 3.11 on
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        return getUtcTime(datetime.fromisoformat(value))
+    except ValueError:
+        return None
+
+
+def buildDateIndex(filePath: str, column: str) -> Optional[list[list]]:
+    """Scan a csv file for the byte ranges of its runs of records of the same date.
+
+    Args:
+        filePath (str): Uncompressed csv file with a header row.
+        column (str): Column holding the record times, starting with the iso date,
+            optionally quoted.
+
+    Returns:
+        Optional[list[list]]: [date, start, end] runs in file order, the date "" for
+            records without one, None when the header has no such column.
+    """
+    with open(filePath, "rb") as f:
+        pos = 0
+
+        def iterLines() -> Iterator[str]:
+            nonlocal pos
+            for line in f:
+                pos += len(line)
+                yield line.decode("utf-8")
+
+        # the reader pulls lines only until the record is complete, so pos is the
+        # end of the record last read
+        rows = csv.reader(iterLines())
+        header = next(rows, [])
+        if column not in header:
+            return None
+        index = header.index(column)
+        runs = []
+        start = pos
+        for row in rows:
+            date = row[index].strip('"')[:DATE_LENGTH] if index < len(row) else ""
+            if runs and runs[-1][0] == date:
+                runs[-1][2] = pos
+            else:
+                runs.append([date, start, pos])
+            start = pos
+    return runs
+
+
+def getDateIndex(filePath: str, column: str) -> tuple[Optional[list[list]], bool]:
+    """Get the date runs of a csv file from its sidecar index, built and saved when
+    missing or stale, i.e. when the file size or mtime changed since.
+
+    Args:
+        filePath (str): Uncompressed csv file with a header row.
+        column (str): Column holding the record times, see buildDateIndex.
+
+    Returns:
+        tuple[Optional[list[list]], bool]: Runs as in buildDateIndex, and whether the
+            index was built rather than reused.
+    """
+    stat = os.stat(filePath)
+    indexPath = getIndexPath(filePath)
+    try:
+        with open(indexPath) as f:
+            index = json.load(f)
+        if (
+            index["size"] == stat.st_size
+            and index["mtimeNs"] == stat.st_mtime_ns
+            and index["column"] == column
+        ):
+            return index["runs"], False
+    except (OSError, ValueError, KeyError):
+        pass
+    runs = buildDateIndex(filePath, column)
+    index = {
+        "size": stat.st_size,
+        "mtimeNs": stat.st_mtime_ns,
+        "column": column,
+        "runs": runs,
+    }
+    # written whole and renamed, as shards of a file may build its index at once
+    tmpPath = f"{indexPath}.{os.getpid()}"
+    try:
+        with open(tmpPath, "w") as f:
+            json.dump(index, f)
+        os.replace(tmpPath, indexPath)
+    except OSError:
+        # e.g. a read only directory, the index is then rebuilt on every query
+        with contextlib.suppress(OSError):
+            os.remove(tmpPath)
+    return runs, True
+
+
+def getDateRanges(
+    runs: list[list], startDate: str, endDate: str
+) -> list[tuple[int, int]]:
+    """Get the byte ranges of the runs dated within [startDate, endDate], adjacent
+    ranges joined.
+    """
+    ranges = []
+    for date, start, end in runs:
+        if not date or not startDate <= date <= endDate:
+            continue
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
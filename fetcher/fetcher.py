@@ -2,29 +2,65 @@ import abc
 import asyncio
 import datetime
 import logging
-from typing import Any
+from typing import Any, Optional, Sequence
+
+from fetcher.projection import FieldProjector
+from utils.metrics import METRICS
 
 
 class Fetcher:
+    BATCH_SIZE = 1000  # default number of records handed over per queue item
+    QUEUE_SIZE = 16  # default max number of batches waiting in the queue
+
     def __init__(
         self,
         logger: logging.Logger,
         resultQueue: asyncio.Queue,
         maxConcurrency: int = 8,
         maxRetries: int = 3,
+        batchSize: int = BATCH_SIZE,
     ) -> None:
         """Instantiate a fetcher with async Queue.
 
+        Data travels through the queue in batches (lists of records), so the
+        consumer gets one queue item per batch instead of one per record.
+
         Args:
-            resultQueue (asyncio.Queue): Async queue to hold fetched data
+            resultQueue (asyncio.Queue): Async queue to hold fetched data.  Use a
+                bounded queue (see newQueue) to get backpressure from the consumer.
             maxConcurrency (int, optional): Max concurrency. Defaults to 8.
             maxRetries (int, optional): Max retries. Defaults to 3.
+            batchSize (int, optional): Max records per batch. Defaults to 1000.
         """
         self.logger = logger
         self.resultQueue = resultQueue
         self.maxConcurrency = maxConcurrency
         self.maxRetries = maxRetries
+        self.batchSize = batchSize
+        self.pending = []
         self.finished = False
+        # time ranges given up on by the last fetch; their data is incomplete
+        self.failedRanges = []
+        self.projector = None
+        self.fetchedRecords = METRICS.counter(
+            "fetch_records_total", "Records put on the result queue"
+        )
+        self.queueDepth = METRICS.gauge(
+            "queue_depth", "Batches waiting in the result queue"
+        )
+
+    @staticmethod
+    def newQueue(maxSize: int = QUEUE_SIZE) -> asyncio.Queue:
+        """Create a bounded result queue.
+
+        Args:
+            maxSize (int, optional): Max number of batches held in the queue before
+                producers block. Defaults to 16.
+
+        Returns:
+            asyncio.Queue: The result queue.
+        """
+        return asyncio.Queue(maxsize=maxSize)
 
     def isFinished(self) -> bool:
         """Check if data fetch is complete.
@@ -45,13 +81,15 @@ class Fetcher:
         """
         return utcTime.isoformat(timespec="milliseconds").replace("+00:00", "Z")
 
-    async def getData(self) -> Any:
-        """Get data from async queue.
+    async def getData(self) -> Optional[list[Any]]:
+        """Get the next batch of data from async queue.
 
         Returns:
-            Any: Data from async queue.
+            Optional[list[Any]]: Batch of records, or None once fetching is complete.
         """
-        return await self.resultQueue.get()
+        data = await self.resultQueue.get()
+        self.queueDepth.set(self.resultQueue.qsize())
+        return data
 
     @abc.abstractclassmethod
     async def fetch(self, startTime: datetime, endTime: datetime) -> None:
@@ -63,9 +101,79 @@ class Fetcher:
         """
         pass
 
+    def getConfig(self) -> dict[str, Any]:
+        """Get the settings selecting the data fetched, e.g. the query, to tell data
+        of different sources apart.
+
+        Returns:
+            dict[str, Any]: Json serializable settings, empty by default.
+        """
+        return {}
+
+    def setFieldPaths(self, fieldPaths: Sequence[str]) -> None:
+        """Reduce each fetched record to a tuple of the values at fieldPaths before it
+        is queued, so the full record can be freed right after decoding.
+
+        Args:
+            fieldPaths (Sequence[str]): Dot separated paths, no projection if empty.
+        """
+        self.projector = FieldProjector(fieldPaths) if fieldPaths else None
+
+    def getShards(
+        self, startTime: datetime, endTime: datetime, count: int
+    ) -> list[tuple[dict[str, Any], datetime, datetime]]:
+        """Split the fetch into independent shards that can run in separate processes.
+
+        The default splits the time range into count equal parts.
+
+        Args:
+            startTime (datetime): Start time.
+            endTime (datetime): End time.
+            count (int): Desired number of shards.
+
+        Returns:
+            list[tuple[dict[str, Any], datetime, datetime]]: For each shard, keyword
+                arguments to add when constructing its fetcher, and its time range.
+        """
+        span = (endTime - startTime) / count
+        bounds = [startTime + span * i for i in range(count)] + [endTime]
+        return [({}, bounds[i], bounds[i + 1]) for i in range(count)]
+
+    async def putRecord(self, record: Any) -> None:
+        """Buffer a record, handing the buffer over once it reaches batchSize.
+
+        Args:
+            record (Any): A single fetched record.
+        """
+        self.pending.append(record)
+        if len(self.pending) >= self.batchSize:
+            await self.flush()
+
+    async def putBatch(self, batch: list[Any]) -> None:
+        """Put a batch of records onto the async queue, waiting while the queue is full.
+
+        Args:
+            batch (list[Any]): Records to hand over.
+        """
+        if batch:
+            if self.projector:
+                batch = self.projector.projectAll(batch)
+            await self.resultQueue.put(batch)
+            self.fetchedRecords.inc(len(batch))
+            self.queueDepth.set(self.resultQueue.qsize())
+
+    async def flush(self) -> None:
+        """Hand over any buffered records as a final partial batch.
+        """
+        if self.pending:
+            batch = self.pending
+            self.pending = []
+            await self.putBatch(batch)
+
     async def done(self) -> None:
         """Signal fetching of data completed.
         """
+        await self.flush()
         await self.resultQueue.put(None)  # signal all fetching is complete
         self.finished = True
         self.logger.info("=== Finished data Fetch ===")
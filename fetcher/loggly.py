@@ -1,15 +1,34 @@
 import asyncio
+import json
 import logging
-from datetime import datetime, timedelta
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
 
-from aiohttp import ClientSession, TCPConnector
+from aiohttp import ClientError, ClientResponse, ClientSession, TCPConnector
 
 from fetcher.fetcher import Fetcher
+from fetcher.loggly_cache import ResponseCache
+from fetcher.rate_limiter import TokenBucket
+from fetcher.sampling import StratifiedSampler
+from fetcher.window_planner import Window, WindowPlanner
+from utils.logging_config import ThrottledLogger
+from utils.metrics import METRICS, SIZE_BUCKETS
 
 
 class LogglyFetcher(Fetcher):
     MAX_RECORD_SIZE = 1000  # loggly's max fetch size limit
-    FETCH_INTERVAL_SECS = 5 * 60  # loggly data fetch interval
+    # loggly data fetch interval, dense windows are split by their own density
+    FETCH_INTERVAL_SECS = WindowPlanner.MAX_SECS
+    # windows ending longer ago than this are complete in loggly and can be cached
+    CACHE_SETTLE_SECS = 15 * 60
+    REQUESTS_PER_SEC = 10  # default request rate, stay under loggly's api rate limit
+    RETRY_BASE_SECS = 1  # first retry waits up to this long, doubling each retry
+    RETRY_MAX_SECS = 60
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    PAGE_READ_AHEAD = 2  # pages of a chain fetched ahead of their hand off
 
     def __init__(
         self,
@@ -19,7 +38,19 @@ class LogglyFetcher(Fetcher):
         queryParam: str,
         authToken: str,
         sourceGroup: str,
+        cache: Optional[ResponseCache] = None,
+        requestsPerSec: float = REQUESTS_PER_SEC,
+        sampler: Optional[StratifiedSampler] = None,
     ) -> None:
+        """Fetch loggly events of a query.
+
+        Args:
+            cache (Optional[ResponseCache], optional): Cache of settled windows.
+                Defaults to None.
+            requestsPerSec (float, optional): Max api request rate. Defaults to 10.
+            sampler (Optional[StratifiedSampler], optional): Only fetch the sampled
+                time slots. Defaults to None, fetching all events.
+        """
         super().__init__(logger, resultQueue)
         self.logger = logger
         self.baseUri = baseUri  # "http://companyName.loggly.com/apiv2"
@@ -29,8 +60,40 @@ class LogglyFetcher(Fetcher):
         self.headers = {
             "Authorization": "bearer " + authToken,
             "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        }
+        self.intervalSecs = self.FETCH_INTERVAL_SECS
+        self.cache = cache
+        self.requestsPerSec = requestsPerSec
+        self.sampler = sampler
+        self.rateLimiter = None
+        self.windowLog = ThrottledLogger(logger)
+        self.requestSeconds = METRICS.histogram(
+            "loggly_request_seconds", "Latency of loggly api requests"
+        )
+        self.pageSizes = METRICS.histogram(
+            "loggly_page_events", "Events per loggly page", SIZE_BUCKETS
+        )
+        self.requestCnt = METRICS.counter("loggly_requests_total", "Loggly api requests")
+        self.retryCnt = METRICS.counter(
+            "loggly_retries_total", "Loggly api requests retried"
+        )
+        self.cacheHitCnt = METRICS.counter(
+            "loggly_cache_hits_total", "Windows served from the response cache"
+        )
+        self.splitCnt = METRICS.counter(
+            "loggly_split_windows_total", "Dense windows split into sub windows"
+        )
+        self.failedCnt = METRICS.counter(
+            "loggly_failed_windows_total", "Windows given up on after max retries"
+        )
+
+    def getConfig(self) -> dict:
+        return {
+            "baseUri": self.baseUri,
+            "queryParam": self.queryParam,
+            "sourceGroup": self.sourceGroup,
         }
-        self.intervalSecs = self.FETCH_INTERVAL_SECS,
 
     async def _fetchJson(
         self,
@@ -38,65 +101,245 @@ class LogglyFetcher(Fetcher):
         url: str,
         params: dict,
     ):
-        tries = 1
-        while tries < self.maxRetries:
+        for retry in range(self.maxRetries + 1):
+            if retry > 0:
+                self.retryCnt.inc()
+                # exponential backoff with full jitter
+                backoffSecs = min(self.RETRY_MAX_SECS, self.RETRY_BASE_SECS * 2**retry)
+                await asyncio.sleep(random.uniform(0, backoffSecs))
+            await self.rateLimiter.acquire()
+            self.requestCnt.inc()
+            requestStart = time.perf_counter()
             try:
-                resp = await session.get(url=url, params=params)
-                resp.raise_for_status()
-                jsonData = await resp.json()
-                return jsonData
-            except Exception as ex:
-                tries = tries + 1
+                async with session.get(url=url, params=params) as resp:
+                    if resp.status in self.RETRY_STATUSES:
+                        retryAfterSecs = self._getRetryAfterSecs(resp)
+                        self.logger.warning(
+                            f"{resp.status} from {url}, retry after {retryAfterSecs}"
+                        )
+                        if retryAfterSecs is not None:
+                            self.rateLimiter.pause(retryAfterSecs)
+                        continue
+                    resp.raise_for_status()
+                    # decoded from the raw bytes, skipping the text decode and
+                    # content type check of resp.json
+                    jsonData = json.loads(await resp.read())
+                    self.requestSeconds.observe(time.perf_counter() - requestStart)
+                    return jsonData
+            except ClientError as ex:
+                if getattr(ex, "status", 0) in range(400, 500):
+                    # other client errors fail the same way when retried
+                    self.logger.error(ex)
+                    return None
                 self.logger.error(ex)
-                await asyncio.sleep(1)
+            except asyncio.TimeoutError as ex:
+                self.logger.error(f"timeout fetching {url}: {ex}")
+            except ValueError as ex:
+                self.logger.error(f"invalid json from {url}: {ex}")
         return None
 
+    def _getRetryAfterSecs(self, resp: ClientResponse) -> Optional[float]:
+        """Get the delay asked for by a Retry-After header, in seconds or as a date.
+        """
+        retryAfter = resp.headers.get("Retry-After")
+        if not retryAfter:
+            return None
+        try:
+            return max(0.0, float(retryAfter))
+        except ValueError:
+            pass
+        try:
+            retryTime = parsedate_to_datetime(retryAfter)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retryTime - datetime.now(timezone.utc)).total_seconds())
+
     async def _fetchTimeRange(
         self,
         session: ClientSession,
         timeFrom: datetime,
         timeTo: datetime,
-    ) -> None:
+        isSplittable: bool = False,
+    ) -> Optional[list[Optional[float]]]:
+        """Fetch all events of a time range onto the result queue.
+
+        Settled ranges are cached, including whether they were given up on, so a
+        repeated fetch makes no requests.
+
+        Args:
+            isSplittable (bool, optional): Give up, without putting any data, when the
+                range holds more than one page of events. Defaults to False.
+
+        Returns:
+            Optional[list[Optional[float]]]: None if fetched, else [pageSecs] of the
+                range given up on, see _getPageSecs.
+        """
         params = {
             "q": self.queryParam,
             "size": self.MAX_RECORD_SIZE,
             "from": self.getUtcStr(timeFrom),
             "until": self.getUtcStr(timeTo),
         }
+        cacheKey = splitKey = None
+        settleDelta = timedelta(seconds=self.CACHE_SETTLE_SECS)
+        settledTime = datetime.now(timezone.utc) - settleDelta
+        if self.cache and timeTo <= settledTime:
+            keyParts = (self.queryParam, self.sourceGroup, params["from"], params["until"])
+            cacheKey = self.cache.getKey(*keyParts)
+            pages = await asyncio.to_thread(self.cache.get, cacheKey)
+            if pages is not None:
+                self.cacheHitCnt.inc()
+                for events in pages:
+                    await self.putBatch(events)
+                return None
+            if isSplittable:
+                # a range given up on is cached as the one page [[pageSecs]]
+                splitKey = self.cache.getKey(*keyParts, "split")
+                pages = await asyncio.to_thread(self.cache.get, splitKey)
+                if pages is not None:
+                    self.cacheHitCnt.inc()
+                    return pages[0]
+
+        pages = []
+        pageQueue = asyncio.Queue(self.PAGE_READ_AHEAD)
+        reader = asyncio.create_task(
+            self._readPages(session, params, pageQueue, isSplittable)
+        )
+        try:
+            while (jsonData := await pageQueue.get()) is not None:
+                if cacheKey:
+                    pages.append(jsonData["events"])
+                await self._putData(jsonData)
+            firstPage = await reader
+        finally:
+            reader.cancel()
+        if firstPage is not None:
+            split = [self._getPageSecs(firstPage)]
+            if splitKey:
+                await asyncio.to_thread(self.cache.put, splitKey, [split])
+            return split
+        if cacheKey:
+            await asyncio.to_thread(self.cache.put, cacheKey, pages)
+        return None
+
+    def _getPageSecs(self, events: list[dict]) -> Optional[float]:
+        """Get the seconds a full page of events spans, None without timestamps.
+        """
+        try:
+            timestamps = [int(event["timestamp"]) for event in events]
+        except (KeyError, TypeError, ValueError):
+            return None
+        return (max(timestamps) - min(timestamps)) / 1000 if timestamps else None
+
+    async def _readPages(
+        self,
+        session: ClientSession,
+        params: dict,
+        pageQueue: asyncio.Queue,
+        isSplittable: bool,
+    ) -> Optional[list[dict]]:
+        """Fetch the page chain of a query onto pageQueue, followed by None.
+
+        The next page is requested as soon as a page is decoded, while up to
+        PAGE_READ_AHEAD pages wait to be handed off, so the chain takes about a round
+        trip per page however slowly the pages are consumed.
+
+        Returns:
+            Optional[list[dict]]: Events of the first page when given up on a
+                splittable range of more than one page, without putting any page.
+        """
         url = self.baseUri + "events/iterate"
-        while url:
-            jsonData = await self._fetchJson(session, url, params)
-            if jsonData is None:
-                raise Exception("fetching data failed with max tries")
-            await self._putData(jsonData)
-            url = jsonData.get("next", "")
+        isFirst = True
+        try:
+            while url:
+                jsonData = await self._fetchJson(session, url, params)
+                if jsonData is None:
+                    raise Exception("fetching data failed with max tries")
+                url = jsonData.get("next", "")
+                if url and isSplittable and isFirst:
+                    # a page chain walks serially, sub windows can be fetched in
+                    # parallel
+                    await pageQueue.put(None)
+                    return jsonData["events"]
+                isFirst = False
+                await pageQueue.put(jsonData)
+        except Exception:
+            # the consumer reads until None, then gets the exception from the task
+            await pageQueue.put(None)
+            raise
+        await pageQueue.put(None)
+        return None
+
+    async def _fetchWindow(
+        self,
+        session: ClientSession,
+        planner: WindowPlanner,
+        window: Window,
+    ) -> None:
+        self.windowLog.info("fetching %s, %s", window.start, window.end)
+        try:
+            split = await self._fetchTimeRange(
+                session, window.start, window.end, isSplittable=window.level > 0
+            )
+        except Exception as ex:
+            # keep going with the other windows, the caller checks failedRanges
+            self.logger.error(f"giving up on {window.start}, {window.end}: {ex}")
+            self.failedRanges.append((window.start, window.end))
+            self.failedCnt.inc()
+            return
+        if split is not None:
+            self.splitCnt.inc()
+            planner.split(window, split[0])
 
     async def _putData(self, jsonData: dict) -> None:
         events = jsonData["events"]
-        self.logger.info(f"Search data received {len(events)}")
-        await self.resultQueue.put(events)
+        self.pageSizes.observe(len(events))
+        # each loggly page is already a batch of up to MAX_RECORD_SIZE events
+        await self.putBatch(events)
 
     async def fetch(
         self,
         startTime: datetime,
         endTime: datetime,
     ) -> None:
-        start = startTime
-        deltaSecs = timedelta(seconds=self.intervalSecs)
-        tasks = []
+        ranges = None
+        if self.sampler:
+            ranges = self.sampler.getRanges(startTime, endTime)
+            self.logger.info(
+                f"fetching {len(ranges)} sampled ranges of {startTime}, {endTime}"
+            )
+        planner = WindowPlanner(
+            startTime, endTime, self.MAX_RECORD_SIZE, self.intervalSecs, ranges
+        )
+        self.failedRanges = []
+        self.rateLimiter = TokenBucket(self.requestsPerSec, self.maxConcurrency)
+        # windows being fetched; one may still be split into more windows
+        inFlight = 0
+        changed = asyncio.Condition()
+
+        async def fetchWindows(session: ClientSession) -> None:
+            # each worker takes the next window as soon as it is done with one,
+            # so a slow window does not hold up the others
+            nonlocal inFlight
+            while True:
+                async with changed:
+                    await changed.wait_for(lambda: planner.hasPending() or inFlight == 0)
+                    window = planner.next()
+                    if window is None:
+                        return
+                    inFlight += 1
+                try:
+                    await self._fetchWindow(session, planner, window)
+                finally:
+                    async with changed:
+                        inFlight -= 1
+                        changed.notify_all()
+
         tcpConn = TCPConnector(limit=self.maxConcurrency)
         async with ClientSession(headers=self.headers, connector=tcpConn) as session:
-            while start < endTime:
-                end = min(start + deltaSecs, endTime)
-                self.logger.info(f"fetching {start}, {end}")
-                tasks.append(self._fetchTimeRange(session, start, end))
-                start = start + deltaSecs
-                if len(tasks) >= self.maxConcurrency:
-                    await asyncio.gather(*tasks)
-                    self.logger.info(
-                        f"finished batch of {self.maxConcurrency} at {endTime}"
-                    )
-                    tasks = []
-            if len(tasks) > 0:
-                await asyncio.gather(*tasks)
+            await asyncio.gather(
+                *[fetchWindows(session) for _ in range(self.maxConcurrency)]
+            )
+        if self.failedRanges:
+            self.logger.error(f"failed to fetch {len(self.failedRanges)} windows")
         await self.done()
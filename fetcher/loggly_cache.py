@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class ResponseCache:
+    MAX_BYTES = 1 << 30  # default cache size limit, 1 GiB
+    FILE_SUFFIX = ".json.gz"
+
+    def __init__(self, dirPath: str, maxBytes: int = MAX_BYTES) -> None:
+        """On disk cache of the event pages of closed fetch windows.
+
+        Each window is stored as one gzip compressed json file.  When the total size
+        passes maxBytes the least recently used windows are evicted.
+
+        Args:
+            dirPath (str): Cache directory.
+            maxBytes (int, optional): Max total size of cached files. Defaults to 1 GiB.
+        """
+        self.dirPath = dirPath
+        self.maxBytes = maxBytes
+        os.makedirs(dirPath, exist_ok=True)
+        # key -> file size, least recently used first
+        self.entries = OrderedDict()
+        # get and put run in worker threads, the lock guards entries and totalBytes
+        self.lock = threading.Lock()
+        self.totalBytes = 0
+        files = []
+        for name in os.listdir(dirPath):
+            if name.endswith(self.FILE_SUFFIX):
+                stat = os.stat(os.path.join(dirPath, name))
+                files.append((stat.st_mtime, name[: -len(self.FILE_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.totalBytes += size
+
+    @staticmethod
+    def getKey(*parts: str) -> str:
+        """Get the cache key of a window from its query, source group and bounds.
+
+        Returns:
+            str: Cache key.
+        """
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def _getPath(self, key: str) -> str:
+        return os.path.join(self.dirPath, key + self.FILE_SUFFIX)
+
+    def get(self, key: str) -> Optional[list[list[Any]]]:
+        """Get the cached pages of a window.
+
+        Returns:
+            Optional[list[list[Any]]]: Events of each page, None if not cached.
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+        path = self._getPath(key)
+        try:
+            with gzip.open(path, "rb") as f:
+                pages = json.loads(f.read())
+            os.utime(path)
+        except (OSError, ValueError):
+            # evicted by another process or truncated, fetch it again
+            with self.lock:
+                self._remove(key)
+            return None
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        return pages
+
+    def put(self, key: str, pages: list[list[Any]]) -> None:
+        """Cache the pages of a window and evict least recently used windows.
+
+        Args:
+            key (str): Cache key.
+            pages (list[list[Any]]): Events of each page.
+        """
+        path = self._getPath(key)
+        tmpPath = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmpPath, "wb") as f:
+            f.write(json.dumps(pages).encode("utf-8"))
+        size = os.path.getsize(tmpPath)
+        with self.lock:
+            os.replace(tmpPath, path)
+            if key in self.entries:
+                self.totalBytes -= self.entries.pop(key)
+            self.entries[key] = size
+            self.totalBytes += size
+            while self.totalBytes > self.maxBytes and len(self.entries) > 1:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: str) -> None:
+        self.totalBytes -= self.entries.pop(key, 0)
+        try:
+            os.remove(self._getPath(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,49 @@
+from typing import Any, Optional, Sequence
+
+
+class FieldProjector:
+    PRESENCE_SUFFIX = "?"  # ends a path projected to whether its value is non empty
+
+    def __init__(self, fieldPaths: Sequence[str]) -> None:
+        """Reduce nested dict records to tuples of the fields at the given paths.
+
+        Args:
+            fieldPaths (Sequence[str]): Dot separated paths, e.g. "event.json.req.url".
+                A path ending in PRESENCE_SUFFIX, e.g. "event.json.req.queryParams?",
+                is projected to a bool telling whether its value is present and non
+                empty, so the value itself can be freed.
+        """
+        self.fieldPaths = tuple(fieldPaths)
+        self.keyPaths = [
+            tuple(path.removesuffix(self.PRESENCE_SUFFIX).split("."))
+            for path in self.fieldPaths
+        ]
+        self.isPresences = [path.endswith(self.PRESENCE_SUFFIX) for path in fieldPaths]
+
+    def _getValue(self, record: Any, keys: tuple[str, ...]) -> Optional[Any]:
+        for key in keys:
+            if not isinstance(record, dict):
+                return None
+            record = record.get(key)
+        return record
+
+    def project(self, record: Any) -> tuple:
+        """Get the projected values of a record.
+
+        Args:
+            record (Any): Decoded json record.
+
+        Returns:
+            tuple: Value at each field path, None when missing.
+        """
+        getValue = self._getValue
+        if not any(self.isPresences):
+            return tuple(getValue(record, keys) for keys in self.keyPaths)
+        return tuple(
+            bool(getValue(record, keys)) if isPresence else getValue(record, keys)
+            for keys, isPresence in zip(self.keyPaths, self.isPresences)
+        )
+
+    def projectAll(self, records: list[Any]) -> list[tuple]:
+        project = self.project
+        return [project(record) for record in records]
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, ratePerSec: float, burst: int) -> None:
+        """Token bucket limiting the rate of requests shared by concurrent tasks.
+
+        Args:
+            ratePerSec (float): Sustained number of requests per second.
+            burst (int): Max number of requests allowed at once after idling.
+        """
+        self.ratePerSec = ratePerSec
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.pausedUntil = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent.
+        """
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.pausedUntil:
+                    await asyncio.sleep(self.pausedUntil - now)
+                    continue
+                elapsed = now - self.updated
+                self.tokens = min(self.burst, self.tokens + elapsed * self.ratePerSec)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.ratePerSec)
+
+    def pause(self, secs: float) -> None:
+        """Hold off every request for secs, e.g. when the server asks to retry later.
+
+        Args:
+            secs (float): Seconds to pause.
+        """
+        self.pausedUntil = max(self.pausedUntil, time.monotonic() + secs)
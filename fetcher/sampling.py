@@ -0,0 +1,130 @@
+import math
+import random
+from datetime import datetime, timezone
+
+
+class StratifiedSampler:
+    SLOT_SECS = 60 * 60  # time slots sampled as a whole, aligned to the unix epoch
+    Z_95 = 1.96  # normal quantile of 95% confidence intervals
+
+    def __init__(
+        self,
+        startTime: datetime,
+        endTime: datetime,
+        fraction: float,
+        seed: int = 0,
+    ) -> None:
+        """Sample a fraction of the hourly time slots of a range, stratified by
+        weekday and hour of day.
+
+        The slots are ordered by (weekday, hour) in the time zone of startTime, in
+        random order within a stratum, and every 1 / fraction-th slot is taken from
+        a random start, so each stratum is sampled in proportion to its size, even
+        with less than one sampled slot per stratum on average.  Statistics that add
+        up over slots are estimated from the sampled slots with estimate.
+
+        Args:
+            startTime (datetime): Start of the sampled range.
+            endTime (datetime): End of the sampled range.
+            fraction (float): Fraction of slots to sample, in (0, 1].
+            seed (int, optional): Random seed, the same seed samples the same slots
+                of a range. Defaults to 0.
+        """
+        if not 0 < fraction <= 1:
+            raise Exception(f"invalid sampling fraction {fraction}")
+        self.startTime = startTime
+        self.endTime = endTime
+        self.fraction = fraction
+        self.seed = seed
+        rand = random.Random(seed)
+        firstSlot = math.floor(startTime.timestamp() / self.SLOT_SECS)
+        lastSlot = math.ceil(endTime.timestamp() / self.SLOT_SECS)
+        # shuffled first, so the sort leaves the slots of a stratum in random order
+        # rather than picking the same week in every stratum
+        slots = list(range(firstSlot, lastSlot))
+        rand.shuffle(slots)
+        slots.sort(key=self._getStratum)
+        self.slotCnt = len(slots)
+        # systematic sample of the slots in stratum order, kept in that order
+        period = 1 / fraction
+        self.sampledSlots = []
+        position = rand.random() * period
+        while position < self.slotCnt:
+            self.sampledSlots.append(slots[int(position)])
+            position += period
+
+    def _getStratum(self, slot: int) -> tuple[int, int]:
+        slotStart = self.getSlotStart(slot).astimezone(self.startTime.tzinfo)
+        return slotStart.weekday(), slotStart.hour
+
+    def getCoverage(self, slot: int) -> float:
+        """Get the fraction of a slot within the sampled range, below 1 for the first
+        and last slots of a range not aligned to the slot grid.
+        """
+        start = max(slot * self.SLOT_SECS, self.startTime.timestamp())
+        end = min((slot + 1) * self.SLOT_SECS, self.endTime.timestamp())
+        return max(0.0, end - start) / self.SLOT_SECS
+
+    def getSlotStart(self, slot: int) -> datetime:
+        return datetime.fromtimestamp(slot * self.SLOT_SECS, timezone.utc)
+
+    def getSlot(self, timestampMs: float) -> int:
+        """Get the slot of an epoch milliseconds timestamp.
+        """
+        return int(timestampMs // (self.SLOT_SECS * 1000))
+
+    def getRanges(
+        self, startTime: datetime, endTime: datetime
+    ) -> list[tuple[datetime, datetime]]:
+        """Get the sampled time ranges within [startTime, endTime), in time order,
+        adjacent slots joined.
+        """
+        ranges = []
+        for slot in sorted(self.sampledSlots):
+            start = max(self.getSlotStart(slot).astimezone(startTime.tzinfo), startTime)
+            end = min(self.getSlotStart(slot + 1).astimezone(startTime.tzinfo), endTime)
+            if start >= end:
+                continue
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def estimate(self, slotValues: dict[int, float]) -> tuple[float, float]:
+        """Estimate the total of a statistic over all slots from its sampled slots.
+
+        The total is the mean value per covered slot time over the sampled slots,
+        scaled to the time of all slots, so the partly covered first and last slots
+        weigh by their coverage.  The variance of the systematic sample is estimated
+        from the differences of successive sampled slots in stratum order, which
+        like stratification only compares slots of similar weekday and hour.
+
+        Args:
+            slotValues (dict[int, float]): Value per sampled slot, missing for 0.
+
+        Returns:
+            tuple[float, float]: Estimated total and the half width of its 95%
+                confidence interval.
+        """
+        values = [slotValues.get(slot, 0) for slot in self.sampledSlots]
+        coverages = [self.getCoverage(slot) for slot in self.sampledSlots]
+        sampleCnt = len(values)
+        sampledCoverage = sum(coverages)
+        if not sampledCoverage:
+            return 0.0, 0.0
+        # value per whole slot, scaled to the slot time of the range
+        rate = sum(values) / sampledCoverage
+        totalCoverage = (
+            self.endTime.timestamp() - self.startTime.timestamp()
+        ) / self.SLOT_SECS
+        total = rate * totalCoverage
+        if sampleCnt < 2:
+            return total, math.inf if self.slotCnt > 1 else 0.0
+        # deviations from the rate, for whole slots the deviations from the mean
+        residuals = [v - rate * c for v, c in zip(values, coverages)]
+        diffSquares = sum((b - a) ** 2 for a, b in zip(residuals, residuals[1:]))
+        slotVariance = diffSquares / (2 * (sampleCnt - 1))
+        finiteCorrection = 1 - sampleCnt / self.slotCnt
+        variance = self.slotCnt**2 * finiteCorrection * slotVariance / sampleCnt
+        return total, self.Z_95 * math.sqrt(variance)
@@ -0,0 +1,123 @@
+import math
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+
+class Window:
+    __slots__ = ("start", "end", "level")
+
+    def __init__(self, start: datetime, end: datetime, level: int):
+        self.start = start
+        self.end = end
+        # the window lies in one grid cell of MIN_INTERVAL_SECS * 2**level seconds
+        self.level = level
+
+    def __repr__(self) -> str:
+        return f"Window({self.start}, {self.end}, {self.level})"
+
+
+class WindowPlanner:
+    MIN_INTERVAL_SECS = 60  # smallest window
+    MAX_LEVEL = 8  # largest window is MIN_INTERVAL_SECS * 2**8, about 4 hours
+    MAX_SECS = MIN_INTERVAL_SECS * 2**MAX_LEVEL
+    # a dense window of unknown density is split into 2**SPLIT_LEVELS sub windows
+    SPLIT_LEVELS = 2
+
+    def __init__(
+        self,
+        startTime: datetime,
+        endTime: datetime,
+        targetEvents: int,
+        windowSecs: int = MAX_SECS,
+        ranges: Optional[list[tuple[datetime, datetime]]] = None,
+    ) -> None:
+        """Plan fetch windows, splitting dense ones by their own event density.
+
+        Window sizes are powers of two multiples of MIN_INTERVAL_SECS aligned to the
+        unix epoch.  The range is cut into windows of the grid cells of windowSecs,
+        and a window holding more than targetEvents is split by its own density
+        only, never by that of the windows fetched before it.  So the windows of a
+        time range depend on its events alone, not on the order concurrent fetches
+        complete in, and a repeated fetch asks for the same windows, which keeps the
+        response cache effective.
+
+        Args:
+            startTime (datetime): Start time.
+            endTime (datetime): End time.
+            targetEvents (int): Number of events a window should hold, usually one page.
+            windowSecs (int, optional): Size of the windows before splitting, rounded
+                down to a grid level. Defaults to MAX_SECS.
+            ranges (Optional[list[tuple[datetime, datetime]]], optional): Only plan
+                windows within these ordered [start, end) ranges. Defaults to the
+                whole time range.
+        """
+        self.ranges = deque(ranges if ranges is not None else [(startTime, endTime)])
+        # the range being planned
+        self.cursor, self.endTime = (
+            self.ranges.popleft() if self.ranges else (startTime, startTime)
+        )
+        self.targetEvents = targetEvents
+        self.level = self._getLevel(windowSecs)
+        # sub windows of split windows, handed out before new windows
+        self.pending = deque()
+
+    def _getLevel(self, secs: float) -> int:
+        if secs < self.MIN_INTERVAL_SECS * 2:
+            return 0
+        level = int(math.log2(secs / self.MIN_INTERVAL_SECS))
+        return min(level, self.MAX_LEVEL)
+
+    def _getTime(self, timestamp: float) -> datetime:
+        return datetime.fromtimestamp(timestamp, tz=self.cursor.tzinfo)
+
+    def hasPending(self) -> bool:
+        return bool(self.pending) or self.cursor < self.endTime or bool(self.ranges)
+
+    def next(self) -> Optional[Window]:
+        """Get the next window to fetch.
+
+        Returns:
+            Optional[Window]: The window, None when the whole range is planned.
+        """
+        if self.pending:
+            return self.pending.popleft()
+        while self.cursor >= self.endTime:
+            if not self.ranges:
+                return None
+            self.cursor, self.endTime = self.ranges.popleft()
+        size = self.MIN_INTERVAL_SECS * 2**self.level
+        cellEnd = (self.cursor.timestamp() // size + 1) * size
+        end = min(self._getTime(cellEnd), self.endTime)
+        window = Window(self.cursor, end, self.level)
+        self.cursor = end
+        return window
+
+    def split(self, window: Window, pageSecs: Optional[float] = None) -> bool:
+        """Replace a window too dense to fetch in one page by its grid sub windows.
+
+        Args:
+            window (Window): The dense window.
+            pageSecs (Optional[float], optional): Seconds the first targetEvents
+                events of the window span, sizing the sub windows to hold about as
+                many. Defaults to None, splitting SPLIT_LEVELS levels down.
+
+        Returns:
+            bool: False if the window is already of the smallest size.
+        """
+        if window.level == 0:
+            return False
+        if pageSecs is None:
+            level = max(window.level - self.SPLIT_LEVELS, 0)
+        else:
+            level = min(self._getLevel(pageSecs), window.level - 1)
+        size = self.MIN_INTERVAL_SECS * 2**level
+        subWindows = []
+        start = window.start
+        while start < window.end:
+            cellEnd = (start.timestamp() // size + 1) * size
+            end = min(self._getTime(cellEnd), window.end)
+            subWindows.append(Window(start, end, level))
+            start = end
+        self.pending.extendleft(reversed(subWindows))
+        return True
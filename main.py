@@ -1,67 +1,275 @@
+import time
+
+START_TIME = time.perf_counter()  # before any other import, to report startup time
+
+import argparse
 import asyncio
+import functools
+import importlib
+import json
 import logging
 import os
-from datetime import datetime, timedelta
-
-import pytz
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
 
-from analyzer.body_error import BodyErrorAnalyzer
-from analyzer.session import SessionAnalyzer
-from controller.controller import Controller
-from fetcher.body_error import BodyErrorFetcher
-from fetcher.daily_totals import DailyTotalFetcher
-from fetcher.loggly import LogglyFetcher
 from utils.logging_config import LoggerConfig
 
+# implementations of the config types, imported only by the jobs using them
+SOURCES = {
+    "loggly": "fetcher.loggly:LogglyFetcher",
+    "bodyErrorCsv": "fetcher.body_error:BodyErrorFetcher",
+    "dailyTotalsCsv": "fetcher.daily_totals:DailyTotalFetcher",
+}
+ANALYZERS = {
+    "session": "analyzer.session:SessionAnalyzer",
+    "bodyError": "analyzer.body_error:BodyErrorAnalyzer",
+}
+
+
+def loadClass(path: str) -> type:
+    """Import a class from a "module:Class" path.
+    """
+    moduleName, className = path.split(":")
+    return getattr(importlib.import_module(moduleName), className)
+
+
+def expandVars(value: Any) -> Any:
+    """Expand $VAR and ${VAR} environment variables in the strings of a config.
+    """
+    if isinstance(value, str):
+        return os.path.expandvars(value)
+    if isinstance(value, list):
+        return [expandVars(v) for v in value]
+    if isinstance(value, dict):
+        return {k: expandVars(v) for k, v in value.items()}
+    return value
+
+
+def getTimeRange(config: dict[str, Any]) -> tuple[datetime, datetime]:
+    """Get the time range of a job.
+
+    Args:
+        config (dict[str, Any]): "start" and "end" iso times, or "days" and/or "hours"
+            before "end", which defaults to now.  Times are in "timezone" if given,
+            else in utc.  An empty config is the whole data set, for csv sources.
+
+    Returns:
+        tuple[datetime, datetime]: Start and end time.
+    """
+    if not config:
+        return datetime.min, datetime.max
+    tz = timezone.utc
+    if "timezone" in config:
+        import pytz
+
+        tz = pytz.timezone(config["timezone"])
+
+    def getTime(value: str) -> datetime:
+        time = datetime.fromisoformat(value)
+        if time.tzinfo:
+            return time
+        # pytz zones need localize to pick the offset in effect at the time
+        return tz.localize(time) if hasattr(tz, "localize") else time.replace(tzinfo=tz)
+
+    endTime = getTime(config["end"]) if "end" in config else datetime.now(tz)
+    if "start" in config:
+        startTime = getTime(config["start"])
+    else:
+        startTime = endTime - timedelta(
+            days=config.get("days", 0), hours=config.get("hours", 0)
+        )
+    return startTime, endTime
+
+
+def newAnalyzer(logger: logging.Logger, config: dict[str, Any]):
+    """Build the analyzer of a job from its type and constructor arguments.
+    """
+    config = dict(config)
+    analyzerType = config.pop("type")
+    if analyzerType == "bodyError":
+        from analyzer.signature import SignatureExtractor
+
+        config["signatureExtractor"] = SignatureExtractor(
+            config.pop("masks", ()), [tuple(p) for p in config.pop("patterns", ())]
+        )
+    return loadClass(ANALYZERS[analyzerType])(logger, **config)
+
+
+def newFetcherFactory(
+    logger: logging.Logger, config: dict[str, Any]
+) -> tuple[Callable[..., Any], int]:
+    """Build a fetcher factory from the type and constructor arguments of a source.
+
+    Returns:
+        tuple[Callable[..., Any], int]: Factory taking the result queue, and the
+            number of worker processes to shard the source across, 0 to not shard.
+    """
+    config = dict(config)
+    sourceType = config.pop("type")
+    workers = config.pop("workers", 0)
+    cacheDir = config.pop("cacheDir", None)
+    if cacheDir:
+        from fetcher.loggly_cache import ResponseCache
+
+        config["cache"] = ResponseCache(cacheDir)
+    return functools.partial(loadClass(SOURCES[sourceType]), logger, **config), workers
+
+
+def writeRollups(analyzer, path: str, add: bool = False) -> None:
+    """Write the rollups of an analyzer to the rollup store at path, added to the
+    stored buckets if add.
+    """
+    from store.rollup import RollupStore
+
+    store = RollupStore(path)
+    try:
+        analyzer.writeRollups(store, add)
+    finally:
+        store.close()
+
+
+async def runJob(config: dict[str, Any]) -> None:
+    """Run an analysis job.
+
+    Args:
+        config (dict[str, Any]): Job config, see jobs/*.example.json:
+            sources: fetcher configs, with "type" a SOURCES key and the remaining keys
+                constructor arguments.  "workers" shards a csv source across
+                processes, "cacheDir" caches loggly responses.
+            analyzer: analyzer config, with "type" an ANALYZERS key and the remaining
+                keys constructor arguments.
+            timeRange: see getTimeRange.
+            concurrency: "queueSize" batches queued, "analyzeWorkers" processes.
+            journalDir: resume from the chunks of earlier runs, single source only.
+            live: analyze closed windows continuously rather than timeRange, with
+                LiveController arguments "windowSecs", "slideSecs" and "settleSecs",
+                single source only.  Every window is dumped, and every pane added to
+                rollupDb.
+            sampling: "fraction" of the time slots to fetch with loggly sources and
+                analyze with a session analyzer, and an optional "seed".
+            outputs: "metricsFile", "metricsIntervalSecs" and "rollupDb".
+    """
+    from controller.multi_source import MultiSourceController
+    from fetcher.fetcher import Fetcher
+    from utils.metrics import METRICS
 
-async def analyzeSession():
-    logger = logging.getLogger(__name__)
-    resultQueue = asyncio.Queue()
-
-    baseUri = os.getenv("fetcherBaseUri")
-    queryParam = os.getenv("fetcherQueryParam")
-    authToken = os.getenv("fetcherToken")
-    sourceGroup = os.getenv("fetcherSourceGroup")
-    tz = pytz.timezone("US/Pacific")
-    # endTime = datetime(2023, 4, 18, 15, 0, 0, 0)
-    endTime = datetime.now()
-    endTime = tz.localize(endTime)
-    daysOffset = 0
-    endTime = endTime - timedelta(days=daysOffset)
-    durationDays = 30
-    startTime = endTime - timedelta(days=durationDays)
-
-    fetcher = LogglyFetcher(resultQueue, baseUri, queryParam, authToken, sourceGroup)
-    analyzer = SessionAnalyzer(logger)
-    controller = Controller(logger, fetcher, analyzer, startTime, endTime)
-    result = await controller.run()
-    logger.info(result)
-
-
-async def analyzeBodyError():
     logger = logging.getLogger(__name__)
-    resultQueue = asyncio.Queue()
-    csvFile = os.getenv("bodyErrorCsv")
-    csvDailySubmitFile = os.getenv("dailySubmitCsv")
-    csvOutputFile = os.getenv("bodyErrorCsvOut")
-    csvDailyOutputFile = os.getenv("bodyErrorDailyCsvOut")
-    csvDailyPercentOutputFile = os.getenv("bodyErrorDailyPercentCsvOut")
-    dailySubmitFetcher = DailyTotalFetcher(logger, resultQueue, csvDailySubmitFile)
-    bodyErrorFetcher = BodyErrorFetcher(logger, resultQueue, csvFile)
-    analyzer = BodyErrorAnalyzer(logger, csvOutputFile, csvDailyOutputFile, csvDailyPercentOutputFile)
-    # first analyze daily submit totals
-    controller = Controller(logger, dailySubmitFetcher, analyzer, datetime.min, datetime.max)
-    await controller.run()
-    # analyze errors
-    controller = Controller(logger, bodyErrorFetcher, analyzer, datetime.min, datetime.max)
-    await controller.run()
-
-
-timeStart = datetime.now()
-LoggerConfig.setUpBasicLogging()
-
-# asyncio.run(analyzeSession())
-asyncio.run(analyzeBodyError())
-
-timeSpent = datetime.now() - timeStart
-print(f"total time spent: {timeSpent}")
+    startTime, endTime = getTimeRange(config.get("timeRange", {}))
+    sources = config["sources"]
+    analyzerConfig = config["analyzer"]
+    if config.get("sampling"):
+        from fetcher.sampling import StratifiedSampler
+
+        if config.get("journalDir"):
+            raise Exception("sampled runs cannot be journaled")
+        sampler = StratifiedSampler(startTime, endTime, **config["sampling"])
+        sources = [
+            dict(source, sampler=sampler) if source["type"] == "loggly" else source
+            for source in sources
+        ]
+        analyzerConfig = dict(analyzerConfig, sampler=sampler)
+    analyzer = newAnalyzer(logger, analyzerConfig)
+    concurrency = config.get("concurrency", {})
+    outputs = config.get("outputs", {})
+
+    resultQueue = Fetcher.newQueue(concurrency.get("queueSize", Fetcher.QUEUE_SIZE))
+    collects = []
+    fetchers = []
+    for source in sources:
+        fetcherFactory, workers = newFetcherFactory(logger, source)
+        if workers:
+            from controller.sharded import ShardedController
+
+            controller = ShardedController(
+                logger, fetcherFactory, analyzer, startTime, endTime, workers
+            )
+            collects.append(controller.collect())
+        else:
+            fetchers.append(fetcherFactory(resultQueue))
+    if config.get("live"):
+        from controller.live import LiveController
+
+        if len(fetchers) != 1 or collects or config.get("journalDir"):
+            raise Exception("live needs a single source without workers or journalDir")
+        if config.get("sampling"):
+            raise Exception("live runs cannot be sampled")
+
+        def writePaneRollups(
+            paneStart: datetime, paneEnd: datetime, paneAnalyzer
+        ) -> None:
+            # panes partition time, unlike sliding windows, so buckets add up
+            writeRollups(paneAnalyzer, outputs["rollupDb"], add=True)
+
+        if outputs.get("rollupDb"):
+            onPane = writePaneRollups
+        else:
+            onPane = None
+        controller = LiveController(
+            logger, fetchers[0], analyzer, onPane=onPane, **config["live"]
+        )
+        collects.append(controller.run())
+    elif config.get("journalDir"):
+        from controller.incremental import IncrementalController, ProgressJournal
+
+        if len(fetchers) != 1 or collects:
+            raise Exception("journalDir needs a single source without workers")
+        controller = IncrementalController(
+            logger,
+            fetchers[0],
+            analyzer,
+            startTime,
+            endTime,
+            ProgressJournal(config["journalDir"]),
+            analyzeWorkers=concurrency.get("analyzeWorkers", 0),
+        )
+        collects.append(controller.collect())
+    elif fetchers:
+        controller = MultiSourceController(
+            logger,
+            fetchers,
+            analyzer,
+            startTime,
+            endTime,
+            analyzeWorkers=concurrency.get("analyzeWorkers", 0),
+        )
+        collects.append(controller.collect())
+    logger.info(f"started in {time.perf_counter() - START_TIME:.3f}s")
+
+    metricsFile = outputs.get("metricsFile")
+    exporter = None
+    if metricsFile:
+        intervalSecs = outputs.get(
+            "metricsIntervalSecs", MultiSourceController.METRICS_INTERVAL_SECS
+        )
+        exporter = asyncio.create_task(
+            METRICS.writePeriodically(metricsFile, intervalSecs)
+        )
+    try:
+        await asyncio.gather(*collects)
+        if config.get("live"):
+            return
+        analyzer.dumpResult()
+        if outputs.get("rollupDb"):
+            writeRollups(analyzer, outputs["rollupDb"])
+    finally:
+        if exporter:
+            exporter.cancel()
+            METRICS.write(metricsFile)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a log analysis job.")
+    parser.add_argument("config", help="job config json file, see jobs/")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    LoggerConfig.setUpBasicLogging(getattr(logging, args.log_level.upper()))
+    with open(args.config) as f:
+        config = expandVars(json.load(f))
+
+    asyncio.run(runJob(config))
+
+    print(f"total time spent: {timedelta(seconds=time.perf_counter() - START_TIME)}")
+
+
+if __name__ == "__main__":
+    main()
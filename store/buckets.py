@@ -0,0 +1,18 @@
+from datetime import datetime, timezone
+
+# bucket keys are iso format times cut to this length, they sort in time order
+GRANULARITY_LENGTHS = {
+    "minute": len("2023-09-08T17:53"),
+    "hour": len("2023-09-08T17"),
+    "day": len("2023-09-08"),
+}
+
+
+def getBucket(time: datetime, granularity: str) -> str:
+    """Get the key of the bucket containing time, naive times taken as UTC.
+    """
+    if granularity not in GRANULARITY_LENGTHS:
+        raise Exception(f"unknown granularity {granularity}")
+    if time.tzinfo:
+        time = time.astimezone(timezone.utc)
+    return time.isoformat()[: GRANULARITY_LENGTHS[granularity]]
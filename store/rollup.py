@@ -0,0 +1,258 @@
+import argparse
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from analyzer.sketches import HyperLogLog
+from store.buckets import GRANULARITY_LENGTHS, getBucket
+
+
+class RollupStore:
+    def __init__(self, path: str) -> None:
+        """SQLite store of pre-aggregated analysis results per time bucket.
+
+        Counts are kept per analyzer, dimension, member and bucket, e.g. the count of
+        error "timeout" on day "2023-09-08".  Distinct counts are kept as HyperLogLog
+        sketches per analyzer, dimension and bucket, merged over a range when queried.
+        Writing a bucket again replaces it, so rerunning an analysis is idempotent;
+        analyses should cover whole buckets, as a partially analyzed bucket replaces
+        the stored one too.  Analyses of consecutive parts of a bucket, e.g. the
+        panes of a live run, add to the stored bucket instead.
+
+        Args:
+            path (str): Database file.
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS counts (
+                analyzer TEXT, dimension TEXT, granularity TEXT, bucket TEXT,
+                member TEXT, count INTEGER,
+                PRIMARY KEY (analyzer, dimension, granularity, bucket, member)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS sketches (
+                analyzer TEXT, dimension TEXT, granularity TEXT, bucket TEXT,
+                precision INTEGER, registers BLOB,
+                PRIMARY KEY (analyzer, dimension, granularity, bucket)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def close(self) -> None:
+        self.db.close()
+
+    def putCounts(
+        self,
+        analyzer: str,
+        dimension: str,
+        granularity: str,
+        rows: Iterable[tuple[str, str, int]],
+        add: bool = False,
+    ) -> None:
+        """Replace the counts of the buckets in rows.
+
+        Args:
+            rows (Iterable[tuple[str, str, int]]): (bucket, member, count) rows.
+            add (bool, optional): Add the counts to the stored ones instead.
+                Defaults to False.
+        """
+        rows = list(rows)
+        with self.db:
+            if add:
+                self.db.executemany(
+                    "INSERT INTO counts VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT DO "
+                    "UPDATE SET count = count + excluded.count",
+                    (
+                        (analyzer, dimension, granularity, bucket, member, count)
+                        for bucket, member, count in rows
+                    ),
+                )
+                return
+            self.db.executemany(
+                "DELETE FROM counts WHERE analyzer = ? AND dimension = ? "
+                "AND granularity = ? AND bucket = ?",
+                (
+                    (analyzer, dimension, granularity, bucket)
+                    for bucket in {row[0] for row in rows}
+                ),
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (analyzer, dimension, granularity, bucket, member, count)
+                    for bucket, member, count in rows
+                ),
+            )
+
+    def putSketches(
+        self,
+        analyzer: str,
+        dimension: str,
+        granularity: str,
+        rows: Iterable[tuple[str, HyperLogLog]],
+        add: bool = False,
+    ) -> None:
+        """Replace distinct count sketches.
+
+        Args:
+            rows (Iterable[tuple[str, HyperLogLog]]): (bucket, sketch) rows.
+            add (bool, optional): Merge the sketches into the stored ones instead.
+                Defaults to False.
+        """
+        if add:
+            rows = [
+                (bucket, self._getMerged(analyzer, dimension, granularity, bucket, sketch))
+                for bucket, sketch in rows
+            ]
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO sketches VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        analyzer,
+                        dimension,
+                        granularity,
+                        bucket,
+                        sketch.precision,
+                        bytes(sketch.registers),
+                    )
+                    for bucket, sketch in rows
+                ),
+            )
+
+    def _getMerged(
+        self,
+        analyzer: str,
+        dimension: str,
+        granularity: str,
+        bucket: str,
+        sketch: HyperLogLog,
+    ) -> HyperLogLog:
+        # the sketch merged with the stored one of its bucket, if any
+        row = self.db.execute(
+            "SELECT precision, registers FROM sketches WHERE analyzer = ? "
+            "AND dimension = ? AND granularity = ? AND bucket = ?",
+            (analyzer, dimension, granularity, bucket),
+        ).fetchone()
+        if row is None:
+            return sketch
+        merged = HyperLogLog(row[0])
+        merged.registers = bytearray(row[1])
+        merged.merge(sketch)
+        return merged
+
+    def _getBucketRange(
+        self, granularity: str, startTime: datetime, endTime: datetime
+    ) -> tuple[str, str]:
+        # buckets overlapping [startTime, endTime)
+        lastTime = max(endTime - timedelta(microseconds=1), startTime)
+        return getBucket(startTime, granularity), getBucket(lastTime, granularity)
+
+    def getCounts(
+        self,
+        analyzer: str,
+        dimension: str,
+        granularity: str,
+        startTime: datetime,
+        endTime: datetime,
+    ) -> dict[str, dict[str, int]]:
+        """Get the counts per member and bucket of the buckets overlapping
+        [startTime, endTime).
+
+        Returns:
+            dict[str, dict[str, int]]: {member: {bucket: count}}.
+        """
+        cursor = self.db.execute(
+            "SELECT member, bucket, count FROM counts WHERE analyzer = ? "
+            "AND dimension = ? AND granularity = ? AND bucket BETWEEN ? AND ? "
+            "ORDER BY bucket",
+            (analyzer, dimension, granularity)
+            + self._getBucketRange(granularity, startTime, endTime),
+        )
+        counts = {}
+        for member, bucket, count in cursor:
+            counts.setdefault(member, {})[bucket] = count
+        return counts
+
+    def getTotals(
+        self,
+        analyzer: str,
+        dimension: str,
+        granularity: str,
+        startTime: datetime,
+        endTime: datetime,
+    ) -> dict[str, int]:
+        """Get the count per member summed over the buckets overlapping
+        [startTime, endTime).
+
+        Returns:
+            dict[str, int]: {member: count}, highest count first.
+        """
+        cursor = self.db.execute(
+            "SELECT member, SUM(count) AS total FROM counts WHERE analyzer = ? "
+            "AND dimension = ? AND granularity = ? AND bucket BETWEEN ? AND ? "
+            "GROUP BY member ORDER BY total DESC",
+            (analyzer, dimension, granularity)
+            + self._getBucketRange(granularity, startTime, endTime),
+        )
+        return dict(cursor)
+
+    def getDistinctCount(
+        self,
+        analyzer: str,
+        dimension: str,
+        granularity: str,
+        startTime: datetime,
+        endTime: datetime,
+    ) -> float:
+        """Estimate the distinct count over the buckets overlapping
+        [startTime, endTime), 0 when there are none.
+        """
+        cursor = self.db.execute(
+            "SELECT precision, registers FROM sketches WHERE analyzer = ? "
+            "AND dimension = ? AND granularity = ? AND bucket BETWEEN ? AND ?",
+            (analyzer, dimension, granularity)
+            + self._getBucketRange(granularity, startTime, endTime),
+        )
+        merged = None
+        for precision, registers in cursor:
+            sketch = HyperLogLog(precision)
+            sketch.registers = bytearray(registers)
+            if merged:
+                merged.merge(sketch)
+            else:
+                merged = sketch
+        return merged.count() if merged else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query analysis rollups.")
+    parser.add_argument("db", help="rollup database file")
+    parser.add_argument("query", choices=["counts", "totals", "distinct"])
+    parser.add_argument("analyzer", help="e.g. BodyErrorAnalyzer")
+    parser.add_argument("dimension", help="e.g. error")
+    parser.add_argument("--granularity", choices=list(GRANULARITY_LENGTHS), default="day")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime.min)
+    parser.add_argument("--end", type=datetime.fromisoformat, default=datetime.max)
+    args = parser.parse_args()
+
+    store = RollupStore(args.db)
+    try:
+        query = {
+            "counts": store.getCounts,
+            "totals": store.getTotals,
+            "distinct": store.getDistinctCount,
+        }[args.query]
+        result = query(
+            args.analyzer, args.dimension, args.granularity, args.start, args.end
+        )
+    finally:
+        store.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
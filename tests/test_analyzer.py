@@ -0,0 +1,122 @@
+import logging
+import pickle
+import random
+import unittest
+from datetime import date, timedelta
+
+from analyzer.body_error import BodyErrorAnalyzer
+from analyzer.session import SessionAnalyzer
+from analyzer.signature import SignatureExtractor
+from analyzer.sketches import HyperLogLog, SpaceSaving
+from fetcher.body_error import BodyError
+
+
+class TestSignatureExtractor(unittest.TestCase):
+    def test_masks_variable_parts(self):
+        extractor = SignatureExtractor(
+            ["number", "hex", "uuid", "quoted"], [(r"user \w+", "user <name>")]
+        )
+        self.assertEqual(
+            extractor.extract(
+                '"job 1234 of user bob failed on 0x7f3a 9b2c4d5e6f with '
+                "'bad value' id 123e4567-e89b-12d3-a456-426614174000: retry\""
+            ),
+            "job <num> of user <name> failed on <hex> <hex> with <str> id <uuid>",
+        )
+        self.assertEqual(extractor.extract("took 2.5 seconds"), "took <num> seconds")
+        self.assertEqual(extractor.extract("deadbeefcafe"), "deadbeefcafe")
+        self.assertEqual(extractor.extract(""), "")
+
+    def test_defaults_to_text_before_colon_and_pickles(self):
+        extractor = SignatureExtractor(["number"], cacheSize=2)
+        self.assertEqual(SignatureExtractor().extract('"timeout 30: x"'), "timeout 30")
+        for i in range(5):
+            extractor.extract(f"retry {i}")
+        self.assertEqual(extractor.extract.cache_info().currsize, 2)
+
+        copied = pickle.loads(pickle.dumps(extractor))
+        self.assertEqual(copied.extract("retry 7: again"), "retry <num>")
+        self.assertEqual(copied.extract.cache_info().currsize, 1)
+        with self.assertRaises(Exception):
+            SignatureExtractor(["numbers"])
+
+
+class TestSketches(unittest.TestCase):
+    def test_hyperloglog_within_error(self):
+        precision = HyperLogLog.getPrecision(0.02)
+        left = HyperLogLog(precision)
+        right = HyperLogLog(precision)
+        for i in range(30000):
+            left.add(f"sid{i}")
+        for i in range(20000, 50000):
+            right.add(f"sid{i}")
+        left.merge(HyperLogLog.fromState(right.getState()))
+
+        self.assertAlmostEqual(left.count() / 50000, 1, delta=0.06)
+        small = HyperLogLog(precision)
+        for i in range(100):
+            small.add(str(i))
+        self.assertAlmostEqual(small.count(), 100, delta=3)
+
+    def test_space_saving_keeps_heavy_hitters(self):
+        rand = random.Random(7)
+        items = [f"heavy{i}" for i in range(5) for _ in range(500)]
+        items += [f"light{rand.randrange(5000)}" for _ in range(5000)]
+        rand.shuffle(items)
+        left = SpaceSaving(20)
+        right = SpaceSaving(20)
+        for i, item in enumerate(items):
+            (left if i % 2 else right).add(item)
+        left.merge(SpaceSaving.fromState(right.getState()))
+
+        top = left.top(5)
+        self.assertEqual({item for item, _ in top}, {f"heavy{i}" for i in range(5)})
+        for item, count in top:
+            self.assertGreaterEqual(count, 500)
+            self.assertLessEqual(count - left.errors[item], 500)
+
+
+class TestSessionAnalyzer(unittest.IsolatedAsyncioTestCase):
+    async def test_approximate_matches_exact(self):
+        logger = logging.getLogger(__name__)
+        records = [
+            (f"s{i % 3000}", "channel" if i % 4 else "{PSID}", True) for i in range(12000)
+        ]
+        # events with query params but no sid count as an empty sid
+        records += [(None, "channel", True), (None, None, True), (None, None, False)]
+        exact = SessionAnalyzer(logger)
+        await exact.analyzeBatch(records)
+
+        approximate = SessionAnalyzer(logger, approximate=True, errorRate=0.01, topK=3)
+        partial = approximate.newPartial()
+        await approximate.analyzeBatch(records[:5000])
+        await partial.analyzeBatch(records[5000:])
+        approximate.mergeState(partial.getState())
+
+        exactCounts = [len(exact.sids), len(exact.psidSids), len(exact.channelSids)]
+        for sketch, exactCount in zip(approximate.sidSketches, exactCounts):
+            self.assertAlmostEqual(sketch.count() / exactCount, 1, delta=0.03)
+        self.assertEqual(approximate.emptySidCnts, [2, 0, 1])
+
+
+
+class TestBodyErrorAnalyzer(unittest.IsolatedAsyncioTestCase):
+    async def test_count_matrix_grows_compactly(self):
+        analyzer = BodyErrorAnalyzer(logging.getLogger(__name__), "", "", "")
+        startDate = date(2023, 1, 1)
+        dateCnt = BodyErrorAnalyzer.INITIAL_DATE_CAPACITY + 6
+        for day in range(dateCnt):
+            dateStr = (startDate + timedelta(days=day)).isoformat()
+            batch = []
+            for error in range(1, 10):
+                batch.extend([BodyError(f"{dateStr}T01:00:00Z", f"e{error}", "")] * error)
+            await analyzer.analyzeBatch(batch)
+            self.assertEqual(len(analyzer.counts), 9 * analyzer.dateCapacity)
+
+        # the date columns doubled once, each row keeping its counts
+        self.assertEqual(analyzer.dateCapacity, 2 * BodyErrorAnalyzer.INITIAL_DATE_CAPACITY)
+        self.assertEqual(analyzer.errors, {f"e{e}": e * dateCnt for e in range(1, 10)})
+        self.assertEqual(
+            analyzer.ErrDateCnts["e3"],
+            {(startDate + timedelta(days=d)).isoformat(): 3 for d in range(dateCnt)},
+        )
@@ -0,0 +1,380 @@
+import csv
+import functools
+import logging
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from analyzer.analyzer import Analyzer
+from analyzer.body_error import BodyErrorAnalyzer
+from analyzer.session import SessionAnalyzer
+from controller.broadcast import BroadcastController
+from controller.controller import Controller
+from controller.incremental import IncrementalController, ProgressJournal
+from controller.live import LiveController
+from controller.multi_source import MultiSourceController
+from controller.sharded import ShardedController
+from fetcher.body_error import BodyErrorFetcher
+from fetcher.daily_totals import DailyTotalFetcher
+from fetcher.fetcher import Fetcher
+from store.rollup import RollupStore
+
+BODY_ERROR_HEADER = [
+    "Date",
+    "Host",
+    "@Body.Attributes.metadata.error",
+    "@Body.message",
+]
+
+
+class SessionEventFetcher(Fetcher):
+    """Fetcher emitting one session event per hour of the requested range."""
+
+    def __init__(self, logger: logging.Logger, resultQueue) -> None:
+        super().__init__(logger, resultQueue)
+        self.fetchedRanges = []
+
+    async def fetch(self, startTime: datetime, endTime: datetime) -> None:
+        self.fetchedRanges.append((startTime, endTime))
+        eventTime = startTime
+        while eventTime < endTime:
+            queryParams = {"sid": eventTime.hour % 5, "deviceId": "channel"}
+            await self.putRecord({"event": {"json": {"req": {"queryParams": queryParams}}}})
+            eventTime += timedelta(hours=1)
+        await self.done()
+
+
+class MinuteEventFetcher(SessionEventFetcher):
+    """Fetcher emitting one timestamped session event per minute, 30 sids cycling."""
+
+    async def fetch(self, startTime: datetime, endTime: datetime) -> None:
+        self.fetchedRanges.append((startTime, endTime))
+        eventTime = startTime
+        while eventTime < endTime:
+            queryParams = {"sid": f"sid{eventTime.minute % 30}", "deviceId": "channel"}
+            await self.putRecord(
+                {
+                    "timestamp": int(eventTime.timestamp() * 1000),
+                    "event": {"json": {"req": {"queryParams": queryParams}}},
+                }
+            )
+            eventTime += timedelta(minutes=1)
+        await self.done()
+
+
+class DeviceIdAnalyzer(Analyzer):
+    """Analyzer counting session events per deviceId."""
+
+    def __init__(self) -> None:
+        self.deviceIds = {}
+
+    def getFieldPaths(self) -> tuple[str, ...]:
+        return ("event.json.req.queryParams.deviceId",)
+
+    async def analyze(self, data) -> None:
+        self.deviceIds[data[0]] = self.deviceIds.get(data[0], 0) + 1
+
+    def dumpResult(self) -> None:
+        pass
+
+
+class RecordCountAnalyzer(Analyzer):
+    """Analyzer counting the records it receives, unprojected."""
+
+    def __init__(self) -> None:
+        self.records = []
+
+    async def analyze(self, data) -> None:
+        self.records.append(data)
+
+    def dumpResult(self) -> None:
+        pass
+
+
+def writeCsv(path: str, header: list[str], rows: list[list[str]]) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def readCsv(path: str) -> list[dict[str, str]]:
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+class TestController(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.logger = logging.getLogger(__name__)
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.csvFile = self.path("body_errors.csv")
+        rows = []
+        for i in range(25):
+            day = "2023-09-08" if i < 10 else "2023-09-09"
+            error = "timeout: after 30s" if i % 2 else ""
+            rows.append([f"{day}T17:53:44.362Z", "host", error, "bad input: field x"])
+        writeCsv(self.csvFile, BODY_ERROR_HEADER, rows)
+
+    def tearDown(self) -> None:
+        self.tmpDir.cleanup()
+        super().tearDown()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmpDir.name, name)
+
+    def newAnalyzer(self) -> BodyErrorAnalyzer:
+        return BodyErrorAnalyzer(
+            self.logger,
+            self.path("errors.csv"),
+            self.path("daily.csv"),
+            self.path("percent.csv"),
+        )
+
+    async def test_batched_bounded_run(self):
+        resultQueue = Fetcher.newQueue(maxSize=1)
+        fetcher = BodyErrorFetcher(self.logger, resultQueue, self.csvFile, batchSize=4)
+        analyzer = self.newAnalyzer()
+        controller = Controller(
+            self.logger, fetcher, analyzer, datetime.min, datetime.max
+        )
+        await controller.run()
+
+        self.assertEqual(analyzer.errors, {"timeout": 12, "bad input": 13})
+        self.assertEqual(analyzer.DateTotals, {"2023-09-08": 10, "2023-09-09": 15})
+        errorRows = readCsv(self.path("errors.csv"))
+        self.assertEqual(
+            errorRows,
+            [{"error": "bad input", "count": "13"}, {"error": "timeout", "count": "12"}],
+        )
+
+    async def test_sharded_run_matches_single_process(self):
+        analyzer = self.newAnalyzer()
+        fetcher = BodyErrorFetcher(self.logger, Fetcher.newQueue(), self.csvFile)
+        await Controller(
+            self.logger, fetcher, analyzer, datetime.min, datetime.max
+        ).collect()
+
+        shardedAnalyzer = self.newAnalyzer()
+        fetcherFactory = functools.partial(
+            BodyErrorFetcher, self.logger, filePath=self.csvFile
+        )
+        controller = ShardedController(
+            self.logger,
+            fetcherFactory,
+            shardedAnalyzer,
+            datetime.min,
+            datetime.max,
+            workers=3,
+        )
+        await controller.run()
+
+        self.assertEqual(shardedAnalyzer.getState(), analyzer.getState())
+
+    async def test_incremental_run_resumes_from_journal(self):
+        journal = ProgressJournal(self.path("journal"))
+        startTime = datetime(2023, 9, 1, tzinfo=timezone.utc)
+
+        fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+        analyzer = SessionAnalyzer(self.logger)
+        await IncrementalController(
+            self.logger, fetcher, analyzer, startTime, startTime + timedelta(days=3), journal
+        ).collect()
+        self.assertEqual(len(fetcher.fetchedRanges), 3)
+
+        # the next run only fetches the new day
+        endTime = startTime + timedelta(days=4)
+        fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+        analyzer = SessionAnalyzer(self.logger)
+        await IncrementalController(
+            self.logger, fetcher, analyzer, startTime, endTime, journal
+        ).collect()
+        self.assertEqual(
+            fetcher.fetchedRanges, [(startTime + timedelta(days=3), endTime)]
+        )
+
+        fullAnalyzer = SessionAnalyzer(self.logger)
+        fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+        await Controller(
+            self.logger, fetcher, fullAnalyzer, startTime, endTime
+        ).collect()
+        self.assertEqual(analyzer.getState(), fullAnalyzer.getState())
+
+        # chunks journaled with other analyzer settings are fetched again
+        fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+        analyzer = SessionAnalyzer(self.logger, approximate=True)
+        await IncrementalController(
+            self.logger, fetcher, analyzer, startTime, endTime, journal
+        ).collect()
+        self.assertEqual(len(fetcher.fetchedRanges), 4)
+
+        # chunks that closed within settleSecs are not journaled
+        journal = ProgressJournal(self.path("unsettled"))
+        for _ in range(2):
+            fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+            await IncrementalController(
+                self.logger,
+                fetcher,
+                SessionAnalyzer(self.logger),
+                startTime,
+                endTime,
+                journal,
+                settleSecs=10**10,
+            ).collect()
+            self.assertEqual(len(fetcher.fetchedRanges), 4)
+
+    async def test_live_run_emits_sliding_windows(self):
+        startTime = datetime(2023, 9, 1, tzinfo=timezone.utc)
+        windows = []
+        fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+        controller = LiveController(
+            self.logger,
+            fetcher,
+            SessionAnalyzer(self.logger),
+            windowSecs=3 * 3600,
+            slideSecs=3600,
+            settleSecs=0,
+            startTime=startTime + timedelta(minutes=30),
+            onWindow=lambda start, end, analyzer: windows.append((start, end, analyzer)),
+        )
+        await controller.run(maxWindows=3)
+
+        # panes are fetched once, and only those of the latest window are kept
+        self.assertEqual(len(fetcher.fetchedRanges), 5)
+        self.assertEqual(fetcher.fetchedRanges[0], (startTime, startTime + timedelta(hours=1)))
+        self.assertEqual(len(controller.panes), 3)
+        for i, (windowStart, windowEnd, analyzer) in enumerate(windows):
+            self.assertEqual(windowStart, startTime + timedelta(hours=i))
+            self.assertEqual(windowEnd, windowStart + timedelta(hours=3))
+            fullAnalyzer = SessionAnalyzer(self.logger)
+            fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+            await Controller(
+                self.logger, fetcher, fullAnalyzer, windowStart, windowEnd
+            ).collect()
+            self.assertEqual(analyzer.getState(), fullAnalyzer.getState())
+
+    async def test_live_rollups_are_written_per_pane(self):
+        startTime = datetime(2023, 9, 1, tzinfo=timezone.utc)
+        store = RollupStore(self.path("rollups.db"))
+        self.addCleanup(store.close)
+        fetcher = MinuteEventFetcher(self.logger, Fetcher.newQueue())
+        controller = LiveController(
+            self.logger,
+            fetcher,
+            SessionAnalyzer(self.logger, rollupGranularity="hour"),
+            windowSecs=3600,
+            slideSecs=900,
+            settleSecs=0,
+            startTime=startTime,
+            onWindow=lambda start, end, analyzer: None,
+            onPane=lambda start, end, analyzer: analyzer.writeRollups(store, add=True),
+        )
+        await controller.run(maxWindows=6)
+
+        # 9 panes of 15 minutes, each event added to its hour bucket once
+        self.assertEqual(len(fetcher.fetchedRanges), 9)
+        endTime = startTime + timedelta(hours=3)
+        counts = store.getCounts("SessionAnalyzer", "events", "hour", startTime, endTime)
+        self.assertEqual(
+            counts["All sid"],
+            {"2023-09-01T00": 60, "2023-09-01T01": 60, "2023-09-01T02": 15},
+        )
+        distinct = store.getDistinctCount(
+            "SessionAnalyzer", "All sid", "hour", startTime, startTime + timedelta(hours=1)
+        )
+        self.assertAlmostEqual(distinct, 30, delta=1)
+
+    async def test_session_records_are_projected(self):
+        fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+        analyzer = SessionAnalyzer(self.logger)
+        startTime = datetime(2023, 9, 1, tzinfo=timezone.utc)
+        controller = Controller(
+            self.logger, fetcher, analyzer, startTime, startTime + timedelta(hours=7)
+        )
+        await fetcher.putBatch([{"event": {"json": {"req": {"url": "/"}}}}])
+        self.assertEqual(await fetcher.getData(), [(None, None, False)])
+
+        await controller.collect()
+        self.assertEqual(analyzer.sids, {"0": 2, "1": 2, "2": 1, "3": 1, "4": 1})
+        self.assertEqual(analyzer.channelSids, analyzer.sids)
+        self.assertEqual(analyzer.psidSids, {})
+
+        # events with query params but neither sid nor deviceId count as an empty sid
+        records = [{"event": {"json": {"req": {"queryParams": {"page": "2"}}}}}]
+        await analyzer.analyzeBatch(fetcher.projector.projectAll(records))
+        self.assertEqual(analyzer.sids[""], 1)
+
+    async def test_multi_source_run_waits_for_every_source(self):
+        totalsFile = self.path("totals.csv")
+        writeCsv(totalsFile, ["time", "value"], [["2023-09-08", "40"], ["2023-09-09", "60"]])
+        resultQueue = Fetcher.newQueue(maxSize=1)
+        fetchers = [
+            DailyTotalFetcher(self.logger, resultQueue, totalsFile),
+            BodyErrorFetcher(self.logger, resultQueue, self.csvFile, batchSize=4),
+            BodyErrorFetcher(self.logger, Fetcher.newQueue(), self.csvFile),
+        ]
+        analyzer = self.newAnalyzer()
+        await MultiSourceController(
+            self.logger, fetchers, analyzer, datetime.min, datetime.max
+        ).run()
+
+        self.assertTrue(all(fetcher.isFinished() for fetcher in fetchers))
+        self.assertEqual(analyzer.errors, {"timeout": 24, "bad input": 26})
+        self.assertEqual(analyzer.DateSumbitTotals, {"2023-09-08": 40, "2023-09-09": 60})
+        percentRows = readCsv(self.path("percent.csv"))
+        self.assertEqual(percentRows[0]["error type/datetime"], "bad input")
+        self.assertEqual(percentRows[0]["2023-09-09"], "0.27")
+
+    async def test_broadcast_feeds_every_analyzer(self):
+        startTime = datetime(2023, 9, 1, tzinfo=timezone.utc)
+        endTime = startTime + timedelta(hours=30)
+        fullAnalyzer = SessionAnalyzer(self.logger)
+        fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+        await Controller(
+            self.logger, fetcher, fullAnalyzer, startTime, endTime
+        ).collect()
+
+        for extraAnalyzer in (DeviceIdAnalyzer(), RecordCountAnalyzer()):
+            fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+            analyzers = [SessionAnalyzer(self.logger), extraAnalyzer]
+            await BroadcastController(
+                self.logger, fetcher, analyzers, startTime, endTime, bufferSize=1
+            ).run()
+
+            self.assertEqual(len(fetcher.fetchedRanges), 1)
+            self.assertEqual(analyzers[0].getState(), fullAnalyzer.getState())
+        self.assertEqual(len(analyzers[1].records), 30)
+        self.assertIn("event", analyzers[1].records[0])
+
+        # analyzers get their own fields when the fetcher projects to their union
+        fetcher = SessionEventFetcher(self.logger, Fetcher.newQueue())
+        deviceIdAnalyzer = DeviceIdAnalyzer()
+        analyzers = [deviceIdAnalyzer, SessionAnalyzer(self.logger)]
+        await BroadcastController(
+            self.logger, fetcher, analyzers, startTime, endTime
+        ).collect()
+        self.assertEqual(analyzers[1].getState(), fullAnalyzer.getState())
+        self.assertEqual(deviceIdAnalyzer.deviceIds, {"channel": 30})
+
+    async def test_analysis_offloaded_to_workers(self):
+        analyzer = self.newAnalyzer()
+        fetcher = BodyErrorFetcher(self.logger, Fetcher.newQueue(), self.csvFile)
+        await Controller(
+            self.logger, fetcher, analyzer, datetime.min, datetime.max
+        ).collect()
+
+        offloadedAnalyzer = self.newAnalyzer()
+        fetcher = BodyErrorFetcher(
+            self.logger, Fetcher.newQueue(), self.csvFile, batchSize=3
+        )
+        await Controller(
+            self.logger,
+            fetcher,
+            offloadedAnalyzer,
+            datetime.min,
+            datetime.max,
+            analyzeWorkers=2,
+        ).collect()
+
+        self.assertEqual(offloadedAnalyzer.getState(), analyzer.getState())
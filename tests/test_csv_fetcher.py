@@ -0,0 +1,196 @@
+import asyncio
+import csv
+import gzip
+import io
+import logging
+import lzma
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from fetcher.body_error import BodyErrorFetcher
+from fetcher.csv_fetcher import getInputFiles, splitCsvRanges
+from fetcher.date_index import getIndexPath
+from fetcher.daily_totals import DailyTotalFetcher
+
+
+async def drain(queue: asyncio.Queue) -> list:
+    records = []
+    while True:
+        batch = await queue.get()
+        if batch is None:
+            return records
+        records.extend(batch)
+
+
+class TestCsvFetcher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.logger = logging.getLogger(__name__)
+        self.tmpDir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpDir.cleanup()
+        super().tearDown()
+
+    def writeCsv(self, name: str, rows: list[list[str]]) -> str:
+        path = os.path.join(self.tmpDir.name, name)
+        with open(path, "w", newline="") as f:
+            csv.writer(f).writerows(rows)
+        return path
+
+    async def test_projects_declared_columns(self):
+        path = self.writeCsv(
+            "body.csv",
+            [
+                ["@Body.message", "Other", "Date", "@Body.Attributes.metadata.error"],
+                ['multi\nline "message"', "x", "2023-09-08T00:00:00Z", "err: 1"],
+                ["short row"],
+            ],
+        )
+        queue = asyncio.Queue()
+        fetcher = BodyErrorFetcher(self.logger, queue, path, batchSize=1)
+        await fetcher.fetch(datetime.min, datetime.max)
+        records = await drain(queue)
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0].date, "2023-09-08T00:00:00Z")
+        self.assertEqual(records[0].attributeError, "err: 1")
+        self.assertEqual(records[0].bodyMessage, 'multi\nline "message"')
+        self.assertEqual(records[1].bodyMessage, "short row")
+        self.assertEqual(records[1].date, "")
+
+    async def test_missing_column_defaults(self):
+        path = self.writeCsv("totals.csv", [["time"], ["2023-09-08"]])
+        queue = asyncio.Queue()
+        fetcher = DailyTotalFetcher(self.logger, queue, path)
+        await fetcher.fetch(datetime.min, datetime.max)
+        records = await drain(queue)
+
+        self.assertEqual([(r.date, r.total) for r in records], [("2023-09-08", 0)])
+
+    async def test_blank_lines_are_skipped(self):
+        path = os.path.join(self.tmpDir.name, "totals.csv")
+        with open(path, "w") as f:
+            f.write("time,value\n2023-09-08,5\n\n,\n2023-09-09,7\n\n")
+        queue = asyncio.Queue()
+        fetcher = DailyTotalFetcher(self.logger, queue, path)
+        await fetcher.fetch(datetime.min, datetime.max)
+        records = await drain(queue)
+
+        self.assertEqual(
+            [(r.date, r.total) for r in records], [("2023-09-08", 5), ("2023-09-09", 7)]
+        )
+
+    async def test_byte_ranges_split_on_record_boundaries(self):
+        rows = [["Date", "@Body.Attributes.metadata.error", "@Body.message"]]
+        for i in range(200):
+            rows.append([f"2023-09-08T{i}", "", f'line {i}\n"quoted"\nmore'])
+        path = self.writeCsv("body.csv", rows)
+
+        ranges = splitCsvRanges(path, 7)
+        self.assertGreater(len(ranges), 1)
+        messages = []
+        for byteRange in ranges:
+            queue = asyncio.Queue()
+            fetcher = BodyErrorFetcher(self.logger, queue, path, byteRange=byteRange)
+            await fetcher.fetch(datetime.min, datetime.max)
+            messages.extend(r.bodyMessage for r in await drain(queue))
+        self.assertEqual(messages, [row[2] for row in rows[1:]])
+
+    async def test_reads_compressed_files_of_a_directory(self):
+        header = ["Date", "@Body.Attributes.metadata.error", "@Body.message"]
+        openers = {"a.csv": open, "b.csv.gz": gzip.open, "c.csv.xz": lzma.open}
+        for i, (name, opener) in enumerate(openers.items()):
+            text = io.StringIO()
+            csv.writer(text).writerows(
+                [header] + [[f"2023-09-0{i + 1}", "", f"msg {j}"] for j in range(5)]
+            )
+            with opener(os.path.join(self.tmpDir.name, name), "wb") as f:
+                f.write(text.getvalue().encode())
+        self.writeCsv("notes.txt", [["ignored"]])
+
+        filePaths = getInputFiles(self.tmpDir.name)
+        self.assertEqual([os.path.basename(p) for p in filePaths], list(openers))
+        self.assertEqual(getInputFiles(os.path.join(self.tmpDir.name, "*.csv.?z")), filePaths[1:])
+        queue = asyncio.Queue()
+        fetcher = BodyErrorFetcher(self.logger, queue, self.tmpDir.name, batchSize=2)
+        shards = fetcher.getShards(datetime.min, datetime.max, 8)
+        self.assertEqual([args for args, _, _ in shards], [{"filePath": p} for p in filePaths])
+        await fetcher.fetch(datetime.min, datetime.max)
+        records = await drain(queue)
+
+        self.assertEqual(len(records), 15)
+        self.assertEqual(records[5].date, "2023-09-02")
+        self.assertEqual(records[14].bodyMessage, "msg 4")
+
+    async def test_bounded_fetch_returns_records_in_range(self):
+        rows = [["Date", "@Body.Attributes.metadata.error", "@Body.message"]]
+        for day in range(1, 8):
+            for i in range(3):
+                rows.append([f"2023-09-0{day}T0{i}:00:00Z", f"err {day}", "multi\nline"])
+        path = self.writeCsv("body.csv", rows)
+
+        gzPath = path + ".gz"
+        with open(path, "rb") as f, gzip.open(gzPath, "wb") as gz:
+            gz.write(f.read())
+
+        async def fetchDates(
+            startTime: datetime, endTime: datetime, filePath: str = path
+        ) -> list[str]:
+            queue = asyncio.Queue()
+            fetcher = BodyErrorFetcher(self.logger, queue, filePath, batchSize=2)
+            await fetcher.fetch(startTime, endTime)
+            return [record.date for record in await drain(queue)]
+
+        self.assertEqual(len(await fetchDates(datetime.min, datetime.max)), 21)
+        self.assertFalse(os.path.exists(getIndexPath(path)))
+
+        # the records within the range, the end exclusive, whatever the input kind
+        startTime = datetime(2023, 9, 3, 1, tzinfo=timezone(timedelta(hours=-11)))
+        endTime = datetime(2023, 9, 5, 1, tzinfo=timezone.utc)
+        expected = [f"2023-09-04T0{i}:00:00Z" for i in range(3)]
+        expected.append("2023-09-05T00:00:00Z")
+        self.assertEqual(await fetchDates(startTime, endTime), expected)
+        self.assertEqual(await fetchDates(startTime, endTime, gzPath), expected)
+        self.assertTrue(os.path.exists(getIndexPath(path)))
+        self.assertFalse(os.path.exists(getIndexPath(gzPath)))
+        self.assertEqual(
+            getInputFiles(os.path.join(self.tmpDir.name, "*")), [path, gzPath]
+        )
+
+        # the stale index is rebuilt once the file changes
+        with open(path, "a", newline="") as f:
+            csv.writer(f).writerow(["2023-09-04T23:00:00Z", "late", ""])
+        with self.assertLogs(self.logger) as logs:
+            dates = await fetchDates(datetime(2023, 9, 4, 2), datetime(2023, 9, 5))
+        self.assertEqual(dates, ["2023-09-04T02:00:00Z", "2023-09-04T23:00:00Z"])
+        self.assertIn("indexed 8 date runs", logs.output[0])
+
+    async def test_bounded_fetch_keeps_quoted_dates(self):
+        path = self.writeCsv(
+            "totals.csv",
+            [
+                ["time", "value"],
+                ["2023-08-31T23:00:00Z", "1"],
+                ['"2023-09-08"', "2"],
+                ["2023-09-09T12:00:00.000Z", "3"],
+                ["2023-10-01", "4"],
+            ],
+        )
+
+        async def fetchTotals(startTime: datetime, endTime: datetime) -> list[int]:
+            queue = asyncio.Queue()
+            fetcher = DailyTotalFetcher(self.logger, queue, path)
+            await fetcher.fetch(startTime, endTime)
+            return [record.total for record in await drain(queue)]
+
+        self.assertEqual(await fetchTotals(datetime.min, datetime.max), [1, 2, 3, 4])
+        self.assertEqual(
+            await fetchTotals(
+                datetime(2023, 9, 1, tzinfo=timezone.utc),
+                datetime(2023, 9, 30, tzinfo=timezone.utc),
+            ),
+            [2, 3],
+        )
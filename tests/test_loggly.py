@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Optional
+
+from aiohttp import web
+
+from bench.loggly_stub import LogglyStub
+from fetcher.fetcher import Fetcher
+from fetcher.loggly import LogglyFetcher
+from fetcher.loggly_cache import ResponseCache
+from fetcher.rate_limiter import TokenBucket
+
+START_TIME = datetime(2023, 9, 1, 12, tzinfo=timezone.utc)
+
+
+class FailingLogglyStub(LogglyStub):
+    """Stub answering 500 to every request of a window holding failTime."""
+
+    def __init__(self, failTime: datetime, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.failTime = failTime.timestamp()
+
+    async def iterate(self, request: web.Request) -> web.Response:
+        query = request.query
+        if "from" in query:
+            start = self._parseTime(query["from"])
+            end = self._parseTime(query["until"])
+            if start <= self.failTime < end:
+                self.requests += 1
+                return web.Response(status=500)
+        return await super().iterate(request)
+
+
+async def drain(queue: asyncio.Queue, delaySecs: float = 0) -> list[int]:
+    timestamps = []
+    while (batch := await queue.get()) is not None:
+        if delaySecs:
+            await asyncio.sleep(delaySecs)
+        timestamps.extend(event["timestamp"] for event in batch)
+    return timestamps
+
+
+class TestLogglyFetcher(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.stub = None
+
+    async def asyncTearDown(self) -> None:
+        await self.stub.stop()
+
+    async def startStub(self, stub: LogglyStub) -> None:
+        self.stub = stub
+        await stub.start()
+
+    def newFetcher(
+        self, resultQueue: asyncio.Queue, cache: Optional[ResponseCache] = None
+    ) -> LogglyFetcher:
+        fetcher = LogglyFetcher(
+            self.logger,
+            resultQueue,
+            self.stub.getBaseUri(),
+            "*",
+            "token",
+            "group",
+            cache=cache,
+            requestsPerSec=1000,
+        )
+        fetcher.RETRY_BASE_SECS = 0.01
+        return fetcher
+
+    def getExpected(self, startTime: datetime, endTime: datetime) -> list[int]:
+        times = self.stub.getEventTimes(startTime.timestamp(), endTime.timestamp())
+        return [int(t * 1000) for t in times]
+
+    async def test_page_chains_are_read_ahead_in_order(self):
+        await self.startStub(LogglyStub(eventsPerSec=2, latencySecs=0, messageBytes=10))
+        resultQueue = Fetcher.newQueue(maxSize=1)
+        fetcher = self.newFetcher(resultQueue)
+        fetcher.MAX_RECORD_SIZE = 50
+        fetcher.intervalSecs = 3600
+        fetcher.maxConcurrency = 1
+        endTime = START_TIME + timedelta(minutes=10)
+
+        # a slow consumer, the fetcher keeps requesting pages meanwhile
+        _, timestamps = await asyncio.gather(
+            fetcher.fetch(START_TIME, endTime), drain(resultQueue, 0.01)
+        )
+        expected = self.getExpected(START_TIME, endTime)
+        self.assertGreater(len(expected), 10 * fetcher.MAX_RECORD_SIZE)
+        self.assertEqual(timestamps, expected)
+        self.assertEqual(fetcher.failedRanges, [])
+
+    async def test_throttled_requests_are_retried(self):
+        await self.startStub(
+            LogglyStub(eventsPerSec=1, latencySecs=0, throttleRate=0.3, messageBytes=10)
+        )
+        resultQueue = Fetcher.newQueue()
+        fetcher = self.newFetcher(resultQueue)
+        fetcher.maxRetries = 10
+        retries = fetcher.retryCnt.value
+        endTime = START_TIME + timedelta(hours=2)
+
+        _, timestamps = await asyncio.gather(
+            fetcher.fetch(START_TIME, endTime), drain(resultQueue)
+        )
+        self.assertEqual(sorted(timestamps), self.getExpected(START_TIME, endTime))
+        self.assertEqual(fetcher.failedRanges, [])
+        self.assertGreater(self.stub.throttled, 0)
+        self.assertGreaterEqual(fetcher.retryCnt.value - retries, self.stub.throttled)
+
+    async def test_failed_window_does_not_stop_the_others(self):
+        failTime = START_TIME + timedelta(minutes=70)
+        await self.startStub(
+            FailingLogglyStub(failTime, eventsPerSec=0.2, latencySecs=0, messageBytes=10)
+        )
+        resultQueue = Fetcher.newQueue()
+        fetcher = self.newFetcher(resultQueue)
+        fetcher.intervalSecs = 600
+        failedWindows = fetcher.failedCnt.value
+        retries = fetcher.retryCnt.value
+        endTime = START_TIME + timedelta(hours=3)
+
+        _, timestamps = await asyncio.gather(
+            fetcher.fetch(START_TIME, endTime), drain(resultQueue)
+        )
+        self.assertEqual(len(fetcher.failedRanges), 1)
+        failStart, failEnd = fetcher.failedRanges[0]
+        self.assertTrue(failStart <= failTime < failEnd)
+        self.assertEqual(fetcher.failedCnt.value - failedWindows, 1)
+        # the failed window was retried maxRetries times before giving up
+        self.assertGreaterEqual(fetcher.retryCnt.value - retries, fetcher.maxRetries)
+        expected = [
+            t
+            for t in self.getExpected(START_TIME, endTime)
+            if not failStart.timestamp() * 1000 <= t < failEnd.timestamp() * 1000
+        ]
+        self.assertEqual(sorted(timestamps), expected)
+
+    async def test_repeated_fetch_plans_the_same_cached_windows(self):
+        await self.startStub(LogglyStub(eventsPerSec=0.05, latencySecs=0, messageBytes=10))
+        endTime = START_TIME + timedelta(days=1)
+        with tempfile.TemporaryDirectory() as cacheDir:
+            cache = ResponseCache(cacheDir)
+            requestCnts = []
+            for _ in range(3):
+                resultQueue = Fetcher.newQueue()
+                fetcher = self.newFetcher(resultQueue, cache)
+                # dense windows are split, with windows fetched concurrently
+                fetcher.MAX_RECORD_SIZE = 200
+                requests = self.stub.requests
+                _, timestamps = await asyncio.gather(
+                    fetcher.fetch(START_TIME, endTime), drain(resultQueue)
+                )
+                requestCnts.append(self.stub.requests - requests)
+                self.assertEqual(sorted(timestamps), self.getExpected(START_TIME, endTime))
+                self.assertEqual(fetcher.failedRanges, [])
+
+        self.assertGreater(fetcher.splitCnt.value, 0)
+        self.assertGreater(requestCnts[0], 0)
+        self.assertEqual(requestCnts[1:], [0, 0])
+
+
+class TestRateLimiting(unittest.IsolatedAsyncioTestCase):
+    async def test_token_bucket_limits_rate_and_pauses(self):
+        bucket = TokenBucket(ratePerSec=100, burst=5)
+        startTime = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        self.assertLess(time.monotonic() - startTime, 0.03)
+        # beyond the burst, requests are spaced at the sustained rate
+        for _ in range(10):
+            await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - startTime, 0.09)
+
+        bucket.pause(0.1)
+        pauseTime = time.monotonic()
+        await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - pauseTime, 0.09)
+
+    def test_retry_after_in_seconds_or_as_date(self):
+        fetcher = LogglyFetcher(
+            logging.getLogger(__name__), Fetcher.newQueue(), "", "*", "token", "group"
+        )
+
+        def getRetryAfterSecs(value):
+            headers = {"Retry-After": value} if value is not None else {}
+            return fetcher._getRetryAfterSecs(SimpleNamespace(headers=headers))
+
+        self.assertEqual(getRetryAfterSecs("2.5"), 2.5)
+        self.assertEqual(getRetryAfterSecs("-1"), 0.0)
+        self.assertEqual(getRetryAfterSecs("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        retryTime = datetime.now(timezone.utc) + timedelta(seconds=30)
+        secs = getRetryAfterSecs(retryTime.strftime("%a, %d %b %Y %H:%M:%S GMT"))
+        self.assertTrue(25 <= secs <= 30)
+        self.assertIsNone(getRetryAfterSecs("soon"))
+        self.assertIsNone(getRetryAfterSecs(None))
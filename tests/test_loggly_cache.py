@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import math
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+from bench.loggly_stub import LogglyStub
+from fetcher.fetcher import Fetcher
+from fetcher.loggly import LogglyFetcher
+from fetcher.loggly_cache import ResponseCache
+
+START_TIME = datetime(2023, 9, 1, 12, tzinfo=timezone.utc)
+END_TIME = START_TIME + timedelta(hours=3)
+WINDOW_SECS = 8 * 60  # a grid level, START_TIME is aligned to
+WINDOW_CNT = math.ceil((END_TIME - START_TIME).total_seconds() / WINDOW_SECS)
+
+
+class FailingLogglyStub(LogglyStub):
+    """Stub answering 500 to every request of a window holding failTime, if set."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.failTime = None
+
+    async def iterate(self, request: web.Request) -> web.Response:
+        query = request.query
+        if self.failTime is not None and "from" in query:
+            start = self._parseTime(query["from"])
+            if start <= self.failTime < self._parseTime(query["until"]):
+                self.requests += 1
+                return web.Response(status=500)
+        return await super().iterate(request)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmpDir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpDir.cleanup()
+        super().tearDown()
+
+    def test_roundtrip_and_reload(self):
+        cache = ResponseCache(self.tmpDir.name)
+        key = cache.getKey("q", "123", "2023-09-08T00:00:00.000Z", "2023-09-08T00:05:00.000Z")
+        pages = [[{"event": {"id": 1}}], [{"event": {"id": 2}}]]
+        self.assertIsNone(cache.get(key))
+        cache.put(key, pages)
+
+        reloaded = ResponseCache(self.tmpDir.name)
+        self.assertEqual(reloaded.get(key), pages)
+        self.assertEqual(reloaded.totalBytes, cache.totalBytes)
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(self.tmpDir.name)
+        pages = [[{"message": os.urandom(64).hex()}]]
+        cache.put("a", pages)
+        cache.put("b", pages)
+        cache.maxBytes = cache.totalBytes
+        cache.get("a")
+        cache.put("c", pages)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), pages)
+        self.assertEqual(cache.get("c"), pages)
+        self.assertEqual(len(os.listdir(self.tmpDir.name)), 2)
+
+
+class TestCachedLogglyFetch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.tmpDir.name)
+        self.stub = FailingLogglyStub(eventsPerSec=0.2, latencySecs=0, messageBytes=10)
+        await self.stub.start()
+        times = self.stub.getEventTimes(START_TIME.timestamp(), END_TIME.timestamp())
+        self.expected = [int(t * 1000) for t in times]
+
+    async def asyncTearDown(self) -> None:
+        await self.stub.stop()
+        self.tmpDir.cleanup()
+
+    async def fetch(
+        self, startTime: datetime = START_TIME, endTime: datetime = END_TIME
+    ) -> tuple[LogglyFetcher, list[int], int]:
+        """Fetch through the cache in WINDOW_SECS windows.
+
+        Returns:
+            tuple[LogglyFetcher, list[int], int]: The fetcher, the sorted event
+                timestamps and the number of requests made.
+        """
+        resultQueue = Fetcher.newQueue()
+        fetcher = LogglyFetcher(
+            self.logger,
+            resultQueue,
+            self.stub.getBaseUri(),
+            "*",
+            "token",
+            "group",
+            cache=self.cache,
+            requestsPerSec=1000,
+        )
+        fetcher.RETRY_BASE_SECS = 0.01
+        fetcher.intervalSecs = WINDOW_SECS
+        requests = self.stub.requests
+
+        async def drain() -> list[int]:
+            timestamps = []
+            while (batch := await resultQueue.get()) is not None:
+                timestamps.extend(event["timestamp"] for event in batch)
+            return sorted(timestamps)
+
+        _, timestamps = await asyncio.gather(fetcher.fetch(startTime, endTime), drain())
+        return fetcher, timestamps, self.stub.requests - requests
+
+    async def test_settled_windows_are_served_from_the_cache(self):
+        fetcher, timestamps, requests = await self.fetch()
+        self.assertEqual(timestamps, self.expected)
+        self.assertEqual(requests, WINDOW_CNT)
+        self.assertEqual(len(self.cache.entries), WINDOW_CNT)
+
+        hits = fetcher.cacheHitCnt.value
+        fetcher, timestamps, requests = await self.fetch()
+        self.assertEqual(timestamps, self.expected)
+        self.assertEqual(requests, 0)
+        self.assertEqual(fetcher.cacheHitCnt.value - hits, WINDOW_CNT)
+
+        # windows not yet settled in loggly are fetched every time
+        endTime = datetime.now(timezone.utc)
+        for _ in range(2):
+            _, _, requests = await self.fetch(endTime - timedelta(minutes=5), endTime)
+            self.assertGreater(requests, 0)
+        self.assertEqual(len(self.cache.entries), WINDOW_CNT)
+
+    async def test_failed_window_is_fetched_again(self):
+        self.stub.failTime = (START_TIME + timedelta(minutes=70)).timestamp()
+        fetcher, timestamps, _ = await self.fetch()
+        self.assertEqual(len(fetcher.failedRanges), 1)
+        self.assertLess(len(timestamps), len(self.expected))
+        self.assertEqual(len(self.cache.entries), WINDOW_CNT - 1)
+
+        # only the failed window is missing from the cache
+        self.stub.failTime = None
+        fetcher, timestamps, requests = await self.fetch()
+        self.assertEqual(fetcher.failedRanges, [])
+        self.assertEqual(timestamps, self.expected)
+        self.assertEqual(requests, 1)
+        _, _, requests = await self.fetch()
+        self.assertEqual(requests, 0)
+
+    async def test_windows_evicted_during_a_fetch_are_fetched_again(self):
+        self.cache.maxBytes = 1
+        _, timestamps, _ = await self.fetch()
+        self.assertEqual(timestamps, self.expected)
+        self.assertEqual(len(self.cache.entries), 1)
+        self.assertEqual(len(os.listdir(self.tmpDir.name)), 1)
+
+        _, timestamps, requests = await self.fetch()
+        self.assertEqual(timestamps, self.expected)
+        # the window left may itself be evicted by the earlier windows put meanwhile
+        self.assertGreaterEqual(requests, WINDOW_CNT - 1)
@@ -0,0 +1,88 @@
+import csv
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from main import expandVars, getTimeRange, runJob
+
+
+class TestMain(unittest.IsolatedAsyncioTestCase):
+    def test_time_range(self):
+        self.assertEqual(getTimeRange({}), (datetime.min, datetime.max))
+        startTime, endTime = getTimeRange(
+            {"end": "2023-09-08T12:00:00", "days": 1, "hours": 2, "timezone": "US/Pacific"}
+        )
+        self.assertEqual(endTime.utcoffset(), timedelta(hours=-7))
+        self.assertEqual(endTime - startTime, timedelta(days=1, hours=2))
+        # times default to utc, comparable with the aware times of fetchers
+        startTime, endTime = getTimeRange({"start": "2023-09-08", "hours": 2})
+        self.assertEqual(startTime, datetime(2023, 9, 8, tzinfo=timezone.utc))
+        self.assertEqual(getTimeRange({"days": 1})[1].utcoffset(), timedelta(0))
+        with mock.patch.dict(os.environ, {"TEST_MAIN_DIR": "/data"}):
+            self.assertEqual(
+                expandVars({"paths": ["${TEST_MAIN_DIR}/a.csv", 3]}),
+                {"paths": ["/data/a.csv", 3]},
+            )
+        self.assertNotIn("TEST_MAIN_DIR", os.environ)
+
+    async def test_runs_csv_job(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            def path(name: str) -> str:
+                return os.path.join(tmpDir, name)
+
+            with open(path("totals.csv"), "w", newline="") as f:
+                csv.writer(f).writerows([["time", "value"], ["2023-09-08", "4"]])
+            with open(path("errors.csv"), "w", newline="") as f:
+                csv.writer(f).writerows(
+                    [["Date", "@Body.Attributes.metadata.error", "@Body.message"]]
+                    + [["2023-09-08T01:00:00Z", f"timeout {i}: x", ""] for i in range(3)]
+                )
+            await runJob(
+                {
+                    "sources": [
+                        {"type": "dailyTotalsCsv", "filePath": path("totals.csv")},
+                        {"type": "bodyErrorCsv", "filePath": path("errors.csv")},
+                    ],
+                    "analyzer": {
+                        "type": "bodyError",
+                        "csvErrorsOutputFile": path("out.csv"),
+                        "csvErrDateCntsOutputFile": path("daily.csv"),
+                        "csvErrDatePercentageOutputFile": path("percent.csv"),
+                        "masks": ["number"],
+                    },
+                    "outputs": {"metricsFile": path("metrics.json")},
+                }
+            )
+            with open(path("percent.csv")) as f:
+                self.assertEqual(f.read().splitlines()[1], "timeout <num>,0.75")
+            self.assertTrue(os.path.exists(path("metrics.json")))
+
+    async def test_journaled_job_analyzes_in_workers(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            def path(name: str) -> str:
+                return os.path.join(tmpDir, name)
+
+            with open(path("errors.csv"), "w", newline="") as f:
+                csv.writer(f).writerows(
+                    [["Date", "@Body.Attributes.metadata.error", "@Body.message"]]
+                    + [[f"2023-09-0{d}T01:00:00Z", "timeout: x", ""] for d in range(1, 6)]
+                )
+            await runJob(
+                {
+                    "sources": [{"type": "bodyErrorCsv", "filePath": path("errors.csv")}],
+                    "analyzer": {
+                        "type": "bodyError",
+                        "csvErrorsOutputFile": path("out.csv"),
+                        "csvErrDateCntsOutputFile": path("daily.csv"),
+                        "csvErrDatePercentageOutputFile": path("percent.csv"),
+                    },
+                    "timeRange": {"start": "2023-09-02", "end": "2023-09-05"},
+                    "concurrency": {"analyzeWorkers": 1},
+                    "journalDir": path("journal"),
+                }
+            )
+            with open(path("out.csv")) as f:
+                self.assertEqual(f.read().splitlines()[1], "timeout,3")
+            self.assertEqual(len(os.listdir(path("journal"))), 3)
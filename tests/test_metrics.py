@@ -0,0 +1,39 @@
+import logging
+import unittest
+
+from utils.logging_config import ThrottledLogger
+from utils.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+    def test_prometheus_text(self):
+        metrics = MetricsRegistry()
+        latency = metrics.histogram("request_seconds", "Request latency", (0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            latency.observe(value)
+        metrics.counter("requests_total").inc(4)
+        self.assertIs(metrics.counter("requests_total").value, 4)
+
+        text = metrics.getPrometheusText()
+        self.assertIn('request_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('request_seconds_bucket{le="1"} 3\n', text)
+        self.assertIn('request_seconds_bucket{le="+Inf"} 4\n', text)
+        self.assertIn("request_seconds_count 4\n", text)
+        self.assertIn("# TYPE requests_total counter\nrequests_total 4\n", text)
+        self.assertEqual(metrics.getSnapshot()["request_seconds"]["buckets"]["+Inf"], 1)
+
+    def test_throttled_logger(self):
+        logger = logging.getLogger(__name__)
+        throttled = ThrottledLogger(logger, intervalSecs=3600)
+        with self.assertLogs(logger, logging.INFO) as logs:
+            for i in range(100):
+                throttled.info("record %d", i)
+            throttled.lastTime = float("-inf")
+            throttled.info("record %d", 100)
+        self.assertEqual(
+            logs.output,
+            [
+                f"INFO:{__name__}:record 0",
+                f"INFO:{__name__}:record 100 (99 similar messages suppressed)",
+            ],
+        )
@@ -0,0 +1,105 @@
+import logging
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from analyzer.body_error import BodyErrorAnalyzer
+from analyzer.session import SessionAnalyzer
+from fetcher.body_error import BodyError
+from fetcher.daily_totals import DailyTotal
+from store.rollup import RollupStore, getBucket
+
+START_TIME = datetime(2023, 9, 8, tzinfo=timezone.utc)
+
+
+class TestRollupStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.logger = logging.getLogger(__name__)
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.store = RollupStore(os.path.join(self.tmpDir.name, "rollups.db"))
+
+    def tearDown(self) -> None:
+        self.store.close()
+        self.tmpDir.cleanup()
+        super().tearDown()
+
+    def test_buckets(self):
+        time = datetime(2023, 9, 8, 10, 53, 44, tzinfo=timezone(timedelta(hours=-7)))
+        self.assertEqual(getBucket(time, "minute"), "2023-09-08T17:53")
+        self.assertEqual(getBucket(time, "hour"), "2023-09-08T17")
+        self.assertEqual(getBucket(time, "day"), "2023-09-08")
+        self.assertEqual(getBucket(datetime.min, "day"), "0001-01-01")
+        with self.assertRaises(Exception):
+            getBucket(time, "week")
+
+    async def test_body_error_daily_counts(self):
+        analyzer = BodyErrorAnalyzer(self.logger, "", "", "")
+        batch = [DailyTotal("2023-09-08", 10), DailyTotal("2023-09-09", 20)]
+        for day in range(8, 11):
+            for i in range(day):
+                error = "timeout: 30s" if i % 2 else "bad input"
+                batch.append(BodyError(f"2023-09-{day:02}T01:00:00Z", "", error))
+        await analyzer.analyzeBatch(batch)
+        analyzer.writeRollups(self.store)
+
+        endTime = START_TIME + timedelta(days=2)
+        self.assertEqual(
+            self.store.getCounts("BodyErrorAnalyzer", "error", "day", START_TIME, endTime),
+            {
+                "bad input": {"2023-09-08": 4, "2023-09-09": 5},
+                "timeout": {"2023-09-08": 4, "2023-09-09": 4},
+            },
+        )
+        self.assertEqual(
+            self.store.getTotals(
+                "BodyErrorAnalyzer", "error", "day", START_TIME, endTime + timedelta(hours=1)
+            ),
+            {"bad input": 14, "timeout": 13},
+        )
+
+        # rewriting a day replaces its counts
+        analyzer = BodyErrorAnalyzer(self.logger, "", "", "")
+        await analyzer.analyzeBatch([BodyError("2023-09-08T05:00:00Z", "crash", "")])
+        analyzer.writeRollups(self.store)
+        self.assertEqual(
+            self.store.getTotals(
+                "BodyErrorAnalyzer", "error", "day", START_TIME, START_TIME + timedelta(days=1)
+            ),
+            {"crash": 1},
+        )
+        self.assertEqual(
+            self.store.getTotals("BodyErrorAnalyzer", "submitted", "day", START_TIME, endTime),
+            {"": 30},
+        )
+        with self.assertRaises(Exception):
+            BodyErrorAnalyzer(self.logger, "", "", "", rollupGranularity="hour")
+
+    async def test_session_hourly_distinct_sids(self):
+        analyzer = SessionAnalyzer(self.logger, rollupGranularity="hour")
+        partial = analyzer.newPartial()
+        self.assertEqual(len(analyzer.getFieldPaths()), 4)
+        for hour in range(48):
+            timestamp = int((START_TIME + timedelta(hours=hour)).timestamp() * 1000)
+            batch = [(f"sid{hour // 24}-{i}", "channel", True, timestamp) for i in range(50)]
+            batch.append((None, "{PSID}", True, timestamp))
+            batch.append((None, None, False, timestamp))
+            await (partial if hour % 2 else analyzer).analyzeBatch(batch)
+        analyzer.mergeState(partial.getState())
+        analyzer.writeRollups(self.store)
+
+        self.assertEqual(len(analyzer.sids), 101)
+        day = START_TIME + timedelta(days=1)
+        distinct = self.store.getDistinctCount(
+            "SessionAnalyzer", "All sid", "hour", START_TIME, day
+        )
+        self.assertAlmostEqual(distinct, 50, delta=2)
+        distinct = self.store.getDistinctCount(
+            "SessionAnalyzer", "deviceId=channel", "hour", START_TIME, day + timedelta(days=1)
+        )
+        self.assertAlmostEqual(distinct, 100, delta=3)
+        totals = self.store.getTotals("SessionAnalyzer", "events", "hour", START_TIME, day)
+        self.assertEqual(
+            totals, {"All sid": 24 * 51, "deviceId=channel": 24 * 50, "deviceId=PSID": 24}
+        )
@@ -0,0 +1,91 @@
+import logging
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from analyzer.session import SessionAnalyzer
+from fetcher.sampling import StratifiedSampler
+from fetcher.window_planner import WindowPlanner
+
+START_TIME = datetime(2023, 9, 4, tzinfo=timezone.utc)
+END_TIME = START_TIME + timedelta(days=28)
+
+
+class TestStratifiedSampler(unittest.IsolatedAsyncioTestCase):
+    def test_samples_strata_proportionally(self):
+        sampler = StratifiedSampler(START_TIME, END_TIME, 0.25, seed=5)
+        self.assertEqual(sampler.slotCnt, 28 * 24)
+        self.assertEqual(len(sampler.sampledSlots), 7 * 24)
+        # every weekday and hour stratum of 4 slots gets one
+        strata = Counter(
+            sampler._getStratum(slot) for slot in sampler.sampledSlots
+        )
+        self.assertEqual(set(strata.values()), {1})
+        self.assertEqual(
+            StratifiedSampler(START_TIME, END_TIME, 0.25, seed=5).sampledSlots,
+            sampler.sampledSlots,
+        )
+
+        # ranges are clipped to the fetched range
+        startTime = START_TIME + timedelta(days=3, minutes=30)
+        endTime = startTime + timedelta(days=7)
+        ranges = sampler.getRanges(startTime, endTime)
+        self.assertGreaterEqual(ranges[0][0], startTime)
+        self.assertLessEqual(ranges[-1][1], endTime)
+        sampledTime = timedelta()
+        for slot in sampler.sampledSlots:
+            slotStart = sampler.getSlotStart(slot)
+            slotEnd = slotStart + timedelta(hours=1)
+            sampledTime += max(min(slotEnd, endTime) - max(slotStart, startTime), timedelta())
+        rangesTime = sum((end - start for start, end in ranges), timedelta())
+        self.assertEqual(rangesTime, sampledTime)
+
+        planner = WindowPlanner(START_TIME, END_TIME, 1000, 300, ranges)
+        windows = []
+        while window := planner.next():
+            windows.append(window)
+        self.assertEqual(sum((w.end - w.start for w in windows), timedelta()), rangesTime)
+        for window in windows:
+            self.assertTrue(any(s <= window.start < window.end <= e for s, e in ranges))
+
+    def test_partly_covered_slots_weigh_by_coverage(self):
+        # a range starting and ending mid slot, at 60 events per hour throughout
+        startTime = START_TIME + timedelta(minutes=30)
+        endTime = startTime + timedelta(hours=50)
+        for seed in range(5):
+            sampler = StratifiedSampler(startTime, endTime, 0.2, seed=seed)
+            self.assertEqual(sampler.slotCnt, 51)
+            firstSlot = sampler.getSlot(startTime.timestamp() * 1000)
+            self.assertEqual(sampler.getCoverage(firstSlot), 0.5)
+            slotValues = {
+                slot: 60 * sampler.getCoverage(slot) for slot in sampler.sampledSlots
+            }
+            total, halfWidth = sampler.estimate(slotValues)
+            self.assertAlmostEqual(total, 3000)
+            self.assertAlmostEqual(halfWidth, 0)
+
+    async def test_session_estimates_cover_totals(self):
+        sampler = StratifiedSampler(START_TIME, END_TIME, 0.1, seed=1)
+        analyzer = SessionAnalyzer(logging.getLogger(__name__), sampler=sampler)
+        partial = analyzer.newPartial()
+        self.assertEqual(len(analyzer.getFieldPaths()), 4)
+        totalSessions = 0
+        sampledSlots = set(sampler.sampledSlots)
+        for hour in range(28 * 24):
+            slotStart = START_TIME + timedelta(hours=hour)
+            sessions = 200 if 9 <= slotStart.hour < 18 else 40
+            totalSessions += sessions
+            timestamp = int(slotStart.timestamp() * 1000)
+            if sampler.getSlot(timestamp) not in sampledSlots:
+                continue
+            batch = [(f"{hour}-{i % sessions}", "channel", True, timestamp) for i in range(3 * sessions)]
+            await (partial if hour % 2 else analyzer).analyzeBatch(batch)
+        analyzer.mergeState(partial.getState())
+
+        estimates = analyzer.getEstimates()
+        estimate, halfWidth = estimates["deviceId=channel"]["sessions"]
+        self.assertLess(abs(estimate - totalSessions), max(halfWidth, 1))
+        self.assertLess(halfWidth, totalSessions * 0.2)
+        self.assertAlmostEqual(estimates["All sid"]["events"][0], 3 * estimate, delta=1)
+        self.assertEqual(estimates["deviceId=PSID"]["sessions"], [0, 0])
+        self.assertEqual(estimates["sampled slots"], [67, 672])
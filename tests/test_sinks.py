@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from analyzer.body_error import BodyErrorAnalyzer
+from fetcher.body_error import BodyError
+from fetcher.daily_totals import DailyTotal
+from utils.sinks import CsvSink, JsonlSink, SqliteSink, getSink
+
+
+class TestSinks(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.logger = logging.getLogger(__name__)
+        self.tmpDir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpDir.cleanup()
+        super().tearDown()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmpDir.name, name)
+
+    def test_sink_by_extension(self):
+        self.assertIsInstance(getSink("a.csv"), CsvSink)
+        self.assertIsInstance(getSink("a.JSONL"), JsonlSink)
+        self.assertIsInstance(getSink("a.txt"), CsvSink)
+        sink = getSink(self.path("daily.db"))
+        self.assertIsInstance(sink, SqliteSink)
+        # rows are consumed lazily, in batches
+        rows = ([str(i), i or ""] for i in range(2500))
+        self.assertEqual(sink.write(["name", 'count "x"'], rows), 2500)
+        self.assertEqual(sink.write(["name"], iter([["a"]])), 1)
+        with sqlite3.connect(sink.path) as db:
+            self.assertEqual(db.execute("SELECT * FROM daily").fetchall(), [("a",)])
+
+    async def test_body_error_outputs(self):
+        analyzer = BodyErrorAnalyzer(
+            self.logger, self.path("errors.jsonl"), self.path("daily.db"), self.path("percent.csv")
+        )
+        await analyzer.analyzeBatch(
+            [
+                DailyTotal("2023-09-08", 4),
+                BodyError("2023-09-08T01:00:00Z", "timeout: 30s", ""),
+                BodyError("2023-09-09T01:00:00Z", "timeout: 30s", ""),
+                BodyError("2023-09-09T02:00:00Z", "", "bad input"),
+            ]
+        )
+        analyzer.dumpResult()
+
+        with open(self.path("errors.jsonl")) as f:
+            self.assertEqual(
+                [json.loads(line) for line in f],
+                [{"error": "timeout", "count": 2}, {"error": "bad input", "count": 1}],
+            )
+        with sqlite3.connect(self.path("daily.db")) as db:
+            self.assertEqual(
+                db.execute("SELECT * FROM daily").fetchall(),
+                [("timeout", 1, 1), ("bad input", None, 1)],
+            )
+        with open(self.path("percent.csv")) as f:
+            self.assertEqual(
+                f.read().splitlines(),
+                [
+                    "error type/datetime,2023-09-08,2023-09-09",
+                    "timeout,0.25,0",
+                    "bad input,,0",
+                ],
+            )
@@ -0,0 +1,119 @@
+import logging
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from analyzer.body_error import BodyErrorAnalyzer
+from analyzer.session import SessionAnalyzer
+from fetcher.body_error import BodyError
+from fetcher.daily_totals import DailyTotal
+from utils.spill import SpillingCounter
+
+
+class TestSpillingCounter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.logger = logging.getLogger(__name__)
+        self.tmpDir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpDir.cleanup()
+        super().tearDown()
+
+    def test_spilled_counts_are_merged(self):
+        rand = random.Random(3)
+        keys = [str(rand.randrange(500)) for _ in range(5000)] + ["", "a\tb\n"]
+        expected = {}
+        counter = SpillingCounter(
+            SpillingCounter.ENTRY_BYTES * 50, self.tmpDir.name, partitions=4
+        )
+        for key in keys:
+            expected[key] = expected.get(key, 0) + 1
+            counter.add(key)
+        self.assertGreater(counter.runCnt, 1)
+        self.assertLessEqual(len(counter.counts), 50)
+        self.assertEqual(counter, expected)
+        self.assertEqual(len(counter), len(expected))
+        self.assertEqual(counter["a\tb\n"], 1)
+        self.assertEqual(counter.get("missing", 0), 0)
+
+        runDir = counter.runDir
+        self.assertTrue(os.listdir(runDir))
+        del counter
+        self.assertFalse(os.path.exists(runDir))
+
+    async def test_spilling_session_analyzer_matches_in_memory(self):
+        deviceIds = ("{PSID}", "channel", None)
+        batch = [(str(i % 700), deviceIds[i % 3], True) for i in range(3000)]
+        # distinct top sid counts, ties are ordered by first occurrence
+        batch += [("9", None, True)] * 3 + [("8", None, True)] * 2 + [("7", None, True)]
+        analyzer = SessionAnalyzer(self.logger, topK=3)
+        spillingAnalyzer = SessionAnalyzer(
+            self.logger,
+            topK=3,
+            spillBytes=SpillingCounter.ENTRY_BYTES * 100,
+            spillDir=self.tmpDir.name,
+        )
+        for i in range(0, len(batch), 250):
+            await analyzer.analyzeBatch(batch[i : i + 250])
+            await spillingAnalyzer.analyzeBatch(batch[i : i + 250])
+
+        self.assertGreater(spillingAnalyzer.sids.runCnt, 0)
+        self.assertEqual(spillingAnalyzer.getState(), analyzer.getState())
+        with self.assertLogs(self.logger) as spilledLogs:
+            spillingAnalyzer.dumpResult()
+        with self.assertLogs(self.logger) as logs:
+            analyzer.dumpResult()
+        self.assertEqual(spilledLogs.output[-1], logs.output[-1])
+
+    async def test_spilling_body_error_analyzer_matches_in_memory(self):
+        rand = random.Random(5)
+        batch = [DailyTotal(f"2023-09-{day:02}", 100) for day in range(1, 31)]
+        for i in range(4000):
+            day = rand.randrange(1, 31)
+            # skewed error counts, so errors rank by count with few ties
+            error = f"err{int(rand.paretovariate(1.2)) % 300}: detail {i}"
+            batch.append(BodyError(f"2023-09-{day:02}T01:00:00Z", error, ""))
+
+        def newAnalyzer(name: str, **kwargs) -> BodyErrorAnalyzer:
+            outputFiles = [
+                os.path.join(self.tmpDir.name, f"{name}_{output}.csv")
+                for output in ("errors", "daily", "percent")
+            ]
+            return BodyErrorAnalyzer(self.logger, *outputFiles, **kwargs)
+
+        analyzer = newAnalyzer("memory")
+        spillingAnalyzer = newAnalyzer(
+            "spilled",
+            spillBytes=SpillingCounter.ENTRY_BYTES * 100,
+            spillDir=self.tmpDir.name,
+        )
+        for i in range(0, len(batch), 250):
+            await analyzer.analyzeBatch(batch[i : i + 250])
+            await spillingAnalyzer.analyzeBatch(batch[i : i + 250])
+
+        self.assertGreater(spillingAnalyzer.spilledCounts.runCnt, 1)
+        self.assertEqual(len(spillingAnalyzer.counts), 0)
+        self.assertEqual(spillingAnalyzer.getState(), analyzer.getState())
+        # spilled counts are regrouped once for both daily tables, and flushed so
+        # their concurrent writers only stream runs
+        rankedCounts = []
+
+        def rankCounts(errorIds):
+            rankedCounts.append(BodyErrorAnalyzer._rankCounts(spillingAnalyzer, errorIds))
+            return rankedCounts[-1]
+
+        with self.assertLogs(self.logger), mock.patch.object(
+            spillingAnalyzer, "_rankCounts", rankCounts
+        ):
+            spillingAnalyzer.dumpResult()
+            analyzer.dumpResult()
+        self.assertEqual(len(rankedCounts), 1)
+        self.assertEqual(rankedCounts[0].counts, {})
+        for output in ("errors", "daily", "percent"):
+            with open(os.path.join(self.tmpDir.name, f"spilled_{output}.csv")) as f:
+                spilled = f.read()
+            with open(os.path.join(self.tmpDir.name, f"memory_{output}.csv")) as f:
+                self.assertEqual(spilled, f.read())
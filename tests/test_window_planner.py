@@ -0,0 +1,69 @@
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from fetcher.window_planner import WindowPlanner
+
+
+class TestWindowPlanner(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.startTime = datetime(2023, 9, 8, 0, 2, 30, tzinfo=timezone.utc)
+        self.endTime = self.startTime + timedelta(days=1)
+
+    def drain(
+        self, planner: WindowPlanner, eventsPerSec: float, seed: int = 0
+    ) -> list:
+        # windows are taken a few at a time and completed in random order, as by
+        # concurrent fetches
+        rand = random.Random(seed)
+        windows = []
+        inFlight = []
+        while (window := planner.next()) or inFlight:
+            if window:
+                inFlight.append(window)
+                if len(inFlight) < 4 and planner.hasPending():
+                    continue
+            window = inFlight.pop(rand.randrange(len(inFlight)))
+            secs = (window.end - window.start).total_seconds()
+            eventCount = int(secs * eventsPerSec)
+            pageSecs = planner.targetEvents / eventsPerSec
+            if eventCount <= planner.targetEvents or not planner.split(window, pageSecs):
+                windows.append(window)
+        return windows
+
+    def assertCovers(self, windows: list) -> None:
+        windows = sorted(windows, key=lambda w: w.start)
+        self.assertEqual(windows[0].start, self.startTime)
+        self.assertEqual(windows[-1].end, self.endTime)
+        for prev, cur in zip(windows, windows[1:]):
+            self.assertEqual(prev.end, cur.start)
+
+    def test_sparse_windows_are_not_split(self):
+        planner = WindowPlanner(self.startTime, self.endTime, 1000)
+        windows = self.drain(planner, eventsPerSec=0.01)
+
+        self.assertCovers(windows)
+        self.assertLess(len(windows), 24 * 60 / 5 / 10)
+        self.assertTrue(all(w.level == WindowPlanner.MAX_LEVEL for w in windows))
+        for window in sorted(windows, key=lambda w: w.start)[:-1]:
+            self.assertEqual(window.end.timestamp() % WindowPlanner.MAX_SECS, 0)
+
+    def test_dense_windows_split_the_same_in_any_order(self):
+        planner = WindowPlanner(self.startTime, self.endTime, 1000, 60 * 60)
+        windows = self.drain(planner, eventsPerSec=5)
+
+        self.assertCovers(windows)
+        # a page spans 200 seconds, so dense windows split into 2 minute windows
+        for window in windows:
+            secs = (window.end - window.start).total_seconds()
+            self.assertTrue(window.level == 1 or secs * 5 <= 1000)
+        bounds = sorted((w.start, w.end) for w in windows)
+        for seed in range(1, 4):
+            planner = WindowPlanner(self.startTime, self.endTime, 1000, 60 * 60)
+            otherWindows = self.drain(planner, eventsPerSec=5, seed=seed)
+            self.assertEqual(sorted((w.start, w.end) for w in otherWindows), bounds)
+        for window in windows:
+            size = WindowPlanner.MIN_INTERVAL_SECS * 2**window.level
+            cell = window.start.timestamp() // size
+            self.assertEqual(cell, (window.end.timestamp() - 1) // size)
@@ -1,12 +1,50 @@
 import logging
+import time
 
 
 class LoggerConfig:
     @staticmethod
-    def setUpBasicLogging():
+    def setUpBasicLogging(level: int = logging.INFO):
         # logging.basicConfig(filename='example.log', encoding='utf-8', level=logging.DEBUG)
         logging.basicConfig(
-            level=logging.INFO,
+            level=level,
             format="%(asctime)s %(levelname)-8s %(message)s",
             datefmt="%Y-%m-%d %H:%M:%S",
         )
+
+
+class ThrottledLogger:
+    def __init__(self, logger: logging.Logger, intervalSecs: float = 10.0) -> None:
+        """Log at most one message per intervalSecs, for use in hot loops.
+
+        Messages use lazy %-style arguments, so nothing is formatted for messages
+        that are dropped or below the logger's level.
+
+        Args:
+            logger (logging.Logger): Logger to write to.
+            intervalSecs (float, optional): Min seconds between messages. Defaults to 10.
+        """
+        self.logger = logger
+        self.intervalSecs = intervalSecs
+        self.lastTime = float("-inf")
+        self.suppressed = 0
+
+    def log(self, level: int, msg: str, *args) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now - self.lastTime < self.intervalSecs:
+            self.suppressed += 1
+            return
+        if self.suppressed:
+            msg += " (%d similar messages suppressed)"
+            args = args + (self.suppressed,)
+        self.lastTime = now
+        self.suppressed = 0
+        self.logger.log(level, msg, *args)
+
+    def debug(self, msg: str, *args) -> None:
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg: str, *args) -> None:
+        self.log(logging.INFO, msg, *args)
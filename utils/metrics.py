@@ -0,0 +1,142 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Any, Sequence
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Counter:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float]) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # observations per bucket, the last one for values above all buckets
+        self.bucketCounts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.bucketCounts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        """Named pipeline metrics, exported as json or prometheus textfile snapshots.
+        """
+        self.metrics = {}
+        self.startTime = time.time()
+        self.lock = threading.Lock()
+
+    def _getMetric(self, metricType: type, name: str, *args: Any) -> Any:
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.setdefault(name, metricType(name, *args))
+        return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._getMetric(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._getMetric(Gauge, name, help)
+
+    def histogram(
+        self, name: str, help: str = "", buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._getMetric(Histogram, name, help, buckets)
+
+    def getSnapshot(self) -> dict[str, Any]:
+        """Get the current value of every metric.
+
+        Returns:
+            dict[str, Any]: Metric values by name, histograms as dicts.
+        """
+        snapshot = {"uptime_seconds": round(time.time() - self.startTime, 3)}
+        for name, metric in sorted(self.metrics.items()):
+            if isinstance(metric, Histogram):
+                snapshot[name] = {
+                    "count": metric.count,
+                    "sum": metric.sum,
+                    "buckets": dict(
+                        zip([str(b) for b in metric.buckets] + ["+Inf"], metric.bucketCounts)
+                    ),
+                }
+            else:
+                snapshot[name] = metric.value
+        return snapshot
+
+    def getPrometheusText(self) -> str:
+        """Get the metrics in prometheus text exposition format.
+        """
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            if isinstance(metric, Histogram):
+                lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                bounds = [str(b) for b in metric.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, metric.bucketCounts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum {metric.sum}")
+                lines.append(f"{name}_count {metric.count}")
+            else:
+                metricType = "counter" if isinstance(metric, Counter) else "gauge"
+                lines.append(f"# TYPE {name} {metricType}")
+                lines.append(f"{name} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write a snapshot atomically, in prometheus textfile format if path ends
+        with .prom, as json otherwise.
+
+        Args:
+            path (str): Output file.
+        """
+        if path.endswith(".prom"):
+            content = self.getPrometheusText()
+        else:
+            content = json.dumps(self.getSnapshot(), indent=2)
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "w") as f:
+            f.write(content)
+        os.replace(tmpPath, path)
+
+    async def writePeriodically(self, path: str, intervalSecs: float) -> None:
+        """Write a snapshot every intervalSecs until cancelled.
+        """
+        while True:
+            await asyncio.sleep(intervalSecs)
+            await asyncio.to_thread(self.write, path)
+
+
+# default registry shared by all pipeline stages, like the logging module's loggers
+METRICS = MetricsRegistry()
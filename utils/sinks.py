@@ -0,0 +1,133 @@
+import abc
+import csv
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, Sequence
+
+
+class RowSink:
+    def __init__(self, path: str) -> None:
+        """Destination of a table of rows, written as they are produced.
+
+        Args:
+            path (str): Output file.
+        """
+        self.path = path
+
+    @abc.abstractclassmethod
+    def write(self, fieldNames: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+        """Write a header and stream rows, replacing any earlier output.
+
+        Args:
+            fieldNames (Sequence[str]): Column names.
+            rows (Iterable[Sequence[Any]]): Rows of values in column order, "" for a
+                blank cell.
+
+        Returns:
+            int: Number of rows written.
+        """
+        pass
+
+
+class CsvSink(RowSink):
+    def write(self, fieldNames: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+        rowCnt = 0
+        with open(self.path, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(fieldNames)
+            for row in rows:
+                writer.writerow(row)
+                rowCnt += 1
+        return rowCnt
+
+
+class JsonlSink(RowSink):
+    def write(self, fieldNames: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+        """Write each row as a json object per line, leaving out blank cells.
+        """
+        rowCnt = 0
+        with open(self.path, "w") as f:
+            for row in rows:
+                record = {n: v for n, v in zip(fieldNames, row) if v != ""}
+                f.write(json.dumps(record))
+                f.write("\n")
+                rowCnt += 1
+        return rowCnt
+
+
+class SqliteSink(RowSink):
+    BATCH_SIZE = 1000  # rows inserted per executemany
+
+    def __init__(self, path: str, table: str = "") -> None:
+        """Write rows to a table of a SQLite database, blank cells as NULL.
+
+        Args:
+            table (str, optional): Table name, replaced on write. Defaults to the
+                file name without extension.
+        """
+        super().__init__(path)
+        self.table = table or os.path.splitext(os.path.basename(path))[0]
+
+    def write(self, fieldNames: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+        def quote(name: str) -> str:
+            return '"' + name.replace('"', '""') + '"'
+
+        table = quote(self.table)
+        insert = (
+            f"INSERT INTO {table} VALUES ({', '.join('?' * len(fieldNames))})"
+        )
+        rowCnt = 0
+        db = sqlite3.connect(self.path)
+        try:
+            with db:
+                db.execute(f"DROP TABLE IF EXISTS {table}")
+                db.execute(
+                    f"CREATE TABLE {table} ({', '.join(map(quote, fieldNames))})"
+                )
+                batch = []
+                for row in rows:
+                    batch.append([None if v == "" else v for v in row])
+                    if len(batch) >= self.BATCH_SIZE:
+                        db.executemany(insert, batch)
+                        rowCnt += len(batch)
+                        batch = []
+                db.executemany(insert, batch)
+                rowCnt += len(batch)
+        finally:
+            db.close()
+        return rowCnt
+
+
+# sink class by output file extension
+SINKS: dict[str, type[RowSink]] = {
+    ".csv": CsvSink,
+    ".jsonl": JsonlSink,
+    ".ndjson": JsonlSink,
+    ".db": SqliteSink,
+    ".sqlite": SqliteSink,
+}
+
+
+def getSink(path: str) -> RowSink:
+    """Get the sink for an output file by its extension, csv if unknown.
+    """
+    return SINKS.get(os.path.splitext(path)[1].lower(), CsvSink)(path)
+
+
+def writeAll(
+    tables: list[tuple[RowSink, Sequence[str], Iterable[Sequence[Any]]]]
+) -> list[int]:
+    """Write several tables concurrently, each in its own thread.
+
+    Args:
+        tables (list[tuple[RowSink, Sequence[str], Iterable[Sequence[Any]]]]): Sink,
+            field names and rows of each table.
+
+    Returns:
+        list[int]: Number of rows written per table.
+    """
+    with ThreadPoolExecutor(max_workers=len(tables) or 1) as pool:
+        futures = [pool.submit(sink.write, *table) for sink, *table in tables]
+        return [future.result() for future in futures]
@@ -0,0 +1,134 @@
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import weakref
+import zlib
+from collections.abc import Mapping
+from operator import itemgetter
+from typing import Iterator, Optional
+
+
+class SpillingCounter(Mapping):
+    ENTRY_BYTES = 160  # estimated memory of a counted key, dict slot and objects
+    PARTITIONS = 16  # run files per spill, keys partitioned by crc32
+
+    def __init__(
+        self, maxBytes: int = 0, spillDir: Optional[str] = None, partitions: int = PARTITIONS
+    ) -> None:
+        """Count per key in a dict, spilled to disk past a memory budget.
+
+        Keys are counted into counts, with checkBudget called every now and then.
+        Once counts holds more than maxBytes, estimated at ENTRY_BYTES per key, its
+        keys are written as a sorted run per hash partition and counts is cleared.
+        Reading the counter merges the runs with counts partition by partition, so
+        only one partition of each run is read at a time.
+
+        Args:
+            maxBytes (int, optional): Memory budget of counts. Defaults to 0, never
+                spilling.
+            spillDir (Optional[str], optional): Directory of the run files, removed
+                when the counter is. Defaults to the system temporary directory.
+            partitions (int, optional): Number of hash partitions. Defaults to 16.
+        """
+        self.maxKeys = maxBytes // self.ENTRY_BYTES if maxBytes else 0
+        self.spillDir = spillDir
+        self.partitions = partitions
+        # in memory counts since the last spill
+        self.counts = {}
+        self.runCnt = 0
+        self.runDir = None
+
+    def add(self, key: str, cnt: int = 1) -> None:
+        counts = self.counts
+        counts[key] = counts.get(key, 0) + cnt
+        if self.maxKeys and len(counts) > self.maxKeys:
+            self._spill()
+
+    def checkBudget(self) -> None:
+        """Spill counts if past the memory budget, after counting into it directly.
+        """
+        if self.maxKeys and len(self.counts) > self.maxKeys:
+            self._spill()
+
+    def flush(self) -> None:
+        """Spill whatever counts holds, so reading the counter only streams runs and
+        several readers at once take no memory for counts.
+        """
+        if self.counts:
+            self._spill()
+
+    def _getPartition(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % self.partitions
+
+    def _getRunPath(self, run: int, partition: int) -> str:
+        return os.path.join(self.runDir, f"{run}.{partition}.jsonl")
+
+    def _spill(self) -> None:
+        if self.runDir is None:
+            self.runDir = tempfile.mkdtemp(prefix="spill-", dir=self.spillDir)
+            weakref.finalize(self, shutil.rmtree, self.runDir, ignore_errors=True)
+        partitions = [[] for _ in range(self.partitions)]
+        for item in self.counts.items():
+            partitions[self._getPartition(item[0])].append(item)
+        for partition, items in enumerate(partitions):
+            items.sort(key=itemgetter(0))
+            with open(self._getRunPath(self.runCnt, partition), "w") as f:
+                for item in items:
+                    f.write(json.dumps(item))
+                    f.write("\n")
+        self.runCnt += 1
+        self.counts.clear()
+
+    def _iterRun(self, run: int, partition: int) -> Iterator[tuple[str, int]]:
+        with open(self._getRunPath(run, partition)) as f:
+            for line in f:
+                yield tuple(json.loads(line))
+
+    def items(self) -> Iterator[tuple[str, int]]:
+        """Iterate over the merged counts, once spilled in key order within each
+        partition, else in insertion order.
+        """
+        if not self.runCnt:
+            yield from self.counts.items()
+            return
+        partitions = [[] for _ in range(self.partitions)]
+        for item in self.counts.items():
+            partitions[self._getPartition(item[0])].append(item)
+        for partition, items in enumerate(partitions):
+            items.sort(key=itemgetter(0))
+            runs = [self._iterRun(run, partition) for run in range(self.runCnt)]
+            lastKey, total = None, 0
+            for key, cnt in heapq.merge(items, *runs, key=itemgetter(0)):
+                if key != lastKey:
+                    if lastKey is not None:
+                        yield lastKey, total
+                    lastKey, total = key, 0
+                total += cnt
+            if lastKey is not None:
+                yield lastKey, total
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key, _ in self.items())
+
+    def __len__(self) -> int:
+        if not self.runCnt:
+            return len(self.counts)
+        return sum(1 for _ in self.items())
+
+    def __getitem__(self, key: str) -> int:
+        total = self.counts.get(key, 0)
+        found = key in self.counts
+        partition = self._getPartition(key)
+        for run in range(self.runCnt):
+            for runKey, cnt in self._iterRun(run, partition):
+                if runKey == key:
+                    total += cnt
+                    found = True
+                    break
+                if runKey > key:
+                    break
+        if not found:
+            raise KeyError(key)
+        return total